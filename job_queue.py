@@ -0,0 +1,241 @@
+""" Job queue for running paper_data_analysis.py on several processes or hosts.
+
+    The queue is a SQLite database in a directory shared by all workers (SQLite relies on the file locks of the file
+    system, so the shared file system must support POSIX locks; local disks and most cluster file systems do, some NFS
+    setups do not). Every process that runs the analysis with JOB_QUEUE set submits the jobs of its parameter block
+    (submitting is idempotent: a job already in the queue is left alone) and then pulls jobs until none are left:
+        - a worker leases a job for `lease_seconds` and renews the lease by heartbeats from a background thread while
+          the job runs; if the worker dies, its lease expires and the job is handed to the next worker that asks,
+        - a job that raised, or whose lease expired, is retried up to `max_attempts` times in total, and then marked
+          as failed (so a job that keeps crashing its worker is not leased forever),
+        - completing a job whose lease was taken over in the meantime is ignored, so each job is completed once,
+        - a job submitted with dependencies is only leased once all of them are done, and fails if one of them fails.
+    Results are the artifacts the analysis writes; since those are written atomically (see `atomic_write`), a job that
+    runs twice leaves the same files as one that runs once.
+
+    Progress of a queue is printed by
+        python job_queue.py <queue file> [<seconds between reports>]
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+
+
+def atomic_write(path, write):
+    """Calls `write(temporary path)` and then renames the temporary file to `path`, so that readers (and concurrent
+    writers of the same result) only ever see complete files."""
+    temporary = f"{path}.{socket.gethostname()}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        write(temporary)
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+class JobQueue:
+    """SQLite-backed queue of jobs, each a JSON-serializable payload under a unique name."""
+
+    def __init__(self, path, lease_seconds=300, max_attempts=3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        with self._connect() as connection:
+            connection.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                                      name TEXT PRIMARY KEY,
+                                      payload TEXT NOT NULL,
+                                      status TEXT NOT NULL DEFAULT 'pending',  -- pending, leased, done or failed
+                                      worker TEXT,
+                                      lease_until REAL,
+                                      attempts INTEGER NOT NULL DEFAULT 0,
+                                      seconds REAL,
+                                      error TEXT,
+                                      submitted REAL NOT NULL,
+                                      updated REAL NOT NULL)""")
+            connection.execute("""CREATE TABLE IF NOT EXISTS dependencies (
+                                      job TEXT NOT NULL,
+                                      depends_on TEXT NOT NULL,
+                                      PRIMARY KEY (job, depends_on))""")
+
+    def _connect(self):
+        # every call opens its own connection, so that the heartbeat thread and the worker never share one
+        connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        connection.execute("PRAGMA busy_timeout = 60000")
+        return _Transaction(connection)
+
+    def submit(self, jobs, dependencies=None):
+        """Adds the jobs {name: payload} that are not in the queue yet, where job name waits for the jobs
+        `dependencies`[name] (which must be submitted with it or be in the queue already). Returns the number of jobs
+        added."""
+        now = time.time()
+        dependencies = dependencies or {}
+        with self._connect() as connection:
+            known = set(jobs) | {name for name, in connection.execute("SELECT name FROM jobs")}
+            missing = {dependency for names in dependencies.values() for dependency in names} - known
+            if len(missing) > 0:
+                raise ValueError(f"Dependencies {sorted(missing)} are not in the queue.")
+            before = connection.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+            connection.executemany("INSERT OR IGNORE INTO jobs (name, payload, submitted, updated) VALUES (?, ?, ?, ?)",
+                                   [(name, json.dumps(payload), now, now) for name, payload in jobs.items()])
+            connection.executemany("INSERT OR IGNORE INTO dependencies (job, depends_on) VALUES (?, ?)",
+                                   [(name, dependency) for name, names in dependencies.items() for dependency in names])
+            return connection.execute("SELECT COUNT(*) FROM jobs").fetchone()[0] - before
+
+    def _fail_exhausted(self, connection, now):
+        """Marks the jobs whose lease expired on their last attempt as failed, and then the pending jobs that (directly
+        or indirectly) depend on a failed job."""
+        connection.execute("""UPDATE jobs SET status = 'failed', lease_until = NULL, updated = ?,
+                              error = 'lease of ' || worker || ' expired on attempt ' || attempts
+                              WHERE status = 'leased' AND lease_until < ? AND attempts >= ?""",
+                           (now, now, self.max_attempts))
+        while connection.execute("""UPDATE jobs SET status = 'failed', updated = ?, error = 'a dependency failed'
+                                    WHERE status = 'pending' AND name IN (
+                                        SELECT dependencies.job FROM dependencies
+                                        JOIN jobs AS dependency ON dependency.name = dependencies.depends_on
+                                        WHERE dependency.status = 'failed')""", (now,)).rowcount > 0:
+            pass
+
+    def lease(self, worker):
+        """Leases the oldest job that is pending or whose lease expired (with attempts left), and whose dependencies are
+        all done, to `worker`. Returns (name, payload), or None if no job is available right now."""
+        now = time.time()
+        with self._connect() as connection:
+            self._fail_exhausted(connection, now)
+            row = connection.execute("""SELECT name, payload FROM jobs
+                                        WHERE (status = 'pending'
+                                               OR (status = 'leased' AND lease_until < ? AND attempts < ?))
+                                          AND NOT EXISTS (
+                                              SELECT 1 FROM dependencies
+                                              JOIN jobs AS dependency ON dependency.name = dependencies.depends_on
+                                              WHERE dependencies.job = jobs.name AND dependency.status != 'done')
+                                        ORDER BY submitted, name LIMIT 1""", (now, self.max_attempts)).fetchone()
+            if row is None:
+                return None
+            connection.execute("""UPDATE jobs SET status = 'leased', worker = ?, lease_until = ?,
+                                  attempts = attempts + 1, updated = ? WHERE name = ?""",
+                               (worker, now + self.lease_seconds, now, row[0]))
+            return row[0], json.loads(row[1])
+
+    def heartbeat(self, name, worker):
+        """Renews the lease of `worker` on job `name`. Returns False if the worker lost the lease."""
+        now = time.time()
+        with self._connect() as connection:
+            return connection.execute("""UPDATE jobs SET lease_until = ?, updated = ?
+                                         WHERE name = ? AND worker = ? AND status = 'leased'""",
+                                      (now + self.lease_seconds, now, name, worker)).rowcount == 1
+
+    def complete(self, name, worker, seconds):
+        """Marks job `name` as done, unless `worker` lost the lease. Returns whether it did."""
+        with self._connect() as connection:
+            return connection.execute("""UPDATE jobs SET status = 'done', lease_until = NULL, seconds = ?, updated = ?
+                                         WHERE name = ? AND worker = ? AND status = 'leased'""",
+                                      (seconds, time.time(), name, worker)).rowcount == 1
+
+    def fail(self, name, worker, error):
+        """Returns job `name` to the queue after `worker` failed on it, or marks it failed after `max_attempts`."""
+        with self._connect() as connection:
+            connection.execute("""UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                                  lease_until = NULL, error = ?, updated = ?
+                                  WHERE name = ? AND worker = ? AND status = 'leased'""",
+                               (self.max_attempts, error, time.time(), name, worker))
+
+    def seconds(self):
+        """Running time of every completed job, {name: seconds}."""
+        with self._connect() as connection:
+            return dict(connection.execute("SELECT name, seconds FROM jobs WHERE status = 'done' ORDER BY name"))
+
+    def progress(self):
+        """Number of jobs per status, and the rows of the jobs currently leased."""
+        with self._connect() as connection:
+            self._fail_exhausted(connection, time.time())
+            counts = dict(connection.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            leased = connection.execute("""SELECT name, worker, lease_until, attempts FROM jobs
+                                           WHERE status = 'leased' ORDER BY name""").fetchall()
+        return {status: counts.get(status, 0) for status in ('pending', 'leased', 'done', 'failed')}, leased
+
+    def finished(self):
+        counts, _ = self.progress()
+        return counts['pending'] == 0 and counts['leased'] == 0
+
+
+class _Transaction:
+    """Context manager around a connection in autocommit mode that runs the block as one write transaction (BEGIN
+    IMMEDIATE takes the write lock up front, so two workers cannot lease the same job) and closes the connection."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.connection.execute("COMMIT" if exc_type is None else "ROLLBACK")
+        finally:
+            self.connection.close()
+
+
+def run_worker(queue, run_job, worker=None, poll_seconds=5):
+    """Pulls jobs from `queue` and runs `run_job(payload)` on each, renewing the lease every third of the lease time,
+    until the queue has no pending or leased jobs left. Returns the names of the jobs this worker completed."""
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    completed = []
+    while True:
+        job = queue.lease(worker)
+        if job is None:
+            if queue.finished():
+                return completed
+            time.sleep(poll_seconds)  # other workers hold the remaining jobs; take them over if their leases expire
+            continue
+        name, payload = job
+        print(f"{worker} runs job {name}.")
+
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(queue.lease_seconds / 3):
+                if not queue.heartbeat(name, worker):
+                    print(f"{worker} lost the lease on job {name}.")
+                    return
+
+        heartbeats = threading.Thread(target=beat, daemon=True)
+        heartbeats.start()
+        start = time.time()
+        try:
+            run_job(payload)
+        except Exception as e:
+            stop.set()
+            queue.fail(name, worker, repr(e))
+            print(f"{worker} failed on job {name}: {e!r}")
+            continue
+        finally:
+            stop.set()
+            heartbeats.join()
+        if queue.complete(name, worker, time.time() - start):
+            completed.append(name)
+        counts, _ = queue.progress()
+        print(f"{worker} completed job {name}; queue: {counts}.")
+
+
+def report_progress(queue, interval_seconds=30):
+    """Coordinator: prints the state of `queue` every `interval_seconds` until all jobs are done or failed."""
+    while True:
+        counts, leased = queue.progress()
+        total = sum(counts.values())
+        print(f"{time.strftime('%H:%M:%S')} {counts['done']}/{total} jobs done, {counts['leased']} running, "
+              f"{counts['pending']} pending, {counts['failed']} failed.")
+        for name, worker, lease_until, attempts in leased:
+            print(f"    {name} on {worker} (attempt {attempts}, lease expires in {lease_until - time.time():.0f}s)")
+        if counts['pending'] == 0 and counts['leased'] == 0:
+            return counts
+        time.sleep(interval_seconds)
+
+
+if __name__ == '__main__':
+    report_progress(JobQueue(sys.argv[1]), float(sys.argv[2]) if len(sys.argv) > 2 else 30)
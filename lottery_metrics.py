@@ -0,0 +1,160 @@
+""" Lottery metrics shared by paper_data_analysis.py and paper_data_visualization.py.
+
+    All functions work on a batch of lotteries at once: panel probabilities are given as a panels × lotteries matrix
+    (or a single vector), and marginals as an agents × lotteries matrix (or a single vector). Metrics of the artifacts
+    written by the analysis (..._marginals.csv) are memoized by the hash of the files they are computed from, in
+    memory (for the most recent _CACHE_SIZE artifacts) and in a ..._marginals.csv.metrics.npz file next to the
+    artifact, so that the plotting script reuses what the analysis already computed. The metrics of many replicates
+    (e.g. the randomized roundings) are memoized as one batch in a single file.
+"""
+
+import hashlib
+import math
+
+import numpy as np
+import pandas as pd
+
+from job_queue import atomic_write
+
+
+
+def lottery_marginals(incidence, lotteries):
+    """Marginals of every agent under each lottery: one sparse product of the agent × panel incidence matrix with the
+    panel × lottery probability matrix."""
+    return np.asarray(incidence @ np.asarray(lotteries, dtype=float))
+
+
+def marginals_metrics(marginals, opt_marginals=None, covered=None):
+    """Metrics of one or more vectors of marginals (agents × lotteries), over the agents in `covered` (default: all):
+        maximin: smallest marginal
+        nash_welfare: geometric mean of the marginals (log_nash_welfare: sum of their logarithms)
+        leximin_profile: marginals sorted increasingly
+        max_abs_deviation, mean_abs_deviation: largest and mean |marginal - OPT marginal| (only with `opt_marginals`)
+    For a single vector of marginals, every metric is a scalar (or a vector for the profile).
+    """
+    marginals = np.asarray(marginals, dtype=float)
+    single = marginals.ndim == 1
+    marginals = marginals.reshape(len(marginals), -1)
+    selected = marginals if covered is None else marginals[np.asarray(list(covered), dtype=int)]
+    with np.errstate(divide='ignore'):
+        log_marginals = np.log(selected)
+    metrics = {'maximin': selected.min(axis=0),
+               'log_nash_welfare': log_marginals.sum(axis=0),
+               'nash_welfare': np.exp(log_marginals.mean(axis=0)),
+               'leximin_profile': np.sort(marginals, axis=0)}
+    if opt_marginals is not None:
+        deviation = np.abs(marginals - np.asarray(opt_marginals, dtype=float).reshape(-1, 1))
+        metrics['max_abs_deviation'] = deviation.max(axis=0)
+        metrics['mean_abs_deviation'] = deviation.mean(axis=0)
+    if single:
+        metrics = {name: value[..., 0] if value.ndim > 1 else value[0] for name, value in metrics.items()}
+    return metrics
+
+
+def lottery_metrics(incidence, lotteries, opt_marginals=None, covered=None):
+    """`marginals_metrics` of lotteries given as panel probabilities, plus their marginals."""
+    marginals = lottery_marginals(incidence, lotteries)
+    metrics = marginals_metrics(marginals, opt_marginals, covered)
+    metrics['marginals'] = marginals
+    return metrics
+
+
+def sort_by_reference(marginals, reference):
+    """Marginals (agents, or agents × lotteries) in the order of the agents sorted by their `reference` marginals, e.g.
+    the OPT ones; ties are broken by the marginals themselves."""
+    marginals = np.asarray(marginals, dtype=float)
+    reference = np.asarray(reference, dtype=float)
+    if marginals.ndim == 1:
+        return marginals[np.lexsort((marginals, reference))]
+    return np.column_stack([column[np.lexsort((column, reference))] for column in marginals.T])
+
+
+def compute_theoretical_bounds_indloss(k,M,n,C):
+    """ Computes two potentially best theoretical upper bounds on change in any marginal in terms of instance parameters
+    """
+    bounds = {}
+    bounds['bf'] = k/M
+    bounds['panelLP'] = math.sqrt((1 + math.log(2)/math.log(C))/2)*math.sqrt(C * math.log(C))/M + 1/M
+    return bounds
+
+
+def theoretical_bounds(k, M, n, C, opt_marginals):
+    """Guarantees for rounding the OPT lottery with marginals `opt_marginals` to an M-uniform one, as used in the plots:
+    the tightest bound on the change of any marginal (indloss), and the resulting lower bounds on maximin and Nash
+    welfare (geometric mean)."""
+    bounds = compute_theoretical_bounds_indloss(k, M, n, C)
+    indloss = min(bounds['bf'], bounds['panelLP'])
+    opt = marginals_metrics(opt_marginals)
+    return dict(bounds, indloss=indloss, maximin=opt['maximin'] - indloss, nash_welfare=opt['nash_welfare'] - k * indloss)
+
+
+_CACHE_SIZE = 64
+_cache = {}
+
+
+def _remember(key, metrics):
+    """Keeps `metrics` in the in-memory cache, dropping the oldest entries beyond _CACHE_SIZE."""
+    _cache[key] = metrics
+    while len(_cache) > _CACHE_SIZE:
+        del _cache[next(iter(_cache))]
+    return metrics
+
+
+def file_hash(*paths):
+    """SHA-1 of the contents of the files `paths`, in order."""
+    digest = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _save_metrics(cache_path, key, metrics):
+    """Writes `metrics` and the hash `key` of the files they were computed from to `cache_path`, atomically."""
+    def write(temporary):
+        with open(temporary, 'wb') as f:
+            np.savez(f, hash=key, **metrics)
+    atomic_write(cache_path, write)
+
+
+def artifact_metrics(marginals_path, opt_marginals_path=None):
+    """`marginals_metrics` of the marginals saved in `marginals_path` (relative to those in `opt_marginals_path`, if
+    given), memoized by the hash of both files."""
+    paths = [marginals_path] + ([opt_marginals_path] if opt_marginals_path is not None else [])
+    key = file_hash(*paths)
+    if key in _cache:
+        return _cache[key]
+
+    cache_path = marginals_path + ('.opt' if opt_marginals_path is not None else '') + '.metrics.npz'
+    try:
+        with np.load(cache_path) as cached:
+            if str(cached['hash']) == key:
+                return _remember(key, {name: cached[name] for name in cached.files if name != 'hash'})
+    except (OSError, KeyError):
+        pass
+
+    marginals = pd.read_csv(marginals_path)['marginals'].values
+    opt_marginals = pd.read_csv(opt_marginals_path)['marginals'].values if opt_marginals_path is not None else None
+    metrics = marginals_metrics(marginals, opt_marginals)
+    _save_metrics(cache_path, key, metrics)
+    return _remember(key, metrics)
+
+
+def replicate_metrics(marginals_paths, cache_path):
+    """`marginals_metrics` of the replicates saved in `marginals_paths`, as one batch: every metric is a vector with one
+    entry per replicate (their leximin profiles are not kept). Memoized by the hash of all files, in `cache_path`."""
+    key = file_hash(*marginals_paths)
+    if key in _cache:
+        return _cache[key]
+    try:
+        with np.load(cache_path) as cached:
+            if str(cached['hash']) == key:
+                return _remember(key, {name: cached[name] for name in cached.files if name != 'hash'})
+    except (OSError, KeyError):
+        pass
+
+    marginals = np.column_stack([pd.read_csv(path)['marginals'].values for path in marginals_paths])
+    metrics = marginals_metrics(marginals)
+    del metrics['leximin_profile']
+    _save_metrics(cache_path, key, metrics)
+    return _remember(key, metrics)
@@ -0,0 +1,177 @@
+""" Drawing panels from the lotteries computed by paper_data_analysis.py, and auditing them.
+
+    A lottery is read either from a ..._lottery.npz file (an M-uniform lottery, see `UniformLottery.save`: panel j is
+    drawn with probability counts[j] / M) or from a ..._probabilities.csv file (any distribution over panels). Panels are
+    drawn through an alias table (Vose's method), so that each draw takes O(1) time whatever the size of the support:
+        - for M-uniform lotteries the table is built from the integer counts and compared against integer tickets, so
+          that panels are drawn with probability exactly counts[j] / M, without floating-point rounding,
+        - a single verifiable draw derives all of its randomness from the SHA-256 hash of a public seed (e.g. a
+          published lottery number or randomness beacon), so that anyone holding the lottery file and the seed can
+          recompute the panel; for an M-uniform lottery the draw is simply ticket SHA-256(seed) mod M, counted through
+          the panels in the order of the file,
+        - batched draws of millions of panels are vectorized and run in batches of bounded memory.
+    The audit draws many panels and compares the empirical frequency with which each agent is selected against the
+    marginals the lottery claims, counting all draws at once with one sparse product.
+
+    Usage:
+        python panel_sampler.py draw <lottery file> <public seed>
+        python panel_sampler.py audit <lottery file> <marginals csv> [<draws> [<public seed>]]
+"""
+
+import hashlib
+import sys
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+
+def _alias_table(scaled, capacity):
+    """Alias table of Vose's method from the weights `scaled`, which are scaled such that they average `capacity`.
+    Column j keeps itself if a uniform number in [0, capacity) is below threshold[j] and its alias otherwise. With
+    integer weights and capacity all arithmetic is exact."""
+    scaled = scaled.copy()
+    threshold = np.full(len(scaled), capacity, dtype=scaled.dtype)
+    alias = np.arange(len(scaled))
+    small = list(np.flatnonzero(scaled < capacity))
+    large = list(np.flatnonzero(scaled >= capacity))
+    while len(small) > 0 and len(large) > 0:
+        less, more = small.pop(), large.pop()
+        threshold[less] = scaled[less]
+        alias[less] = more
+        scaled[more] -= capacity - scaled[less]
+        (small if scaled[more] < capacity else large).append(more)
+    # what is left over is full up to floating-point error
+    return threshold, alias
+
+
+def _hash_integer(public_seed, label):
+    """The 256-bit integer SHA-256(`public_seed` + `label`), the only source of randomness of a verifiable draw."""
+    return int.from_bytes(hashlib.sha256((str(public_seed) + label).encode('utf-8')).digest(), 'big')
+
+
+def _panel_matrix(committees, n=None):
+    """Sparse panel × agent incidence matrix of `committees`."""
+    sizes = [len(committee) for committee in committees]
+    members = np.fromiter((id for committee in committees for id in committee), dtype=np.int64, count=sum(sizes))
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    n = n if n is not None else (int(members.max()) + 1 if len(members) > 0 else 0)
+    return sp.csr_matrix((np.ones(len(members), dtype=np.int64), members, offsets), shape=(len(committees), n))
+
+
+class PanelSampler:
+    """Sampler for the lottery over `committees` with panel probabilities `probabilities`, or, with `M`, for the
+    M-uniform lottery with integer panel `counts` summing to M (passed as `probabilities`)."""
+
+    def __init__(self, committees, probabilities, M=None):
+        self.committees = committees
+        self.M = None if M is None else int(M)
+        if self.M is None:
+            # clip and renormalize, since the LP solvers return probabilities that are off by small amounts
+            self.probabilities = np.asarray(probabilities, dtype=float).clip(0, None)
+            self.probabilities = self.probabilities / self.probabilities.sum()
+            self.threshold, self.alias = _alias_table(self.probabilities * len(committees), 1.)
+        else:
+            self.counts = np.asarray(probabilities, dtype=np.int64)
+            if self.counts.min() < 0 or self.counts.sum() != self.M:
+                raise ValueError(f"Panel counts must be non-negative and sum to M = {self.M}.")
+            self.probabilities = self.counts / self.M
+            self.threshold, self.alias = _alias_table(self.counts * len(committees), self.M)
+
+    @classmethod
+    def load(cls, path):
+        """Sampler for the lottery saved in `path`, a ..._lottery.npz or ..._probabilities.csv file."""
+        if path.endswith('.npz'):
+            with np.load(path) as saved:
+                members, offsets = saved['members'], saved['offsets']
+                committees = [members[offsets[j]:offsets[j + 1]].tolist() for j in range(len(offsets) - 1)]
+                return cls(committees, saved['counts'], int(saved['M']))
+        results_df = pd.read_csv(path)
+        committees = [[int(id) for id in committee[committee.index('{') + 1:committee.rindex('}')].split(',')]
+                      if '{' in committee else [int(id) for id in committee.strip('[]').split(',')]
+                      for committee in results_df['committees'].values]
+        return cls(committees, results_df['probabilities'].values)
+
+    def draw(self, size, rng=None, batch_size=1 << 20):
+        """Indices of `size` panels drawn independently, in batches of `batch_size`."""
+        rng = rng if rng is not None else np.random.default_rng()
+        draws = np.empty(size, dtype=np.int64)
+        for start in range(0, size, batch_size):
+            batch = draws[start:start + batch_size]
+            columns = rng.integers(len(self.committees), size=len(batch))
+            uniforms = rng.integers(self.M, size=len(batch)) if self.M is not None else rng.random(len(batch))
+            batch[:] = np.where(uniforms < self.threshold[columns], columns, self.alias[columns])
+        return draws
+
+    def draw_counts(self, size, rng=None, batch_size=1 << 20):
+        """Number of times each panel is drawn in `size` independent draws, without keeping the draws in memory."""
+        counts = np.zeros(len(self.committees), dtype=np.int64)
+        for start in range(0, size, batch_size):
+            counts += np.bincount(self.draw(min(batch_size, size - start), rng, batch_size),
+                                  minlength=len(self.committees))
+        return counts
+
+    def draw_verifiable(self, public_seed):
+        """The panel drawn with the randomness SHA-256(`public_seed`). Returns its index and a record of how it was
+        drawn, from which anyone holding the lottery file can check the draw."""
+        value = _hash_integer(public_seed, '')
+        if self.M is not None:
+            ticket = value % self.M
+            panel = int(np.searchsorted(np.cumsum(self.counts), ticket, side='right'))
+            record = {'public_seed': str(public_seed), 'sha256': f"{value:064x}", 'ticket': ticket, 'M': self.M}
+        else:
+            # the low bits of the hash pick the column of the alias table, the next 53 bits the uniform in [0, 1)
+            column = value % len(self.committees)
+            uniform = ((value // len(self.committees)) % (1 << 53)) / (1 << 53)
+            panel = column if uniform < self.threshold[column] else int(self.alias[column])
+            record = {'public_seed': str(public_seed), 'sha256': f"{value:064x}", 'column': column, 'uniform': uniform}
+        record.update(panel=panel, members=sorted(self.committees[panel]))
+        return panel, record
+
+    def audit(self, marginals, draws=10 ** 6, rng=None):
+        """Compares how often each agent is selected in `draws` independent draws with the `marginals` (indexed by
+        agent id) that the lottery claims. Returns a data frame with one row per agent (expected and empirical
+        frequency, their difference, and its z-score under the binomial distribution) and a dict of summary
+        statistics, including the largest deviation of the lottery's own marginals from the claimed ones."""
+        from scipy.stats import chi2
+
+        marginals = np.asarray(marginals, dtype=float)
+        panel_matrix = _panel_matrix(self.committees, len(marginals))
+        panel_counts = self.draw_counts(draws, rng)
+        frequencies = (panel_matrix.T @ panel_counts) / draws
+        standard_deviations = np.sqrt(marginals * (1 - marginals) / draws)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z_scores = np.where(standard_deviations > 0, (frequencies - marginals) / standard_deviations,
+                                np.where(frequencies == marginals, 0., np.inf))
+        audit_df = pd.DataFrame({'marginals': marginals, 'frequencies': frequencies,
+                                 'deviation': frequencies - marginals, 'z_score': z_scores})
+
+        expected = self.probabilities * draws
+        support = expected > 0
+        statistic = (((panel_counts[support] - expected[support]) ** 2) / expected[support]).sum()
+        summary = {'draws': draws,
+                   'lottery_marginals_max_deviation': np.abs(panel_matrix.T @ self.probabilities - marginals).max(),
+                   'max_abs_deviation': np.abs(frequencies - marginals).max(),
+                   'max_abs_z_score': np.abs(z_scores).max(),
+                   'agents_beyond_4_sigma': int((np.abs(z_scores) > 4).sum()),
+                   'panels_chi2': statistic,
+                   'panels_chi2_p_value': chi2.sf(statistic, support.sum() - 1) if support.sum() > 1 else 1.,
+                   'panels_drawn_outside_support': int(panel_counts[~support].sum())}
+        return audit_df, summary
+
+
+if __name__ == '__main__':
+    sampler = PanelSampler.load(sys.argv[2])
+    if sys.argv[1] == 'draw':
+        panel, record = sampler.draw_verifiable(sys.argv[3])
+        for key, value in record.items():
+            print(f"{key}: {value}")
+    elif sys.argv[1] == 'audit':
+        draws = int(sys.argv[4]) if len(sys.argv) > 4 else 10 ** 6
+        rng = np.random.default_rng(_hash_integer(sys.argv[5], 'audit')) if len(sys.argv) > 5 else None
+        audit_df, summary = sampler.audit(pd.read_csv(sys.argv[3])['marginals'].values, draws, rng)
+        audit_df.to_csv(sys.argv[2] + '.audit.csv')
+        for key, value in summary.items():
+            print(f"{key}: {value}")
+    else:
+        sys.exit(__doc__)
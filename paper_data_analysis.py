@@ -1,32 +1,46 @@
-from typing import List, FrozenSet, Dict
+from typing import List, FrozenSet, Dict, Set
 
 import pandas as pd
 import numpy as np 
-import mip
-import cvxpy as cp
 import os
 import random
-import pyomo.environ as pyo
-from pyomo.opt import *
-from pyomo.environ import *
 import math
-import gurobipy as grb
-from time import time
-
-os.system("export GUROBI_HOME=\"/Library/gurobi911/mac64\"")
-
-np.random.seed(1)
-random.seed(1)
+import re
+import scipy.sparse as sp
+from scipy.linalg.blas import dger
+from time import time, sleep
+import multiprocessing
+import threading
+from queue import Queue, Empty
+
+from job_queue import JobQueue, atomic_write, run_worker
+from lottery_metrics import (artifact_metrics, compute_theoretical_bounds_indloss, lottery_marginals, lottery_metrics,
+                             marginals_metrics, replicate_metrics)
+
+# The solver stacks (mip/CBC, gurobipy, cvxpy, pyomo, scipy's LP solver) are imported inside the functions that use
+# them, so that importing this module, e.g. in a worker process that only rounds, loads none of them. Importing it has
+# no other side effects either: the analysis only runs when the script is executed (see MAIN below).
 
 # # # # # # # # # # # # # # PARAMETERS # # # # # # # # # # # # # # # # #
 
 # number of panels desired in the lottery
 M = 1000
 
+# lottery sizes to sweep over: round the OPT lottery (computed once, for the file names under M) to each of these M and
+# write one table with the scores of every rounding method and the theoretical bounds per M, e.g. [100, 1000, 10000]
+M_SWEEP = []
+
 # which instances to analyze
 instances = ['sf_a_35', 'sf_b_20', 'sf_c_44', 'sf_d_40', 'sf_e_110', 'cca_75', 'hd_30', 'mass_24','nexus_170','obf_30','newd_40']
 
 
+# panel sizes to evaluate the pool at: if not empty, the instance is parsed once and each objective is solved (and
+# rounded) for every size k in the list, with the quotas scaled from those of the instance or set per size in
+# PANEL_SIZE_QUOTAS, e.g. {20: {('gender', 'female'): (10, 10)}}; file names get a k<size>_ suffix
+PANEL_SIZES = []
+PANEL_SIZE_QUOTAS = {}
+
+
 # which objective you want to optimize
 LEXIMIN = 0
 MAXIMIN = 1
@@ -38,8 +52,15 @@ OPT = 0                      # computes unconstrained optimal distribution - nee
 ILP = 1                      # computes both optimal unconstrained and near-optimal unconstrained, wrt to fairness notion specified below
 BECK_FIALA = 0               # computes uniform rounded from OPT via beck-fiala (must run OPT first)
 RANDOMIZED = 0               # computes uniform rounded from OPT via randomized rounding (must run OPT first) 
+DISCREPANCY_WALK = 0         # computes uniform rounded from OPT via a Gaussian discrepancy walk, without LPs (must run OPT first)
 RANDOMIZED_REPLICATES = 1000 # runs randomized a bunch of times -> report avg and stdev of loss
 ILP_MINIMIAX_CHANGE = 0      # takes input distribution specified by fairness objectives and computes minimum change in anyone's probability
+DROPOUTS = []                # ids of respondents who dropped out after OPT: re-solve OPT without them, warm-started from the surviving panels, and round that instead (must run OPT first)
+BEST_OF_R = 0                # draws BEST_OF_R_REPLICATES pipage roundings at once and keeps the best under the objective (must run OPT first)
+BEST_OF_R_REPLICATES = 100000
+ROUNDING_PORTFOLIO = 0       # runs the rounding methods concurrently within PORTFOLIO_BUDGET and keeps the best lottery under the objective (must run OPT first)
+QUOTA_EDITS = {}             # {(feature, value): (min, max)}: re-solve OPT with these quotas, warm-started from the panels that still satisfy them, and round that instead (must run OPT first)
+LEXIMIN_SEED = None          # 'maximin' or 'nash': leximin OPT starts from that objective's OPT panels instead of discovering its own, and with 'maximin' fixes its first level from the maximin duals (must run that OPT first)
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
@@ -49,6 +70,48 @@ EPS = 0.0005
 EPS_NASH = 1
 EPS2 = 0.00000001
 
+# dual stabilization of the column generation master problems, per objective: None, 'wentges' or 'boxstep'
+DUAL_STABILIZATION = {'maximin': None, 'leximin': None}
+STABILIZATION_ALPHA = 0.5    # Wentges smoothing: weight of the stability center in the pricing point
+STABILIZATION_BOX = 0.05     # box-step: initial half-width of the box around the stability center
+
+# master problem of the maximin column generation: 'lp' (Gurobi LP, then a CBC LP for the final lottery) or
+# 'first_order' (entropic mirror-prox in NumPy, needs no LP solver and returns lottery and dual weights together),
+# solved by the latter to an absolute duality gap of FIRST_ORDER_ACCURACY with step size FIRST_ORDER_STEP (at most 1/L = 1,
+# as the entries of the 0/1 incidence matrix bound the Lipschitz constant of the game in the entropic setup)
+MAXIMIN_MASTER = 'lp'
+FIRST_ORDER_ACCURACY = EPS / 10
+FIRST_ORDER_STEP = 1.
+FIRST_ORDER_MAX_ITERATIONS = 200000
+
+# anytime OPT: stop column generation early and return the best lottery found so far with a certified bound
+OPT_TIME_BUDGET = None       # seconds per OPT run (None = no limit)
+OPT_GAP_BUDGET = None        # relative optimality gap at which to stop, e.g. 0.001 (None = only stop at EPS)
+
+# presolve the quotas (bound propagation and LP reasoning over feature-value counts) before building the pricing ILP
+PRESOLVE = 1
+
+# two-tier pricing: try a greedy committee (NumPy heuristic) first and only solve the pricing ILP if it finds no
+# violated constraint, so that optimality is still proven by the ILP in the last round
+HEURISTIC_PRICING = 1
+
+# asynchronous column generation: number of pricing threads, each with its own pricing ILP, that keep pricing against
+# the most recently published master weights while the master re-solves as soon as new panels arrive (0 = master and
+# pricing alternate); once the threads find no more violated panels, a synchronous pricing round certifies optimality.
+# All threads but the first diversify by pricing weights perturbed with lognormal noise of spread ASYNC_PERTURBATION
+ASYNC_PRICING_WORKERS = 0
+ASYNC_PERTURBATION = 0.1
+
+# rounding portfolio: wall-clock budget in seconds, number of worker processes (None = one per cpu), pipage seeds
+PORTFOLIO_BUDGET = 600
+PORTFOLIO_WORKERS = None
+PORTFOLIO_PIPAGE_SEEDS = 8
+
+# distributed execution: if set to the path of a job queue file (see job_queue.py) in a directory shared by all hosts,
+# the instances and objectives above become jobs that every process running this script pulls from the queue
+JOB_QUEUE = None
+JOB_LEASE_SECONDS = 300         # a job whose worker sends no heartbeat for this long is handed to another worker
+
 # set run parameters
 check_same_address = False
 check_same_address_columns = [] # unset because never used, for now
@@ -62,7 +125,325 @@ def _print(message: str) -> str:
     return message
 
 
-def _setup_committee_generation(categories, people, number_people_wanted, check_same_address,households):
+def _incidence_matrix(committees, agents):
+    """Sparse 0/1 matrix with one row per agent in `agents` and one column per committee in `committees`, whose entry
+    (i, j) is 1 iff `agents[i]` is on `committees[j]`. Members of a committee that are not in `agents` are ignored.
+    All models over a set of committees are built from this matrix.
+    """
+    if isinstance(committees, _PanelStore):
+        return committees.incidence(agents)
+    index = {id: i for i, id in enumerate(agents)}
+    rows = []
+    columns = []
+    for j, committee in enumerate(committees):
+        for id in committee:
+            if id in index:
+                rows.append(index[id])
+                columns.append(j)
+    return sp.csr_matrix((np.ones(len(rows)), (rows, columns)), shape=(len(agents), len(committees)))
+
+
+def _aggregate_rows(matrix):
+    """Collapses the identical rows of the sparse 0/1 agent × panel `matrix`: the agents on exactly the same panels
+    (hashed by the panel indices of their row, their membership signature) share one row. Returns (matrix of the
+    distinct rows, number of agents per distinct row, index of every agent's distinct row), so that the rounding models
+    need one constraint per distinct row only and their results map back to agents through the index.
+    """
+    matrix = sp.csr_matrix(matrix).sorted_indices()
+    signatures = {}
+    inverse = np.array([signatures.setdefault(matrix.indices[matrix.indptr[i]:matrix.indptr[i + 1]].tobytes(),
+                                              len(signatures))
+                        for i in range(matrix.shape[0])], dtype=np.int64)
+    first = np.unique(inverse, return_index=True)[1]
+    return matrix[first], np.bincount(inverse, minlength=len(first)), inverse
+
+
+def _mip_row_sums(matrix, variables):
+    """python-mip has no matrix interface, so build one linear expression Σ_j matrix[i, j] * variables[j] per row i
+    directly from the CSR arrays of `matrix`, without scanning for the nonzeros.
+    """
+    import mip
+    matrix = sp.csr_matrix(matrix)
+    return [mip.LinExpr(variables=[variables[j] for j in matrix.indices[matrix.indptr[i]:matrix.indptr[i + 1]]],
+                        coeffs=matrix.data[matrix.indptr[i]:matrix.indptr[i + 1]].tolist())
+            for i in range(matrix.shape[0])]
+
+
+class _PanelStore:
+    """Duplicate-free collection of panels over a fixed list of agents, used in place of a set of frozensets during
+    column generation. Each panel is stored once, as the sorted int32 positions of its members in `agents`, appended
+    to one flat array; together with the panel offsets, this is exactly the CSR layout of the panel × agent incidence
+    matrix, so that matrix (and its transpose) are views on the store rather than copies. New panels are deduplicated
+    through a hash index keyed by the bytes of their member arrays.
+    Iterating over the store or indexing into it yields frozensets of agent ids, in order of insertion.
+    """
+
+    def __init__(self, agents):
+        self.agents = list(agents)
+        self._position = {id: i for i, id in enumerate(self.agents)}
+        self._indices = np.empty(1024, dtype=np.int32)  # members of all panels, back to back
+        self._indptr = np.zeros(129, dtype=np.int32)  # panel j has members _indices[_indptr[j]:_indptr[j + 1]]
+        self._ones = np.ones(len(self._indices))
+        self._index = {}  # member bytes -> panel number
+        self._matrix = None
+
+    def _members(self, panel):
+        return np.sort(np.fromiter((self._position[id] for id in panel), dtype=np.int32, count=len(panel)))
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, panel):
+        return self._members(panel).tobytes() in self._index
+
+    def __getitem__(self, j):
+        return frozenset(self.agents[i] for i in self._indices[self._indptr[j]:self._indptr[j + 1]])
+
+    def __iter__(self):
+        return (self[j] for j in range(len(self)))
+
+    def add(self, panel):
+        """Adds `panel` unless it is already stored. Returns whether it was new."""
+        members = self._members(panel)
+        key = members.tobytes()
+        if key in self._index:
+            return False
+        j = len(self._index)
+        start = self._indptr[j]
+        end = start + len(members)
+        if end > len(self._indices):
+            self._indices = np.resize(self._indices, max(2 * len(self._indices), end))
+            self._ones = np.ones(len(self._indices))
+        if j + 2 > len(self._indptr):
+            self._indptr = np.resize(self._indptr, 2 * len(self._indptr))
+        self._indices[start:end] = members
+        self._indptr[j + 1] = end
+        self._index[key] = j
+        self._matrix = None
+        return True
+
+    def matrix(self):
+        """Panel × agent 0/1 matrix in CSR format, sharing its index arrays with the store."""
+        if self._matrix is None:
+            m = len(self)
+            nnz = self._indptr[m]
+            self._matrix = sp.csr_matrix((self._ones[:nnz], self._indices[:nnz], self._indptr[:m + 1]),
+                                         shape=(m, len(self.agents)), copy=False)
+        return self._matrix
+
+    def incidence(self, agents=None):
+        """Agent × panel incidence matrix as built by `_incidence_matrix`. Without `agents` (or if `agents` are all
+        agents of the store, in order), this is the transpose of `matrix()` and involves no copying.
+        """
+        if agents is None or list(agents) == self.agents:
+            return self.matrix().T
+        return self.matrix()[:, [self._position[id] for id in agents]].T.tocsr()
+
+    def membership(self, ids):
+        """Boolean array whose entry (i, j) says whether agent `ids[i]` is on panel j."""
+        return self.incidence(ids).toarray().astype(bool)
+
+    def coverage(self):
+        """Number of stored panels containing each agent, in order of `agents`."""
+        return np.bincount(self._indices[:self._indptr[len(self)]], minlength=len(self.agents))
+
+    def overlap(self, panel):
+        """Number of members that `panel` shares with each stored panel."""
+        indicator = np.zeros(len(self.agents))
+        indicator[self._members(panel)] = 1.
+        return self.matrix() @ indicator
+
+    def pairwise_overlap(self):
+        """Sparse panel × panel matrix of the number of shared members."""
+        return self.matrix() @ self.matrix().T
+
+
+def _presolve_quotas(categories, people, number_people_wanted, households=None):
+    """Cheap presolve of the quota system, run before any ILP is built. Agents that agree on every feature are
+    interchangeable for the quotas, so everything is reasoned about on the level of these types:
+        1. bound propagation: the number of selected agents with a feature value is at most its pool count and k, and
+           since the values of a feature partition the pool, its bounds follow from the bounds of the other values.
+        2. LP reasoning: over the LP relaxation with one variable 0 ≤ y_t ≤ |t| per type t, the smallest and largest
+           possible number of selected agents with each feature value (rounded inwards) are valid integer bounds.
+           A type whose LP maximum is below 1 can never be selected, and one whose LP minimum is above |t| - 1 is always
+           selected in full.
+    If the propagated bounds cross or the LP relaxation is infeasible, no feasible committee exists.
+    With `households` (see `_household_groups`), at most one agent per household is selected, so y_t is bounded by the
+    number of households among the agents of type t instead, and a type is only forced in if all of its agents live in
+    different households.
+
+    Returns (categories, forced_in, forced_out, infeasible, output_lines), where `categories` is a copy of the input
+    with tightened "min"/"max" entries, and `forced_in`/`forced_out` are sets of agent ids.
+    """
+    from scipy.optimize import linprog
+    output_lines = []
+    k = number_people_wanted
+    features = list(categories)
+    rows = [(feature, value) for feature in features for value in categories[feature]]
+
+    types: Dict[tuple, List[str]] = {}
+    for id, person in people.items():
+        types.setdefault(tuple(person[feature] for feature in features), []).append(id)
+    type_keys = list(types)
+    type_counts = np.array([len(types[t]) for t in type_keys], dtype=float)
+    household_of = dict(zip(people, _household_groups(households, list(people))))
+    capacities = np.array([len({household_of[id] for id in types[t]}) for t in type_keys], dtype=float)
+    # membership[r, t] = 1 if agents of type t have the feature value of quota row r
+    membership = np.array([[1. if t[features.index(feature)] == value else 0. for t in type_keys]
+                           for feature, value in rows]).reshape(len(rows), len(type_keys))
+    value_counts = membership.dot(type_counts)
+
+    original = [(categories[feature][value]["min"], categories[feature][value]["max"]) for feature, value in rows]
+    lower = np.array([max(lo, 0) for lo, _ in original], dtype=float)
+    upper = np.minimum(np.array([hi for _, hi in original], dtype=float), np.minimum(value_counts, k))
+    rows_of_feature = {feature: [r for r, (f, _) in enumerate(rows) if f == feature] for feature in features}
+
+    def propagate():
+        changed = True
+        while changed and (lower <= upper).all():
+            changed = False
+            for feature, feature_rows in rows_of_feature.items():
+                if value_counts[feature_rows].sum() < len(people):
+                    continue  # some agents have a value without quota, so the values do not partition the pool
+                for r in feature_rows:
+                    new_lower = max(lower[r], k - upper[feature_rows].sum() + upper[r])
+                    new_upper = min(upper[r], k - lower[feature_rows].sum() + lower[r])
+                    if new_lower > lower[r] or new_upper < upper[r]:
+                        lower[r], upper[r] = new_lower, new_upper
+                        changed = True
+        return (lower <= upper).all()
+
+    def lp(objective):
+        return linprog(objective, A_ub=np.vstack([membership, -membership]), b_ub=np.concatenate([upper, -lower]),
+                       A_eq=np.ones((1, len(type_keys))), b_eq=[k], bounds=list(zip(np.zeros(len(type_keys)),
+                                                                                    capacities)), method='highs')
+
+    if not propagate() or lp(np.zeros(len(type_keys))).status == 2:
+        output_lines.append(_print("Presolve: quotas are infeasible."))
+        return categories, set(), set(), True, output_lines
+
+    for r in range(len(rows)):
+        lower[r] = max(lower[r], math.ceil(lp(membership[r]).fun - EPS2))
+        upper[r] = min(upper[r], math.floor(-lp(-membership[r]).fun + EPS2))
+    if not propagate():
+        output_lines.append(_print("Presolve: quotas are infeasible."))
+        return categories, set(), set(), True, output_lines
+
+    forced_in = set()
+    forced_out = set()
+    for t, key in enumerate(type_keys):
+        unit = np.zeros(len(type_keys))
+        unit[t] = 1.
+        if -lp(-unit).fun < 1 - EPS2:
+            forced_out.update(types[key])
+        elif capacities[t] == type_counts[t] and lp(unit).fun > type_counts[t] - 1 + EPS2:
+            forced_in.update(types[key])
+
+    presolved = {feature: {value: dict(categories[feature][value]) for value in categories[feature]}
+                 for feature in features}
+    for r, (feature, value) in enumerate(rows):
+        presolved[feature][value]["min"] = int(lower[r])
+        presolved[feature][value]["max"] = int(upper[r])
+    tightened = sum((int(lower[r]) > original[r][0]) + (int(upper[r]) < original[r][1]) for r in range(len(rows)))
+    redundant = sum((lower[r] <= 0) + (upper[r] >= min(value_counts[r], k)) for r in range(len(rows)))
+    output_lines.append(_print(f"Presolve: tightened {tightened} quota bounds, {redundant} of {2 * len(rows)} quota "
+                               f"rows are redundant, {len(forced_in)} agents forced in, {len(forced_out)} agents "
+                               f"forced out."))
+    return presolved, forced_in, forced_out, False, output_lines
+
+
+def _quota_matrix(categories, people):
+    """Returns (rows, matrix), where `rows` lists the quotas (feature, value) of `categories` and `matrix` is the sparse
+    0/1 matrix with one row per quota and one column per agent in `people`, whose entry is 1 iff the agent has the
+    feature value. Multiplied with an incidence matrix, it gives the quota counts of committees.
+    The matrix only depends on the pool and on which quotas exist, not on their bounds, so a pricing ILP keeps the one of
+    its pool for all quota settings and panel sizes (see `_committee_generation_for_size`).
+    """
+    feature_value_agents = {(feature, value): [] for feature in categories for value in categories[feature]}
+    for id, person in people.items():
+        for feature in categories:
+            if (feature, person[feature]) in feature_value_agents:
+                feature_value_agents[(feature, person[feature])].append(id)
+    return list(feature_value_agents), _incidence_matrix(list(feature_value_agents.values()), list(people)).T
+
+
+def _compute_households(columns_data, check_same_address_columns):
+    """Household number of every agent in `columns_data`: agents who agree on all `check_same_address_columns` live at
+    the same address. Returns {id: household number}."""
+    numbers = {}
+    return {id: numbers.setdefault(tuple(columns_data[id][column] for column in check_same_address_columns),
+                                   len(numbers))
+            for id in columns_data}
+
+
+def _household_groups(households, agents):
+    """Group-id array of `agents`: entry i is the number of the household of `agents[i]`, with numbers 0, 1, ... in order
+    of first appearance. Agents without a household in `households` (all agents, if it is None) are in groups of their
+    own, so that at most one agent per group may be selected in every case.
+    """
+    numbers = {}
+    return np.fromiter((numbers.setdefault(households[id] if households is not None and id in households else (None, id),
+                                           len(numbers)) for id in agents), dtype=np.int64, count=len(agents))
+
+
+def _household_matrix(households, agents):
+    """Sparse 0/1 matrix with one row per household with at least two agents in `agents` and one column per agent,
+    whose entry is 1 iff the agent lives in the household. Households of one agent need no constraint and get no row,
+    so pools with many small households add few rows. Multiplied with an incidence matrix, it gives the number of
+    members of each household on each committee.
+    """
+    groups = _household_groups(households, agents)
+    shared = np.flatnonzero(np.bincount(groups)[groups] >= 2)
+    _, rows = np.unique(groups[shared], return_inverse=True)
+    return sp.csr_matrix((np.ones(len(shared)), (rows, shared)), shape=(rows.max(initial=-1) + 1, len(agents)))
+
+
+def _quota_row_name(bound, feature, value):
+    """Name of the row of the pricing ILP for the lower ("min") or upper ("max") quota on a feature value."""
+    return re.sub(r'\W', '_', f"{bound}_{feature}_{value}")
+
+
+def _set_quota_rows(model, agent_vars, categories, people, number_people_wanted, households=None, quota_matrix=None):
+    """Brings the quota rows of the pricing ILP `model` in line with `categories`, in place: presolves the quotas (for
+    the household constraints in `households`, if any),
+    resets the bounds of the agent variables to the agents forced in/out (agents with a variable that are no longer in
+    the pool `people` are forced out), and adds, removes or changes the right-hand side of the quota rows (found by
+    name). The rows are built from `quota_matrix` (rows, matrix) of `_quota_matrix` over the agents of `agent_vars`,
+    which is computed if not given. Returns whether presolve proved the quotas infeasible.
+    """
+    forced_in, forced_out = set(), set()
+    if PRESOLVE == 1:
+        categories, forced_in, forced_out, infeasible, _ = _presolve_quotas(categories, people, number_people_wanted,
+                                                                            households)
+        if infeasible:
+            return True
+    for id, var in agent_vars.items():
+        var.lb = 1. if id in forced_in else 0.
+        var.ub = 0. if id in forced_out or id not in people else 1.
+
+    # we have to respect quotas (after presolve, leave out rows implied by 0 ≤ x ≤ 1 and the committee size)
+    agents = list(agent_vars)
+    rows, quota_matrix = quota_matrix if quota_matrix is not None else _quota_matrix(categories, people)
+    value_counts = np.asarray(quota_matrix.sum(axis=1)).ravel()
+    for (feature, value), count, number_feature_value_agents in zip(
+            rows, value_counts, _mip_row_sums(quota_matrix, [agent_vars[id] for id in agents])):
+        for bound in ("min", "max"):
+            quota = categories[feature][value][bound]
+            needed = PRESOLVE == 0 or (quota > 0 if bound == "min" else quota < min(count, number_people_wanted))
+            row = model.constr_by_name(_quota_row_name(bound, feature, value))
+            if needed and row is not None:
+                row.rhs = quota
+            elif needed:
+                model.add_constr(number_feature_value_agents >= quota if bound == "min"
+                                 else number_feature_value_agents <= quota, name=_quota_row_name(bound, feature, value))
+            elif row is not None:
+                model.remove(row)
+    return False
+
+
+def _setup_committee_generation(categories, people, number_people_wanted, check_same_address,households,
+                                quota_matrix=None):
+    import mip
     model = mip.Model(sense=mip.MAXIMIZE)
     model.verbose = debug
 
@@ -70,27 +451,20 @@ def _setup_committee_generation(categories, people, number_people_wanted, check_
     agent_vars = {id: model.add_var(var_type=mip.BINARY) for id in people}
 
     # we have to select exactly `number_people_wanted` many persons
-    model.add_constr(mip.xsum(agent_vars.values()) == number_people_wanted)
+    model.add_constr(mip.xsum(agent_vars.values()) == number_people_wanted, name="size")
 
     # we have to respect quotas
-    for feature in categories:
-        for value in categories[feature]:
-            number_feature_value_agents = mip.xsum(agent_vars[id] for id, person in people.items()
-                                                   if person[feature] == value)
-            model.add_constr(number_feature_value_agents >= categories[feature][value]["min"])
-            model.add_constr(number_feature_value_agents <= categories[feature][value]["max"])
-
-    # we might not be able to select multiple persons from the same household
-    if check_same_address:
-        people_by_household = {}
-        for id, household in households.items():
-            if household not in people_by_household:
-                people_by_household[household] = []
-            people_by_household[household].append(id)
+    if _set_quota_rows(model, agent_vars, categories, people, number_people_wanted,
+                       households if check_same_address else None, quota_matrix):
+        print("infeasible")
+        return None, None, True
 
-        for household, members in people_by_household.items():
-            if len(members) >= 2:
-                model.add_constr(mip.xsum(agent_vars[id] for id in members) <= 1)
+    # we might not be able to select multiple persons from the same household (one row per household of 2 or more)
+    agents = list(people)
+    if check_same_address:
+        for number_household_agents in _mip_row_sums(_household_matrix(households, agents),
+                                                      [agent_vars[id] for id in agents]):
+            model.add_constr(number_household_agents <= 1)
 
     # Optimize once without any constraints to check if no feasible committees exist at all.
     status = model.optimize()
@@ -105,14 +479,57 @@ def _setup_committee_generation(categories, people, number_people_wanted, check_
 
     return model, agent_vars, False
 
-def _generate_initial_committees(new_committee_model, agent_vars,multiplicative_weights_rounds):
+
+def _update_committee_generation(new_committee_model, agent_vars, quota_matrix, households, categories, people,
+                                 number_people_wanted):
+    """Changes the quotas and the panel size of a pricing ILP built by `_setup_committee_generation` (with the quota
+    matrix `quota_matrix` of its pool and the household constraints of `households`, if any) to `categories` and
+    `number_people_wanted` in place, rather than building a new one. Returns whether the new quotas are infeasible.
+    """
+    import mip
+    new_committee_model.constr_by_name("size").rhs = number_people_wanted
+    if _set_quota_rows(new_committee_model, agent_vars, categories, people, number_people_wanted, households,
+                       quota_matrix):
+        return True
+    new_committee_model.objective = mip.xsum(agent_vars.values())
+    return new_committee_model.optimize() == mip.OptimizationStatus.INFEASIBLE
+
+
+def _satisfies_quotas(committees, categories, people, number_people_wanted, households=None):
+    """Boolean array saying which of `committees` are feasible for the quotas in `categories` (and the pool `people`),
+    checked for all committees at once on the matrix of quota counts. With `households`, committees with two members
+    of the same household are infeasible as well.
+    """
+    rows, quota_matrix = _quota_matrix(categories, people)
+    incidence = _incidence_matrix(committees, list(people))
+    counts = (quota_matrix @ incidence).toarray().reshape(len(rows), len(committees))
+    lower = np.array([categories[feature][value]["min"] for feature, value in rows]).reshape(-1, 1)
+    upper = np.array([categories[feature][value]["max"] for feature, value in rows]).reshape(-1, 1)
+    sizes = np.array([len(committee) for committee in committees])
+    members_in_pool = np.asarray(incidence.sum(axis=0)).ravel()
+    feasible = ((sizes == number_people_wanted) & (members_in_pool == sizes) & (counts >= lower).all(axis=0)
+                & (counts <= upper).all(axis=0))
+    household_matrix = _household_matrix(households, list(people)) if households is not None else None
+    if household_matrix is not None and household_matrix.shape[0] > 0:
+        feasible &= (household_matrix @ incidence).max(axis=0).toarray().ravel() <= 1
+    return feasible
+
+def _generate_initial_committees(new_committee_model, agent_vars,multiplicative_weights_rounds,
+                                 initial_committees=()):
     """To speed up the main iteration of the maximin and Nash algorithms, start from a diverse set of feasible
     committees. In particular, each agent that can be included in any committee will be included in at least one of
     these committees.
+    Feasible committees that are already known (e.g., from an earlier solution) can be passed as `initial_committees`,
+    and are kept unless they contain agents that are no longer in the pool.
     """
+    import mip
     new_output_lines = []
-    committees: Set[FrozenSet[str]] = set()  # Committees discovered so far
+    committees = _PanelStore(agent_vars)  # Committees discovered so far
     covered_agents: Set[str] = set()  # All agents included in some committee
+    for committee in initial_committees:
+        if all(id in agent_vars for id in committee):
+            committees.add(frozenset(committee))
+            covered_agents.update(committee)
 
     # We begin using a multiplicative-weight stage. Each agent has a weight starting at 1.
     weights = {id: 1 for id in agent_vars}
@@ -121,8 +538,6 @@ def _generate_initial_committees(new_committee_model, agent_vars,multiplicative_
         # feasible committee such that the sum of weights of its members is maximal.
         new_committee_model.objective = mip.xsum(weights[id] * agent_vars[id] for id in agent_vars)
         new_committee_model.optimize()
-        new_committee_model.write("cbc_fail.mps")  # TODO remove
-        new_committee_model.write("cbc_fail.sol")
         new_set = _ilp_results_to_committee(agent_vars)
 
         # We then decrease the weight of each agent in the new committee by a constant factor. As a result, future
@@ -149,7 +564,10 @@ def _generate_initial_committees(new_committee_model, agent_vars,multiplicative_
 
     # If there are any agents that have not been included so far, try to find a committee including this specific agent.
     for id in agent_vars:
-        if id not in covered_agents:
+        if id not in covered_agents and agent_vars[id].ub < 0.5:
+            # presolve proved that no feasible committee contains this agent
+            new_output_lines.append(_print(f"Agent {id} not contained in any feasible committee (presolve)."))
+        elif id not in covered_agents:
             new_committee_model.objective = agent_vars[id]  # only care about agent `id` being included.
             new_committee_model.optimize()
             new_set: FrozenSet[str] = _ilp_results_to_committee(agent_vars)
@@ -169,6 +587,16 @@ def _generate_initial_committees(new_committee_model, agent_vars,multiplicative_
     return committees, frozenset(covered_agents), new_output_lines
 
 
+def _initial_lottery(committees, initial_committees, initial_probabilities):
+    """Probabilities of an earlier lottery over `initial_committees`, aligned with the committees of `committees` (0 for
+    committees not in it) and renormalized, to warm-start a master problem. None if there is no earlier lottery."""
+    if initial_probabilities is None:
+        return None
+    earlier = dict(zip((frozenset(committee) for committee in initial_committees), initial_probabilities))
+    probabilities = np.array([earlier.get(committee, 0.) for committee in committees], dtype=float).clip(0, None)
+    return probabilities / probabilities.sum() if probabilities.sum() > 0 else None
+
+
 def _ilp_results_to_committee(variables):
     try:
         res = frozenset(id for id in variables if variables[id].x > 0.5)
@@ -177,6 +605,293 @@ def _ilp_results_to_committee(variables):
 
     return res
 
+
+def _price_committee(new_committee_model, agent_vars, weights):
+    """Finds the feasible committee P maximizing Σ_{i ∈ P} weights[i], reusing the ILP `new_committee_model`."""
+    import mip
+    new_committee_model.objective = mip.LinExpr(variables=[agent_vars[id] for id in weights],
+                                                coeffs=[weights[id] for id in weights])
+    new_committee_model.optimize()
+    return _ilp_results_to_committee(agent_vars)
+
+
+class _GreedyPricer:
+    """Heuristic for the pricing problem max_P Σ_{i ∈ P} weights[i] over feasible committees P, run in NumPy on the
+    matrix of feature codes (one row per agent, one column per feature, each entry the quota row of the agent's value):
+        1. greedy: add agents by decreasing weight, skipping agents that would exceed an upper quota or leave too few
+           seats to meet the lower quotas of some feature,
+        2. repair: if the greedy gets stuck, fill up the committee by weight, then swap members for non-members as long
+           as this reduces the total quota violation,
+        3. improve: swap members for non-members of larger weight as long as all quotas stay satisfied.
+    Agents fixed by presolve (through the bounds of their variables in the pricing ILP) stay fixed. With `households`,
+    every step keeps at most one member per household (on the group-id array of the agents). `price` returns None if no
+    feasible committee was found.
+    """
+
+    def __init__(self, categories, people, number_people_wanted, agent_vars, households=None):
+        self.agents = list(people)
+        self.groups = _household_groups(households, self.agents)
+        self.k = number_people_wanted
+        features = list(categories)
+        rows = [(feature, value) for feature in features for value in categories[feature]]
+        row_index = {row: r for r, row in enumerate(rows)}
+        # feature values without quota share one extra row without bounds
+        self.codes = np.array([[row_index.get((feature, people[id][feature]), len(rows)) for feature in features]
+                               for id in self.agents], dtype=np.int32).reshape(len(self.agents), len(features))
+        self.lower = np.array([categories[feature][value]["min"] for feature, value in rows] + [0.])
+        self.upper = np.array([categories[feature][value]["max"] for feature, value in rows] + [np.inf])
+        self.row_feature = np.array([features.index(feature) for feature, _ in rows] + [len(features)])
+        self.forced_in = np.array([agent_vars[id].lb > 0.5 for id in self.agents], dtype=bool)
+        self.allowed = np.array([agent_vars[id].ub > 0.5 for id in self.agents], dtype=bool)
+
+    def _violation(self, counts):
+        return np.maximum(self.lower - counts, 0.) + np.maximum(counts - self.upper, 0.)
+
+    def _counts(self, selected):
+        return np.bincount(self.codes[selected].ravel(), minlength=len(self.lower)).astype(float)
+
+    def price(self, weights):
+        w = np.array([weights.get(id, 0.) for id in self.agents], dtype=float)
+        n_features = self.codes.shape[1]
+        selected = self.forced_in & self.allowed
+        counts = self._counts(selected)
+        household_counts = np.bincount(self.groups[selected], minlength=self.groups.max(initial=-1) + 1)
+
+        # 1. greedy, with `seats` seats left after the current pick
+        for seats in range(self.k - selected.sum() - 1, -1, -1):
+            deficit = np.maximum(self.lower - counts, 0.)
+            feature_deficit = np.bincount(self.row_feature, weights=deficit, minlength=n_features + 1)[:n_features]
+            candidates = (self.allowed & ~selected & (counts[self.codes] < self.upper[self.codes]).all(axis=1)
+                          & (feature_deficit - (deficit[self.codes] > 0) <= seats).all(axis=1)
+                          & (household_counts[self.groups] == 0))
+            if not candidates.any():
+                break
+            j = np.argmax(np.where(candidates, w, -np.inf))
+            selected[j] = True
+            np.add.at(counts, self.codes[j], 1.)
+            household_counts[self.groups[j]] += 1
+
+        missing = self.k - selected.sum()
+        if missing > 0:
+            others = np.flatnonzero(self.allowed & ~selected & (household_counts[self.groups] == 0))
+            others = others[np.argsort(-w[others], kind='stable')]
+            _, first = np.unique(self.groups[others], return_index=True)  # the heaviest agent of each household
+            others = others[np.sort(first)]
+            if len(others) < missing:
+                return None
+            selected[others[:missing]] = True
+            counts = self._counts(selected)
+            household_counts[self.groups[others[:missing]]] += 1
+
+        # 2. repair and 3. improve, evaluating all swaps of a member i for a non-member j at once
+        for _ in range(4 * self.k):
+            members = np.flatnonzero(selected & ~self.forced_in)
+            others = np.flatnonzero(self.allowed & ~selected)
+            if len(members) == 0 or len(others) == 0:
+                break
+            violation = self._violation(counts)
+            leave = self._violation(counts - 1.) - violation  # change in violation of a row if a member leaves it
+            join = self._violation(counts + 1.) - violation  # ... and if a non-member joins it
+            out_rows = self.codes[members][:, None, :]
+            in_rows = self.codes[others][None, :, :]
+            delta = ((out_rows != in_rows) * (leave[out_rows] + join[in_rows])).sum(axis=2)
+            gain = w[others][None, :] - w[members][:, None]
+            # j may only join if its household has no member left once i leaves
+            delta = np.where((household_counts[self.groups[others]] == 0)[None, :]
+                             | (self.groups[members][:, None] == self.groups[others][None, :]), delta, np.inf)
+            if violation.sum() > 0:
+                if delta.min() >= 0:
+                    return None
+                swap = np.where(delta == delta.min(), gain, -np.inf)
+            else:
+                swap = np.where(delta == 0, gain, -np.inf)
+            i, j = np.unravel_index(np.argmax(swap), swap.shape)
+            if violation.sum() == 0 and swap[i, j] <= EPS2:
+                break
+            selected[members[i]] = False
+            selected[others[j]] = True
+            np.subtract.at(counts, self.codes[members[i]], 1.)
+            np.add.at(counts, self.codes[others[j]], 1.)
+            household_counts[self.groups[members[i]]] -= 1
+            household_counts[self.groups[others[j]]] += 1
+
+        if self._violation(counts).sum() > 0:
+            return None
+        return frozenset(self.agents[i] for i in np.flatnonzero(selected))
+
+
+def _greedy_column(pricer, committees, weights, threshold, start_time):
+    """First tier of the pricing: returns the committee P found by `pricer` if it is new and Σ_{i ∈ P} weights[i] >
+    threshold, and None if the exact ILP has to be solved instead. Once the time budget is used up, always returns None,
+    so that an exact round decides whether the column generation stops.
+    """
+    if pricer is None or _opt_stop_reason(start_time, math.inf) == 'time':
+        return None
+    new_set = pricer.price(weights)
+    if new_set is None or new_set in committees or sum(weights.get(id, 0.) for id in new_set) <= threshold:
+        return None
+    return new_set
+
+
+class _AsyncPricing:
+    """Pricing threads for asynchronous column generation. The master publishes its weights and a threshold after
+    every solve (`columns`); each of `workers` threads builds its own pricing ILP (and greedy pricer) and, whenever new
+    weights are published, prices them: greedily first, then by the ILP. A committee whose weight exceeds the threshold
+    is put into the thread-safe queue and the worker continues with the weights of its members scaled down (as in the
+    maximin heuristic), to find further violated committees, until none is found or newer weights are published. Since
+    every committee found is feasible, committees found for outdated weights are valid columns as well.
+    The threads share no solver state: each owns its pricing ILP, separate from the master's. This relies on python-mip
+    keeping all CBC state in the per-model object, so that separate models can be solved concurrently (its cffi calls
+    release the GIL, so they do run in parallel); within one thread, calls to its model are sequential.
+    """
+
+    def __init__(self, workers, categories, people, number_people_wanted, check_same_address, households):
+        self.setup = (categories, people, number_people_wanted, check_same_address, households)
+        self.published = threading.Condition()
+        self.version, self.weights, self.threshold = 0, None, None
+        self.closed = False
+        self.queue = Queue()
+        self.threads = [threading.Thread(target=self._work, args=(index,), daemon=True) for index in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def _work(self, index):
+        version = 0
+        try:
+            new_committee_model, agent_vars, _ = _setup_committee_generation(*self.setup)
+            pricer = _GreedyPricer(*self.setup[:3], agent_vars, self.setup[4]) if HEURISTIC_PRICING == 1 else None
+            rng = np.random.default_rng(index)
+            while True:
+                with self.published:
+                    self.published.wait_for(lambda: self.closed or self.version != version)
+                    if self.closed:
+                        return
+                    version, weights, threshold = self.version, self.weights, self.threshold
+                pricing_weights = weights if index == 0 else {
+                    id: weight * noise
+                    for (id, weight), noise in zip(weights.items(), rng.lognormal(0., ASYNC_PERTURBATION, len(weights)))}
+                for _ in range(10):
+                    new_set = pricer.price(pricing_weights) if pricer is not None else None
+                    if new_set is None or sum(weights.get(id, 0.) for id in new_set) <= threshold:
+                        new_set = _price_committee(new_committee_model, agent_vars, pricing_weights)
+                    total = sum(pricing_weights.get(id, 0.) for id in new_set)
+                    if sum(weights.get(id, 0.) for id in new_set) <= threshold or total <= 0:
+                        break
+                    self.queue.put(('column', version, new_set))
+                    if self.version != version:
+                        break
+                    pricing_weights = dict(pricing_weights)
+                    for id in new_set:
+                        pricing_weights[id] *= threshold / total
+                self.queue.put(('priced', version, None))
+        except Exception as e:
+            self.queue.put(('error', version, e))
+
+    def columns(self, weights, threshold, committees):
+        """Publishes the master's `weights` and the `threshold` a committee's weight must exceed, and returns the new
+        committees (not in `committees`) that the workers found, waiting until either some arrived or every worker has
+        priced `weights` without finding one (in which case a synchronous pricing round has to decide convergence)."""
+        with self.published:
+            self.version += 1
+            self.weights, self.threshold = dict(weights), threshold
+            self.published.notify_all()
+        found = []
+        idle = 0
+        while len(found) == 0 and idle < len(self.threads):
+            kind, version, item = self.queue.get()
+            while True:
+                if kind == 'error':
+                    raise item
+                if kind == 'column' and item not in committees and item not in found:
+                    found.append(item)
+                idle += kind == 'priced' and version == self.version
+                try:
+                    kind, version, item = self.queue.get_nowait()
+                except Empty:
+                    break
+        return found
+
+    def close(self):
+        with self.published:
+            self.closed = True
+            self.published.notify_all()
+        for thread in self.threads:
+            thread.join()
+
+
+def _async_columns(pricing, weights, threshold, committees, start_time):
+    """New committees from the asynchronous `pricing` (see `_AsyncPricing.columns`), or [] if there is none or the time
+    budget is used up, so that a synchronous round decides whether the column generation stops."""
+    if pricing is None or _opt_stop_reason(start_time, math.inf) == 'time':
+        return []
+    return pricing.columns(weights, threshold, committees)
+
+
+def _wentges_separation_point(center, out_weights, alpha):
+    """Wentges smoothing: instead of pricing against the dual weights `out_weights` of the last master solve, price
+    against α·center + (1-α)·out_weights. Both points satisfy the normalization of the dual, so their convex
+    combination does as well.
+    """
+    if center is None:
+        return out_weights
+    return {id: alpha * center[id] + (1 - alpha) * out_weights[id] for id in out_weights}
+
+
+def _update_stability_center(center, best_bound, weights, bound):
+    """The stability center is the dual point with the lowest Lagrangian bound seen so far."""
+    if bound < best_bound:
+        return dict(weights), bound
+    return center, best_bound
+
+
+def _set_dual_box(dual_vars, center, box, lb_attr, ub_attr):
+    """Box-step stabilization: restrict each dual variable to [center - box, center + box] intersected with [0, 1].
+    `lb_attr`/`ub_attr` name the bound attributes of the solver's variables ("lb"/"ub" for mip, "LB"/"UB" for gurobi).
+    """
+    for id, var in dual_vars.items():
+        setattr(var, lb_attr, max(0., center[id] - box))
+        setattr(var, ub_attr, min(1., center[id] + box))
+
+
+def _dual_box_is_binding(weights, center, box):
+    """Whether some dual weight sits on a box face that is tighter than its natural bounds 0 and 1."""
+    for id, weight in weights.items():
+        if center[id] - box > 0. and weight <= center[id] - box + EPS2:
+            return True
+        if center[id] + box < 1. and weight >= center[id] + box - EPS2:
+            return True
+    return False
+
+
+def _opt_stop_reason(start_time, relative_gap):
+    """Returns why column generation may stop before the EPS criterion holds: 'gap' if `relative_gap` is within
+    OPT_GAP_BUDGET, 'time' if OPT_TIME_BUDGET seconds have passed since `start_time`, and None otherwise.
+    """
+    if OPT_GAP_BUDGET is not None and relative_gap <= OPT_GAP_BUDGET:
+        return 'gap'
+    if OPT_TIME_BUDGET is not None and time() - start_time >= OPT_TIME_BUDGET:
+        return 'time'
+    return None
+
+
+def _record_certificate(certificates, objective, level, value, bound, stopped, start_time):
+    """Appends the value achieved by the returned lottery and a certified upper bound on the optimum to `certificates`
+    (a list of dicts, written to csv by the main loop). For leximin, there is one entry per fixing level.
+    """
+    if certificates is not None:
+        certificates.append({'objective': objective, 'level': level, 'value': value, 'bound': bound,
+                             'gap': bound - value, 'stopped': stopped, 'seconds': time() - start_time})
+
+
+def _record_round(telemetry, objective, stabilization, round, committees, master_value, bound, mispriced,
+                  greedy=False):
+    """Appends one master/pricing round to `telemetry` (a list of dicts, written to csv by the main loop)."""
+    if telemetry is not None:
+        telemetry.append({'objective': objective, 'stabilization': stabilization, 'round': round,
+                          'committees': committees, 'master_value': master_value, 'lagrangian_bound': bound,
+                          'gap': bound - master_value, 'mispriced': mispriced, 'greedy': greedy})
+
+
 def _dual_leximin_stage(people, committees,fixed_probabilities):
     """This implements the dual LP described in `find_distribution_leximin`, but where P only ranges over the panels
     in `committees` rather than over all feasible panels:
@@ -187,17 +902,22 @@ def _dual_leximin_stage(people, committees,fixed_probabilities):
 
     Returns a Tuple[grb.Model, Dict[str, grb.Var], grb.Var]   (not in type signature to prevent global gurobi import.)
     """
+    import gurobipy as grb
     assert len(committees) != 0
 
     model = grb.Model()
-    agent_vars = {person: model.addVar(vtype=grb.GRB.CONTINUOUS, lb=0.) for person in people}  # yᵢ
-    cap_var = model.addVar(vtype=grb.GRB.CONTINUOUS, lb=0.)  # ŷ
-    model.addConstr(grb.quicksum(agent_vars[person] for person in people if person not in fixed_probabilities) == 1)
-    for committee in committees:
-        model.addConstr(grb.quicksum(agent_vars[person] for person in committee) <= cap_var)
-    model.setObjective(cap_var - grb.quicksum(
-                                    fixed_probabilities[person] * agent_vars[person] for person in fixed_probabilities),
-                       grb.GRB.MINIMIZE)
+    agents = list(people)
+    variables = model.addMVar(len(agents) + 1, vtype=grb.GRB.CONTINUOUS, lb=0.)  # yᵢ for all agents, followed by ŷ
+    agent_vars = dict(zip(agents, variables.tolist()[:-1]))
+    cap_var = variables.tolist()[-1]
+    unfixed = np.array([0. if person in fixed_probabilities else 1. for person in agents] + [0.])
+    model.addMConstr(sp.csr_matrix(unfixed), variables, '=', np.array([1.]))
+    # Σ_{i ∈ P} yᵢ - ŷ ≤ 0 for all P at once
+    committee_matrix = sp.hstack([_incidence_matrix(committees, agents).T,
+                                  sp.csr_matrix(-np.ones((len(committees), 1)))]).tocsr()
+    model.addMConstr(committee_matrix, variables, '<', np.zeros(len(committees)))
+    objective = np.array([-fixed_probabilities.get(person, 0.) for person in agents] + [1.])
+    model.setObjective(objective @ variables, grb.GRB.MINIMIZE)
 
     # Change Gurobi configuration to encourage strictly complementary (“inner”) solutions. These solutions will
     # typically allow to fix more probabilities per outer loop of the leximin algorithm.
@@ -206,7 +926,40 @@ def _dual_leximin_stage(people, committees,fixed_probabilities):
 
     return model, agent_vars, cap_var
 
-def find_opt_distribution_leximin(categories, people,columns_data, number_people_wanted,check_same_address, check_same_address_columns):
+
+def _fix_level_from_seed(seed, fixed_probabilities, committees, new_committee_model, agent_vars, certificates,
+                         start_time, output_lines):
+    """The first level of leximin, with only the agents in no committee fixed (at 0), is the maximin LP. Given a maximin
+    lottery and its dual weights y_e (Σ_e y_e = 1 over the unfixed agents), every agent with y_e > EPS is at the maximin
+    value in every optimal lottery, and the seed lottery achieves that value. One pricing ILP checks that no committee
+    violates the weights (the Lagrangian bound max_B Σ_{i ∈ B} y_{e(i)} is within EPS of the value); if so, these agents
+    are fixed at the value, otherwise the violating committee is added and the first level is solved as usual.
+    Returns the next level.
+    """
+    seed_committees, seed_probabilities, seed_weights = seed
+    unfixed = [person for person in agent_vars if person not in fixed_probabilities]
+    total = sum(seed_weights.get(person, 0.) for person in unfixed)
+    weights = {person: seed_weights.get(person, 0.) / total if total > 0 else 0. for person in agent_vars}
+    value = float(lottery_marginals(_incidence_matrix(seed_committees, unfixed), seed_probabilities).min())
+
+    new_set = _price_committee(new_committee_model, agent_vars, weights)
+    bound = sum(weights[id] for id in new_set)
+    if bound > value + EPS:
+        if new_set not in committees:
+            committees.add(new_set)
+        output_lines.append(_print(f"Seed duals do not certify the seed lottery (bound {bound:.2%} > {value:.2%}), "
+                                   f"solving the first level."))
+        return 0
+
+    fixed = [person for person in unfixed if weights[person] > EPS]
+    for person in fixed:
+        fixed_probabilities[person] = max(0, value)
+    _record_certificate(certificates, 'leximin', 0, value, max(value, bound), None, start_time)
+    output_lines.append(_print(f"Fixed {len(fixed)} probabilities at {value:.2%} from the seed duals."))
+    return 1
+
+
+def find_opt_distribution_leximin(categories, people,columns_data, number_people_wanted,check_same_address, check_same_address_columns, telemetry=None, certificates=None, initial_committees=None, committee_generation=None, seed=None):
     """Find a distribution over feasible committees that maximizes the minimum probability of an agent being selected
     (just like maximin), but breaks ties to maximize the second-lowest probability, breaks further ties to maximize the
     third-lowest probability and so forth.
@@ -220,38 +973,78 @@ def find_opt_distribution_leximin(categories, people,columns_data, number_people
         `probabilities` is a list of probabilities of equal length, describing the probability with which each committee
             should be selected.
         `output_lines` is a list of debug strings.
-    """
 
+    If `telemetry` is a list, one dict per master/pricing round is appended to it. The dual stabilization used in the
+    column generation is set by `DUAL_STABILIZATION['leximin']`.
+    If `certificates` is a list, the value reached at every fixing level and a certified upper bound on that level's
+    optimum are appended to it. A level whose gap is within OPT_GAP_BUDGET is fixed without reaching EPS; once
+    OPT_TIME_BUDGET has passed, all remaining probabilities are fixed at the current level.
+    If `initial_committees` (feasible committees, e.g. of an earlier solution) are given, the column generation starts
+    from them instead of from a multiplicative-weights phase. A pricing ILP and its agent variables from
+    `_setup_committee_generation` can be reused by passing them as `committee_generation`.
+    A maximin (or Nash) solution of the same instance can be passed as `seed` = (committees, probabilities, weights):
+    its committees replace the multiplicative-weights phase, and if the maximin dual weights y_e are given (as filled
+    in by `find_opt_distribution_maximin`; None for Nash), the first level is fixed from them without solving an LP.
+    With ASYNC_PRICING_WORKERS > 0, pricing threads supply panels while the master re-solves (see `_AsyncPricing`).
+    """
+    import gurobipy as grb
+    start_time = time()
     output_lines = ["Using leximin algorithm."]
     grb.setParam("OutputFlag", 0)
 
 
-    assert not check_same_address
-    households = None
+    households = _compute_households(columns_data, check_same_address_columns) if check_same_address else None
 
     # Set up an ILP `new_committee_model` that can be used for discovering new feasible committees maximizing some
     # sum of weights over the agents.
-    new_committee_model, agent_vars, infeasible = _setup_committee_generation(categories, people, number_people_wanted,
-                                                                  check_same_address, households)
+    if committee_generation is None:
+        new_committee_model, agent_vars, infeasible = _setup_committee_generation(categories, people,
+                                                                      number_people_wanted, check_same_address, households)
+    else:
+        (new_committee_model, agent_vars), infeasible = committee_generation[:2], False
+    if infeasible:
+        return None, None, output_lines
 
     # Start by finding some initial committees, guaranteed to cover every agent that can be covered by some committee
-    committees: Set[FrozenSet[str]]  # set of feasible committees, add more over time
+    committees: _PanelStore  # set of feasible committees, add more over time
     covered_agents: FrozenSet[str]  # all agent ids for agents that can actually be included
-    committees, covered_agents, new_output_lines = _generate_initial_committees(new_committee_model, agent_vars,
-                                                                                3 * len(people))
+    if seed is not None:
+        initial_committees = list(initial_committees or ()) + list(seed[0])
+    committees, covered_agents, new_output_lines = _generate_initial_committees(
+        new_committee_model, agent_vars, 3 * len(people) if initial_committees is None else 0,
+        initial_committees or ())
     output_lines += new_output_lines
 
     # Over the course of the algorithm, the selection probabilities of more and more agents get fixed to a certain value
-    fixed_probabilities: Dict[str, float] = {}
+    # (starting with agents that presolve excluded from all committees, whose probability is 0)
+    fixed_probabilities: Dict[str, float] = {id: 0. for id in people if id not in covered_agents}
+    level = 0
+    if seed is not None and seed[2] is not None:
+        level = _fix_level_from_seed(seed, fixed_probabilities, committees, new_committee_model, agent_vars,
+                                     certificates, start_time, output_lines)
 
     reduction_counter = 0
 
+    pricer = (_GreedyPricer(categories, people, number_people_wanted, agent_vars, households)
+              if HEURISTIC_PRICING == 1 else None)
+    stabilization = DUAL_STABILIZATION.get('leximin')
+    rounds = 0
+    mispricings = 0
+    greedy_rounds = 0
+    stopped = None
+    pricing = (_AsyncPricing(ASYNC_PRICING_WORKERS, categories, people, number_people_wanted, check_same_address,
+                             households) if ASYNC_PRICING_WORKERS > 0 else None)
+
     # The outer loop maximizes the minimum of all unfixed probabilities while satisfying the fixed probabilities.
     # In each iteration, at least one more probability is fixed, but often more than one.
-    while len(fixed_probabilities) < len(people):
+    while len(fixed_probabilities) < len(people) and stopped != 'time':
         print(f"Fixed {len(fixed_probabilities)}/{len(people)} probabilities.")
 
         dual_model, dual_agent_vars, dual_cap_var = _dual_leximin_stage(people, committees, fixed_probabilities)
+        # The stability center only makes sense for a fixed set of fixed probabilities, so reset it for every level.
+        center = None
+        best_bound = math.inf
+        box = STABILIZATION_BOX
         # In the inner loop, there is a column generation for maximizing the minimum of all unfixed probabilities
         while True:
             """The primal LP being solved by column generation, with a variable x_P for each feasible panel P:
@@ -269,6 +1062,11 @@ def find_opt_distribution_leximin(categories, people,columns_data, number_people
                      Σ_{i not in fixed_probabilities} yᵢ = 1
                      ŷ, yᵢ ≥ 0                                     ∀ i
             """
+            if stabilization == 'boxstep' and center is not None:
+                # Only the yᵢ of unfixed agents live on the simplex; the others are left unbounded so that an
+                # unbounded dual still signals that the fixed probabilities cannot be satisfied.
+                _set_dual_box({person: var for person, var in dual_agent_vars.items()
+                               if person not in fixed_probabilities}, center, box, "LB", "UB")
             dual_model.optimize()
             if dual_model.status != grb.GRB.OPTIMAL:
                 # In theory, the LP is feasible in the first iterations, and we only add constraints (by fixing
@@ -286,19 +1084,93 @@ def find_opt_distribution_leximin(categories, people,columns_data, number_people
 
             # Find the panel P for which Σ_{i ∈ P} yᵢ is largest, i.e., for which Σ_{i ∈ P} yᵢ ≤ ŷ is tightest
             agent_weights = {person: agent_var.x for person, agent_var in dual_agent_vars.items()}
-            new_committee_model.objective = mip.xsum(agent_weights[person] * agent_vars[person] for person in people)
-            new_committee_model.optimize()
-            new_set = _ilp_results_to_committee(agent_vars)  # panel P
-            value = new_committee_model.objective_value  # Σ_{i ∈ P} yᵢ
-
             upper = dual_cap_var.x  # ŷ
             dual_obj = dual_model.objVal  # ŷ - Σ_{i in fixed_probabilities} fixed_probabilities[i] * yᵢ
+            rounds += 1
 
-            output_lines.append(_print(f"Maximin is at most {dual_obj - upper + value:.2%}, can do {dual_obj:.2%} with "
-                                       f"{len(committees)} committees. Gap {value - upper:.2%}."))
-            if value <= upper + EPS:
+            # Panels violating the dual found by the asynchronous pricing threads are added right away; probabilities
+            # are only fixed after a synchronous pricing round below.
+            new_sets = _async_columns(pricing, agent_weights, upper + EPS, committees, start_time)
+            if len(new_sets) > 0:
+                for new_set in new_sets:
+                    committees.add(new_set)
+                    dual_model.addConstr(grb.quicksum(dual_agent_vars[id] for id in new_set) <= dual_cap_var)
+                _record_round(telemetry, 'leximin', stabilization, rounds, len(committees), dual_obj, best_bound, False)
+                output_lines.append(_print(f"Asynchronous pricing found {len(new_sets)} violated panels, can do "
+                                           f"{dual_obj:.2%} with {len(committees)} committees."))
+                continue
+
+            # A panel found by the greedy pricer that violates the dual is added without solving the pricing ILP.
+            # Its value is no maximum, so it gives no bound and cannot end the column generation.
+            new_set = _greedy_column(pricer, committees, agent_weights, upper + EPS, start_time)
+            greedy = new_set is not None
+            if greedy:
+                greedy_rounds += 1
+                value = sum(agent_weights[id] for id in new_set)
+                mispriced = False
+            else:
+                # With Wentges smoothing, price against a point between the stability center and the current duals
+                # first. For any y with Σ_{i not in fixed_probabilities} yᵢ = 1,
+                # max_P Σ_{i ∈ P} yᵢ - Σ_i fixed_probabilities[i] yᵢ is an upper bound on the primal, which is how the
+                # stability center is chosen.
+                if stabilization == 'wentges':
+                    pricing_weights = _wentges_separation_point(center, agent_weights, STABILIZATION_ALPHA)
+                else:
+                    pricing_weights = agent_weights
+                new_set = _price_committee(new_committee_model, agent_vars, pricing_weights)  # panel P
+                fixed_weight = sum(fixed_probabilities[person] * pricing_weights[person]
+                                   for person in fixed_probabilities)
+                center, best_bound = _update_stability_center(center, best_bound, pricing_weights,
+                                                              sum(pricing_weights[id] for id in new_set) - fixed_weight)
+                value = sum(agent_weights[id] for id in new_set)  # Σ_{i ∈ P} yᵢ
+                mispriced = pricing_weights is not agent_weights and value <= upper + EPS
+            if mispriced:
+                # The smoothed point did not yield a panel violating the current dual, so price at the duals themselves.
+                # Fixing probabilities below relies on this unsmoothed check, so correctness is unaffected.
+                mispricings += 1
+                new_set = _price_committee(new_committee_model, agent_vars, agent_weights)
+                value = sum(agent_weights[id] for id in new_set)
+                fixed_weight = sum(fixed_probabilities[person] * agent_weights[person]
+                                   for person in fixed_probabilities)
+                center, best_bound = _update_stability_center(center, best_bound, agent_weights, value - fixed_weight)
+            _record_round(telemetry, 'leximin', stabilization, rounds, len(committees), dual_obj, best_bound,
+                          mispriced, greedy)
+
+            if greedy:
+                output_lines.append(_print(f"Greedy pricing found a violated panel, can do {dual_obj:.2%} with "
+                                           f"{len(committees)} committees."))
+            else:
+                output_lines.append(_print(f"Maximin is at most {dual_obj - upper + value:.2%}, can do {dual_obj:.2%} "
+                                           f"with {len(committees)} committees. Gap {value - upper:.2%}."))
+            # Under box-step, ŷ - Σ fixed_probabilities[i] yᵢ is not yet achieved by the panels, so the gap budget
+            # does not apply.
+            stopped = None if value <= upper + EPS else _opt_stop_reason(
+                start_time, (best_bound - dual_obj) / best_bound if stabilization != 'boxstep' and best_bound > 0
+                else math.inf)
+            if stopped == 'time':
+                # Out of time: the panels support every unfixed probability being at least the current value (the
+                # restricted primal achieves it), so fix all of them there and stop.
+                for person in people:
+                    if person not in fixed_probabilities:
+                        fixed_probabilities[person] = max(0, dual_obj)
+                _record_certificate(certificates, 'leximin', level, dual_obj, max(dual_obj, best_bound), stopped,
+                                    start_time)
+                output_lines.append(_print(f"Stopped early (time budget) at level {level}: {dual_obj:.4%}, optimum "
+                                           f"at most {best_bound:.4%}."))
+                break
+            if value <= upper + EPS and stabilization == 'boxstep' and center is not None and _dual_box_is_binding(
+                    {person: agent_weights[person] for person in people if person not in fixed_probabilities},
+                    center, box):
+                # The duals are only optimal within the box, so they cannot be used for fixing probabilities yet.
+                box *= 2
+                continue
+            if value <= upper + EPS or stopped == 'gap':
                 # Within numeric tolerance, the panels in `committees` are enough to constrain the dual, i.e., they are
-                # enough to support an optimal primal solution.
+                # enough to support an optimal primal solution. (Within the gap budget, they support a near-optimal
+                # one: fixing at the current value stays feasible, and `best_bound` certifies the loss.)
+                _record_certificate(certificates, 'leximin', level, dual_obj, max(dual_obj, best_bound), stopped,
+                                    start_time)
+                level += 1
                 for person, agent_weight in agent_weights.items():
                     if agent_weight > EPS and person not in fixed_probabilities:
                         # `agent_weight` is the dual variable yᵢ of the constraint "Σ_{P : i ∈ P} x_P ≥ z" for
@@ -308,6 +1180,17 @@ def find_opt_distribution_leximin(categories, people,columns_data, number_people
                         # [1] Theorem 3.3 in: Renato Pelessoni. Some remarks on the use of the strict complementarity in
                         # checking coherence and extending coherent probabilities. 1998.
                         fixed_probabilities[person] = max(0, dual_obj)
+                unfixed = [person for person in people if person not in fixed_probabilities]
+                if len(unfixed) > 0 and _opt_stop_reason(start_time, math.inf) == 'time':
+                    # Out of time between levels: the panels give every unfixed agent at least the current value. As
+                    # the probabilities sum to k, the next level is at most the average of what is left.
+                    stopped = 'time'
+                    _record_certificate(certificates, 'leximin', level, dual_obj,
+                                        (number_people_wanted - sum(fixed_probabilities.values())) / len(unfixed),
+                                        stopped, start_time)
+                    for person in unfixed:
+                        fixed_probabilities[person] = max(0, dual_obj)
+                    output_lines.append(_print(f"Stopped early (time budget) after level {level - 1}."))
                 break
             else:
                 # Given that Σ_{i ∈ P} yᵢ > ŷ, the current solution to `dual_model` is not yet a solution to the dual.
@@ -316,46 +1199,49 @@ def find_opt_distribution_leximin(categories, people,columns_data, number_people
                 committees.add(new_set)
                 dual_model.addConstr(grb.quicksum(dual_agent_vars[id] for id in new_set) <= dual_cap_var)
 
+    if pricing is not None:
+        pricing.close()
+    output_lines.append(_print(f"Column generation took {rounds} rounds ({greedy_rounds} priced greedily, "
+                               f"{mispricings} mispricings, stabilization: {stabilization})."))
+
     # The previous algorithm computed the leximin selection probabilities of each agent and a set of panels such that
     # the selection probabilities can be obtained by randomizing over these panels. Here, such a randomization is found.
+    committee_list = list(committees)
+    fixed_agents = list(fixed_probabilities)
     primal = grb.Model()
-    # Variables for the output probabilities of the different panels
-    committee_vars = [primal.addVar(vtype=grb.GRB.CONTINUOUS, lb=0.) for _ in committees]
-    # To avoid numerical problems, we formally minimize the largest downward deviation from the fixed probabilities.
-    eps = primal.addVar(vtype=grb.GRB.CONTINUOUS, lb=0.)
-    primal.addConstr(grb.quicksum(committee_vars) == 1)  # Probabilities add up to 1
-    for person, prob in fixed_probabilities.items():
-        person_probability = grb.quicksum(comm_var for committee, comm_var in zip(committees, committee_vars)
-                                          if person in committee)
-        primal.addConstr(person_probability >= prob - eps)
-    primal.setObjective(eps, grb.GRB.MINIMIZE)
+    # Variables for the output probabilities of the different panels, followed by a variable eps: to avoid numerical
+    # problems, we formally minimize the largest downward deviation from the fixed probabilities.
+    variables = primal.addMVar(len(committee_list) + 1, vtype=grb.GRB.CONTINUOUS, lb=0.)
+    # Probabilities add up to 1
+    primal.addMConstr(sp.csr_matrix(np.append(np.ones(len(committee_list)), 0.)), variables, '=', np.array([1.]))
+    # Σ_{P ∋ i} x_P + eps ≥ fixed_probabilities[i] for all i at once
+    person_matrix = sp.hstack([_incidence_matrix(committee_list, fixed_agents),
+                               sp.csr_matrix(np.ones((len(fixed_agents), 1)))]).tocsr()
+    primal.addMConstr(person_matrix, variables, '>',
+                      np.array([fixed_probabilities[person] for person in fixed_agents]))
+    primal.setObjective(np.append(np.zeros(len(committee_list)), 1.) @ variables, grb.GRB.MINIMIZE)
     primal.optimize()
 
     # Bound variables between 0 and 1 and renormalize, because np.random.choice is sensitive to small deviations here
-    probabilities = np.array([comm_var.x for comm_var in committee_vars]).clip(0, 1)
+    probabilities = variables.X[:-1].clip(0, 1)
     probabilities = list(probabilities / sum(probabilities))
 
-    return list(committees), probabilities, output_lines
+    return committee_list, probabilities, output_lines
 
 
 
 def _find_maximin_primal(committees, covered_agents):
+    import mip
 
     model = mip.Model(sense=mip.MAXIMIZE)
 
     committee_variables = [model.add_var(var_type=mip.CONTINUOUS, lb=0., ub=1.) for _ in committees]
     model.add_constr(mip.xsum(committee_variables) == 1)
-    
-    agent_panel_variables = {id: [] for id in covered_agents}
-    for committee, var in zip(committees, committee_variables):
-        for id in committee:
-            if id in covered_agents:
-                agent_panel_variables[id].append(var)
 
     lower = model.add_var(var_type=mip.CONTINUOUS, lb=0., ub=1.)
-    
-    for agent_variables in agent_panel_variables.values():
-        model.add_constr(lower <= mip.xsum(agent_variables))
+
+    for agent_probability in _mip_row_sums(_incidence_matrix(committees, list(covered_agents)), committee_variables):
+        model.add_constr(lower <= agent_probability)
     
     model.objective = lower
     model.optimize()
@@ -368,31 +1254,101 @@ def _find_maximin_primal(committees, covered_agents):
     return probabilities
 
 
-def _find_maximin_primal_discrete(committees, covered_agents, discrete_number):
+def _softmax(logits):
+    weights = np.exp(logits - logits.max())
+    return weights / weights.sum()
+
+
+def _first_order_maximin(incidence, accuracy, probabilities=None, weights=None):
+    """Solves the maximin game max_p min_y yᵀ A p over the agent × committee incidence matrix A, with p a lottery over
+    the committees and y weights on the agents, by entropic mirror-prox (an extragradient multiplicative-weights method)
+    restarted from the averaged iterates whenever their duality gap halves. Only sparse products with A and Aᵀ are
+    needed. `probabilities` and `weights` warm-start the method (probabilities may be shorter than the number of
+    committees, for committees added since; those start at the mean probability).
+
+    Returns (probabilities, weights, lower, upper), where lower = min_i (A p)_i is achieved by the lottery and upper =
+    max_B Σ_{i ∈ B} y_i bounds the maximin value over the committees; upper - lower ≤ `accuracy` unless
+    FIRST_ORDER_MAX_ITERATIONS ran out first (then the pair with the smallest gap is returned).
+    """
+    incidence = sp.csr_matrix(incidence)
+    transpose = incidence.T.tocsr()
+    n, m = incidence.shape
+    if probabilities is None:
+        probabilities = np.full(m, 1. / m)
+    probabilities = np.concatenate([probabilities, np.full(m - len(probabilities), 1. / m)])
+    weights = np.full(n, 1. / n) if weights is None else np.asarray(weights, dtype=float)
+    log_p = np.log(probabilities / probabilities.sum() + 1e-12)
+    log_y = np.log(weights / weights.sum() + 1e-12)
+    p, y = _softmax(log_p), _softmax(log_y)
+    step = FIRST_ORDER_STEP
+
+    best = (math.inf, p, y, (incidence @ p).min(), (transpose @ y).max())
+    sum_p, sum_y, count = np.zeros(m), np.zeros(n), 0
+    restart_gap = math.inf
+    for iteration in range(1, FIRST_ORDER_MAX_ITERATIONS + 1):
+        # extrapolation step from (p, y), then the actual step from (p, y) with the gradients at the extrapolated point
+        p_half = _softmax(log_p + step * (transpose @ y))
+        y_half = _softmax(log_y - step * (incidence @ p))
+        log_p = log_p + step * (transpose @ y_half)
+        log_y = log_y - step * (incidence @ p_half)
+        log_p -= log_p.max()
+        log_y -= log_y.max()
+        p, y = _softmax(log_p), _softmax(log_y)
+        sum_p += p_half
+        sum_y += y_half
+        count += 1
+
+        if iteration % 20 == 0:
+            average_p, average_y = sum_p / count, sum_y / count
+            lower, upper = (incidence @ average_p).min(), (transpose @ average_y).max()
+            if upper - lower < best[0]:
+                best = (upper - lower, average_p, average_y, lower, upper)
+            if upper - lower <= accuracy:
+                break
+            if upper - lower <= restart_gap / 2:
+                restart_gap = upper - lower
+                log_p, log_y = np.log(average_p + 1e-300), np.log(average_y + 1e-300)
+                p, y = average_p, average_y
+                sum_p, sum_y, count = np.zeros(m), np.zeros(n), 0
+    return best[1], best[2], float(best[3]), float(best[4])
+
+
+def _prune_lottery(probabilities, mass):
+    """Sets the smallest probabilities to 0 as long as their sum stays below `mass` and renormalizes, which lowers no
+    marginal by more than `mass`. First-order methods leave a little probability on every committee otherwise."""
+    order = np.argsort(probabilities)
+    probabilities = probabilities.copy()
+    probabilities[order[np.cumsum(probabilities[order]) <= mass]] = 0.
+    return probabilities / probabilities.sum()
+
+
+def _find_maximin_primal_discrete(committees, covered_agents, discrete_number, start=None):
     """ finds uniform lottery that maximizes the minimum probability of any agent being selected by solving ILP.
         inputs: committees = list of committees in support of optimal unconstrained distribution
                 covered_agents = list of agents included on any committee in committees (should be all agents)
                 discrete_number = M, the number of panels over which you want a uniform lottery
+                start = optional panel counts summing to M, passed to the solver as initial solution
         outputs: vector of probabilities, one assigned to each committee (in order of committees list)
     """
+    import mip
     model = mip.Model(sense=mip.MAXIMIZE)
 
     committee_variables = [model.add_var(var_type=mip.INTEGER, lb=0., ub=mip.INF) for _ in committees]
     model.add_constr(mip.xsum(committee_variables) == discrete_number)
-    
-    agent_panel_variables = {id: [] for id in covered_agents}
-    for committee, var in zip(committees, committee_variables):
-        for id in committee:
-            if id in covered_agents:
-                agent_panel_variables[id].append(var)
 
     lower = model.add_var(var_type=mip.INTEGER, lb=0.)
 
-    for agent_variables in agent_panel_variables.values():
-        model.add_constr(lower <= mip.xsum(agent_variables))
+    # agents on the same panels have the same count, so one constraint per membership signature suffices
+    rows, _, _ = _aggregate_rows(_incidence_matrix(committees, list(covered_agents)))
+    for agent_count in _mip_row_sums(rows, committee_variables):
+        model.add_constr(lower <= agent_count)
 
     model.objective = lower
-    
+    if start is not None:
+        # the objective variable is part of the start as well, or the solver would take it as a solution of value 0
+        model.start = ([(var, float(count)) for var, count in zip(committee_variables, start)]
+                       + [(lower, float((rows @ np.asarray(start, dtype=float)).min()))])
+
     model.optimize(max_seconds=1800)
 
     probabilities = [round(var.x) / discrete_number for var in committee_variables]
@@ -402,7 +1358,7 @@ def _find_maximin_primal_discrete(committees, covered_agents, discrete_number):
 
 
 
-def find_opt_distribution_maximin(categories, people, columns_data, number_people_wanted, check_same_address, check_same_address_columns):
+def find_opt_distribution_maximin(categories, people, columns_data, number_people_wanted, check_same_address, check_same_address_columns, telemetry=None, certificates=None, initial_committees=None, committee_generation=None, duals=None, initial_probabilities=None, initial_duals=None):
     """Find a distribution over feasible committees that maximizes the minimum probability of an agent being selected.
 
         Arguments follow the pattern of `find_random_sample`.
@@ -415,23 +1371,44 @@ def find_opt_distribution_maximin(categories, people, columns_data, number_peopl
                 should be selected.
             `output_lines` is a list of debug strings.
             boolean flag denoting infeasibility
+
+        If `telemetry` is a list, one dict per master/pricing round is appended to it. The dual stabilization used in
+        the column generation is set by `DUAL_STABILIZATION['maximin']`.
+        If `certificates` is a list, the achieved maximin value and a certified upper bound on the optimum are appended
+        to it. With OPT_TIME_BUDGET or OPT_GAP_BUDGET set, the column generation may stop before reaching EPS.
+        If `initial_committees` (feasible committees, e.g. of an earlier solution) are given, the column generation
+        starts from them instead of from a multiplicative-weights phase. A pricing ILP and its agent variables from
+        `_setup_committee_generation` can be reused by passing them as `committee_generation`.
+        If `duals` is a dict and the column generation converged, the final weights y_e are stored in it (they seed
+        `find_opt_distribution_leximin`).
+        The lottery over `initial_committees` and the weights y_e of an earlier solution can be passed as
+        `initial_probabilities` and `initial_duals` (a dict, as filled in `duals`). The first-order master starts from
+        them; the weights also become the first stability center, and their Lagrangian bound may certify the
+        surviving lottery at once. (The LP master is re-solved from scratch, as python-mip cannot warm-start it from a
+        dual point.)
+        With ASYNC_PRICING_WORKERS > 0, pricing threads supply committees while the master re-solves (see
+        `_AsyncPricing`).
     """
+    import mip
+    start_time = time()
     output_lines = [_print("Using maximin algorithm.")]
 
-    assert not check_same_address
-    households = None
+    households = _compute_households(columns_data, check_same_address_columns) if check_same_address else None
 
     # Set up an ILP `new_committee_model` that can be used for discovering new feasible committees maximizing some
     # sum of weights over the agents.
-    new_committee_model, agent_vars, infeasible = _setup_committee_generation(categories, people, number_people_wanted,
-                                                                  check_same_address, households)
+    if committee_generation is None:
+        new_committee_model, agent_vars, infeasible = _setup_committee_generation(categories, people,
+                                                                      number_people_wanted, check_same_address, households)
+    else:
+        (new_committee_model, agent_vars), infeasible = committee_generation[:2], False
     if infeasible==True:
         return None,None,None,None,True
     # Start by finding some initial committees, guaranteed to cover every agent that can be covered by some committee
-    committees: Set[FrozenSet[str]]  # set of feasible committees, add more over time
+    committees: _PanelStore  # set of feasible committees, add more over time
     covered_agents: FrozenSet[str]  # all agent ids for agents that can actually be included
-    committees, covered_agents, new_output_lines = _generate_initial_committees(new_committee_model, agent_vars,
-                                                                                len(people))
+    committees, covered_agents, new_output_lines = _generate_initial_committees(
+        new_committee_model, agent_vars, len(people) if initial_committees is None else 0, initial_committees or ())
     output_lines += new_output_lines
 
     # The incremental model is an LP with a variable y_e for each entitlement e and one more variable z.
@@ -445,51 +1422,164 @@ def find_opt_distribution_maximin(categories, people, columns_data, number_peopl
     # At any point in time, constraint (*) is only enforced for the committees in `committees`. By linear-programming
     # duality, if the optimal solution with these reduced constraints satisfies all possible constraints, the committees
     # in `committees` are enough to find the maximin distribution among them.
-    incremental_model = mip.Model(sense=mip.MINIMIZE, solver_name=mip.GUROBI)
-    incremental_model.verbose = debug
-
-    upper_bound = incremental_model.add_var(var_type=mip.CONTINUOUS, lb=0., ub=mip.INF)  # variable z
-    # variables y_e
-    incr_agent_vars = {id: incremental_model.add_var(var_type=mip.CONTINUOUS, lb=0., ub=1.) for id in covered_agents}
+    # With MAXIMIN_MASTER 'first_order', the LP is not built; instead, its saddle-point form is solved afresh (warm-
+    # started) in every round by `_first_order_maximin`, which also gives the maximin lottery over `committees`.
+    agents = list(covered_agents)
+    incremental_model = None
+    master_probabilities = _initial_lottery(committees, initial_committees or (), initial_probabilities)
+    master_weights = None
+    if MAXIMIN_MASTER == 'lp':
+        incremental_model = mip.Model(sense=mip.MINIMIZE, solver_name=mip.GUROBI)
+        incremental_model.verbose = debug
+
+        upper_bound = incremental_model.add_var(var_type=mip.CONTINUOUS, lb=0., ub=mip.INF)  # variable z
+        # variables y_e
+        incr_agent_vars = {id: incremental_model.add_var(var_type=mip.CONTINUOUS, lb=0., ub=1.) for id in agents}
+
+        # Σ_e y_e = 1
+        incremental_model.add_constr(mip.xsum(incr_agent_vars.values()) == 1)
+        # minimize z
+        incremental_model.objective = upper_bound
 
-    # Σ_e y_e = 1
-    incremental_model.add_constr(mip.xsum(incr_agent_vars.values()) == 1)
-    # minimize z
-    incremental_model.objective = upper_bound
-
-    for committee in committees:
-        committee_sum = mip.xsum([incr_agent_vars[id] for id in committee])
         # Σ_{i ∈ B} y_{e(i)} ≤ z   ∀ B ∈ `committees`
-        incremental_model.add_constr(committee_sum <= upper_bound)
+        for committee_sum in _mip_row_sums(_incidence_matrix(committees, agents).T, list(incr_agent_vars.values())):
+            incremental_model.add_constr(committee_sum <= upper_bound)
+
+    # Dual stabilization. Since Σ_e y_e = 1, every y_e gives the Lagrangian bound max_B Σ_{i ∈ B} y_{e(i)} on the maximin
+    # value. The stability center is the y_e with the lowest such bound found so far. 'wentges' prices against a convex
+    # combination of the center and the current y_e, 'boxstep' keeps y_e in a box around the center.
+    stabilization = DUAL_STABILIZATION.get('maximin')
+    if stabilization == 'boxstep' and incremental_model is None:
+        output_lines.append(_print("Box-step stabilization needs the LP master, continuing without stabilization."))
+        stabilization = None
+    center = None
+    best_bound = math.inf
+    if initial_duals is not None and sum(initial_duals.get(id, 0.) for id in agents) > 0:
+        # the earlier weights, renormalized over the agents that can still be selected, give a Lagrangian bound
+        total = sum(initial_duals.get(id, 0.) for id in agents)
+        initial_weights = {id: initial_duals.get(id, 0.) / total for id in agents}
+        center, best_bound = initial_weights, sum(initial_weights[id] for id in
+                                                  _price_committee(new_committee_model, agent_vars, initial_weights))
+        master_weights = np.array([initial_weights[id] for id in agents])
+        output_lines.append(_print(f"The earlier duals bound the maximin by {best_bound:.2%}."))
+    box = STABILIZATION_BOX
+    rounds = 0
+    mispricings = 0
+    pricer = (_GreedyPricer(categories, people, number_people_wanted, agent_vars, households)
+              if HEURISTIC_PRICING == 1 else None)
+    greedy_rounds = 0
+    pricing = (_AsyncPricing(ASYNC_PRICING_WORKERS, categories, people, number_people_wanted, check_same_address,
+                             households) if ASYNC_PRICING_WORKERS > 0 else None)
 
     while True:
-        status = incremental_model.optimize()
-        assert status == mip.OptimizationStatus.OPTIMAL
-
-        entitlement_weights = {id: incr_agent_vars[id].x for id in covered_agents}  # currently optimal values for y_e
-        upper = upper_bound.x  # currently optimal value for z
-
-        # For these fixed y_e, find the feasible committee B with maximal Σ_{i ∈ B} y_{e(i)}.
-        new_committee_model.objective = mip.xsum(entitlement_weights[id] * agent_vars[id] for id in covered_agents)
-        new_committee_model.optimize()
-        new_set = _ilp_results_to_committee(agent_vars)
-        value = sum(entitlement_weights[id] for id in new_set)
+        if incremental_model is None:
+            incidence = committees.incidence(agents)
+            master_probabilities, master_weights, _, upper = _first_order_maximin(
+                incidence, FIRST_ORDER_ACCURACY, master_probabilities, master_weights)
+            entitlement_weights = dict(zip(agents, master_weights))
+            # upper only bounds the master's value; convergence is judged on what the (pruned) lottery achieves
+            lower = float((incidence @ _prune_lottery(master_probabilities, FIRST_ORDER_ACCURACY / 2)).min())
+        else:
+            if stabilization == 'boxstep' and center is not None:
+                _set_dual_box(incr_agent_vars, center, box, "lb", "ub")
+            status = incremental_model.optimize()
+            assert status == mip.OptimizationStatus.OPTIMAL
+
+            entitlement_weights = {id: incr_agent_vars[id].x for id in covered_agents}  # currently optimal values for y_e
+            upper = upper_bound.x  # currently optimal value for z
+            lower = upper  # which the committees achieve, as the LP is solved exactly
+        rounds += 1
+
+        # With asynchronous pricing, take the committees violating Σ_{i ∈ B} y_{e(i)} ≤ z that the pricing threads found
+        # and re-solve; only once they find none, price synchronously below.
+        new_sets = _async_columns(pricing, entitlement_weights, upper + EPS, committees, start_time)
+        if len(new_sets) > 0:
+            for new_set in new_sets:
+                committees.add(new_set)
+                if incremental_model is not None:
+                    incremental_model.add_constr(mip.xsum(incr_agent_vars[id] for id in new_set) <= upper_bound)
+            _record_round(telemetry, 'maximin', stabilization, rounds, len(committees), upper, best_bound, False)
+            output_lines.append(_print(f"Asynchronous pricing found {len(new_sets)} violated committees, can do "
+                                       f"{upper:.2%} with {len(committees)} committees."))
+            continue
 
-        output_lines.append(_print(f"Maximin is at most {value:.2%}, can do {upper:.2%} with {len(committees)} "
-                                   f"committees. Gap {value - upper:.2%}{'≤' if value-upper <= EPS else '>'}{EPS:%}."))
-        if value <= upper + EPS:
+        # A committee found by the greedy pricer that violates Σ_{i ∈ B} y_{e(i)} ≤ z is added right away. Otherwise,
+        # for these fixed y_e, find the feasible committee B with maximal Σ_{i ∈ B} y_{e(i)}.
+        new_set = _greedy_column(pricer, committees, entitlement_weights, upper + EPS, start_time)
+        greedy = new_set is not None
+        if greedy:
+            greedy_rounds += 1
+            value = sum(entitlement_weights[id] for id in new_set)
+            mispriced = False
+        else:
+            if stabilization == 'wentges':
+                pricing_weights = _wentges_separation_point(center, entitlement_weights, STABILIZATION_ALPHA)
+            else:
+                pricing_weights = entitlement_weights
+            new_set = _price_committee(new_committee_model, agent_vars, pricing_weights)
+            center, best_bound = _update_stability_center(center, best_bound, pricing_weights,
+                                                          sum(pricing_weights[id] for id in new_set))
+            value = sum(entitlement_weights[id] for id in new_set)
+            mispriced = pricing_weights is not entitlement_weights and value <= upper + EPS
+        if mispriced:
+            # The committee found at the smoothed point does not violate the current y_e. Price at y_e itself.
+            mispricings += 1
+            new_set = _price_committee(new_committee_model, agent_vars, entitlement_weights)
+            value = sum(entitlement_weights[id] for id in new_set)
+            center, best_bound = _update_stability_center(center, best_bound, entitlement_weights, value)
+        _record_round(telemetry, 'maximin', stabilization, rounds, len(committees), upper, best_bound, mispriced,
+                      greedy)
+
+        if greedy:
+            output_lines.append(_print(f"Greedy pricing found a violated committee, can do {upper:.2%} with "
+                                       f"{len(committees)} committees."))
+        else:
+            output_lines.append(_print(f"Maximin is at most {value:.2%}, can do {lower:.2%} with {len(committees)} "
+                                       f"committees. Gap {value - lower:.2%}{'≤' if value-lower <= EPS else '>'}"
+                                       f"{EPS:%}."))
+        converged = value <= lower + EPS or (stabilization != 'boxstep' and best_bound <= lower + EPS)
+        if converged and stabilization == 'boxstep' and center is not None:
+            # y_e is only optimal within the box, and z need not be achievable by the committees yet.
+            converged = not _dual_box_is_binding(entitlement_weights, center, box)
+            if not converged:
+                box *= 2
+        # Under box-step, z is not yet achieved by the committees, so only the time budget applies.
+        stopped = None if converged else _opt_stop_reason(start_time, (best_bound - lower) / best_bound
+                                                          if stabilization != 'boxstep' else math.inf)
+        if not converged and stopped is None and value <= upper + EPS:
+            continue
+        if converged or stopped is not None:
             # No feasible committee B violates Σ_{i ∈ B} y_{e(i)} ≤ z (at least up to EPS, to prevent rounding errors).
-            # Thus, we have enough committees.
+            # Thus, we have enough committees. (With stabilization, it suffices that the best Lagrangian bound matches
+            # what the committees already achieve.) If a budget ran out instead, the best lottery over the committees
+            # found so far is returned, and `best_bound` certifies how far it is from optimal.
+            output_lines.append(_print(f"Column generation took {rounds} rounds ({greedy_rounds} priced greedily, "
+                                       f"{mispricings} mispricings, stabilization: {stabilization})."))
             committee_list = list(committees)
-            probabilities = _find_maximin_primal(committee_list, covered_agents)
-           
+            if incremental_model is None:
+                probabilities = list(_prune_lottery(master_probabilities, FIRST_ORDER_ACCURACY / 2))
+            else:
+                probabilities = _find_maximin_primal(committee_list, covered_agents)
+            achieved = min(sum(p for committee, p in zip(committee_list, probabilities) if id in committee)
+                           for id in covered_agents)
+            if stopped is not None:
+                output_lines.append(_print(f"Stopped early ({stopped} budget): maximin {achieved:.4%}, optimum at most "
+                                           f"{best_bound:.4%}."))
+            _record_certificate(certificates, 'maximin', 0, achieved, max(achieved, best_bound), stopped,
+                                start_time)
+            if duals is not None and stopped is None:
+                duals.update(entitlement_weights)
+            if pricing is not None:
+                pricing.close()
+
             return committee_list, probabilities, output_lines, False
         
         else:
             # Some committee B violates Σ_{i ∈ B} y_{e(i)} ≤ z. We add B to `committees` and recurse.
             assert new_set not in committees
             committees.add(new_set)
-            incremental_model.add_constr(mip.xsum(incr_agent_vars[id] for id in new_set) <= upper_bound)
+            if incremental_model is not None:
+                incremental_model.add_constr(mip.xsum(incr_agent_vars[id] for id in new_set) <= upper_bound)
 
             # Heuristic for better speed in practice:
             # Because optimizing `incremental_model` takes a long time, we would like to get multiple committees out
@@ -509,46 +1599,34 @@ def find_opt_distribution_maximin(categories, people, columns_data, number_peopl
                     entitlement_weights[id] /= sum_weights
                 upper /= sum_weights
 
-                new_committee_model.objective = mip.xsum(entitlement_weights[id] * agent_vars[id]
-                                                         for id in covered_agents)
-                new_committee_model.optimize()
-                new_set = _ilp_results_to_committee(agent_vars)
+                new_set = _greedy_column(pricer, committees, entitlement_weights, upper + EPS, start_time)
+                if new_set is None:
+                    new_set = _price_committee(new_committee_model, agent_vars, entitlement_weights)
                 value = sum(entitlement_weights[id] for id in new_set)
                 if value <= upper + EPS or new_set in committees:
                     break
                 else:
                     committees.add(new_set)
-                    incremental_model.add_constr(mip.xsum(incr_agent_vars[id] for id in new_set) <= upper_bound)
+                    if incremental_model is not None:
+                        incremental_model.add_constr(mip.xsum(incr_agent_vars[id] for id in new_set) <= upper_bound)
                 counter += 1
             if counter > 0:
                 print(f"Heuristic successfully generated {counter} additional committees.")
 
 
 def Objrule(model):
-  return pyo.quicksum(log(model.marginals[i]) for i in model.marginals)
+  import pyomo.environ as pyo
+  return pyo.quicksum(pyo.log(model.marginals[i]) for i in model.marginals)
 
 
 
 def _define_entitlements(covered_agents):
     entitlements = list(covered_agents)
-    contributes_to_entitlement = {}
-    for id in covered_agents:
-        contributes_to_entitlement[id] = entitlements.index(id)
+    contributes_to_entitlement = {id: index for index, id in enumerate(entitlements)}
 
     return entitlements, contributes_to_entitlement
 
 
-def _committees_to_matrix(committees, entitlements,
-                          contributes_to_entitlement):
-    columns = []
-    for committee in committees:
-        column = [0 for _ in entitlements]
-        for id in committee:
-            column[contributes_to_entitlement[id]] += 1
-        columns.append(np.array(column))
-    return np.column_stack(columns)
-
-
 
 def find_rounded_distribution_nash(committees, covered_agents, discrete_number):
     """ finds uniform lottery that maximizes the geometric mean of agents' marginals. does so via Baron solver, implemented with pyomo.
@@ -557,6 +1635,8 @@ def find_rounded_distribution_nash(committees, covered_agents, discrete_number):
                 discrete_number = M, the number of panels over which you want a uniform lottery
         outputs: vector of probabilities, one assigned to each committee (in order of committees list)
     """
+    import pyomo.environ as pyo
+    from pyomo.opt import SolverFactory
 
     n_committees = len(committees)
     n_agents = len(list(covered_agents))
@@ -569,16 +1649,13 @@ def find_rounded_distribution_nash(committees, covered_agents, discrete_number):
     # must be a valid distribution over m panels
     model.committeedist_constr = pyo.Constraint(rule=(pyo.summation(model.probs)==discrete_number))
 
-    # agents' marginals must equal sum of probs of committees theyre on
+    # agents' marginals must equal sum of probs of committees theyre on (pyomo has no matrix interface, so read the
+    # committees of each agent off the rows of the incidence matrix)
     model.marginals_constrs = pyo.ConstraintList()
-    for agent in list(covered_agents):
-        expr = 0
-        for i in range(n_committees):
-            committee = list(committees)[i]
-            if agent in committee:
-                expr += model.probs[i]
-
-        model.marginals_constrs.add(model.marginals[agent]==expr)
+    matrix = _incidence_matrix(committees, list(covered_agents))
+    for agent in range(n_agents):
+        agent_committees = matrix.indices[matrix.indptr[agent]:matrix.indptr[agent + 1]]
+        model.marginals_constrs.add(model.marginals[agent] == sum(model.probs[i] for i in agent_committees))
 
     # objective is product of marginals
     model.obj = pyo.Objective(rule=Objrule,sense=pyo.maximize)
@@ -597,42 +1674,46 @@ def find_rounded_distribution_nash(committees, covered_agents, discrete_number):
     return probabilities_rounded
 
 # alternate function, which finds nash-optimal uniform lottery via ILP using gurobi solver
-def _find_nash_primal_discrete_gurobi(committees, covered_agents, discrete_number):
+def _find_nash_primal_discrete_gurobi(committees, covered_agents, discrete_number, start=None):
     """ finds uniform lottery that maximizes the geometric mean of agents' marginals. does so via Gurobi solver.
         inputs: committees = list of committees in support of optimal unconstrained distribution
                 covered_agents = list of agents included on any committee in committees (should be all agents)
                 discrete_number = M, the number of panels over which you want a uniform lottery
+                start = optional panel counts summing to M, passed to the solver as initial solution
         outputs: vector of probabilities, one assigned to each committee (in order of committees list)
     """
+    import gurobipy as grb
     model = grb.Model()
+    agents = list(covered_agents)
+
+    committee_variables = model.addMVar(len(committees), vtype=grb.GRB.INTEGER, lb=0.)
+    model.addMConstr(sp.csr_matrix(np.ones((1, len(committees)))), committee_variables, '=',
+                     np.array([discrete_number]))
+
+    # agents on the same panels have the same utility: one utility per membership signature, its log weighted by the
+    # number of agents sharing it
+    rows, multiplicities, _ = _aggregate_rows(_incidence_matrix(committees, agents))
+    agent_utils = model.addMVar(rows.shape[0], vtype=grb.GRB.INTEGER, lb=0., name="u")
+    agent_log_utils = model.addMVar(rows.shape[0], vtype=grb.GRB.CONTINUOUS, name="log_u")
+    # u_i - Σ_{P ∋ i} x_P = 0 for all signatures at once
+    model.addMConstr(sp.hstack([sp.identity(rows.shape[0]), -rows]).tocsr(),
+                     agent_utils.tolist() + committee_variables.tolist(), '=', np.zeros(rows.shape[0]))
+    for agent_util, agent_log_util in zip(agent_utils.tolist(), agent_log_utils.tolist()):
+        model.addGenConstrLog(agent_util, agent_log_util, options="FuncPieces=-1 FuncPieceError=0.0001")
+
+    model.setObjective(multiplicities.astype(float) @ agent_log_utils, grb.GRB.MAXIMIZE)
+    if start is not None:
+        committee_variables.Start = np.asarray(start, dtype=float)
 
-    committee_variables = [model.addVar(vtype=grb.GRB.INTEGER, lb=0.) for _ in committees]
-    model.addConstr(grb.quicksum(committee_variables) == discrete_number)
-    
-    agent_panel_variables = {id: [] for id in covered_agents}
-    for committee, var in zip(committees, committee_variables):
-        for id in committee:
-            if id in covered_agents:
-                agent_panel_variables[id].append(var)
-                
-    agent_utils = {id: model.addVar(vtype=grb.GRB.INTEGER, lb=0., name=f"u_{id}") for id in covered_agents}
-    agent_log_utils = {id: model.addVar(vtype=grb.GRB.CONTINUOUS, name=f"log_u_{id}") for id in covered_agents}
-    for id in covered_agents:
-        model.addConstr(agent_utils[id] == grb.quicksum(agent_panel_variables[id]))
-        model.addGenConstrLog(agent_utils[id], agent_log_utils[id], options="FuncPieces=-1 FuncPieceError=0.0001")
-
-    model.setObjective(grb.quicksum(agent_log_utils.values()), grb.GRB.MAXIMIZE)
-    model.write("test.lp")
-    
     model.setParam('MIPGap', 0.0005)
     model.setParam('TimeLimit', 7200)
     model.optimize()
 
-    probabilities = [round(var.x) / discrete_number for var in committee_variables]
+    probabilities = list(np.round(committee_variables.X) / discrete_number)
 
     return probabilities
 
-def find_opt_distribution_nash(categories, people, columns_data, number_people_wanted, check_same_address, check_same_address_columns):
+def find_opt_distribution_nash(categories, people, columns_data, number_people_wanted, check_same_address, check_same_address_columns, certificates=None, initial_committees=None, committee_generation=None, initial_probabilities=None):
     """Find a distribution over feasible committees that maximizes the so-called Nash welfare, i.e., the product of
     selection probabilities over all persons.
 
@@ -651,23 +1732,41 @@ def find_opt_distribution_nash(categories, people, columns_data, number_people_w
     log(Πᵢ pᵢ) = Σᵢ log(pᵢ). If some person/household i is not included in any feasible committee, their pᵢ is 0, and
     this sum is -∞. We will then try to maximize Σᵢ log(pᵢ) where i is restricted to range over persons/households that
     can possibly be included.
+
+    By concavity, for the current λ and every feasible committee P, Σᵢ log(pᵢ) is at most its current value plus
+    max_P ∂/∂λ_P - Σ_P λ_P ∂/∂λ_P (the KKT/gradient bound). If `certificates` is a list, the achieved log Nash welfare
+    and this bound are appended to it, and with OPT_TIME_BUDGET or OPT_GAP_BUDGET set (the gap being measured on the
+    geometric mean of the pᵢ), the iteration may stop before the EPS_NASH criterion holds.
+    If `initial_committees` (feasible committees, e.g. of an earlier solution) are given, the iteration starts from them
+    instead of from a multiplicative-weights phase, and the convex program is first solved from the lottery
+    `initial_probabilities` over them, if given. A pricing ILP and its agent variables from
+    `_setup_committee_generation` can be reused by passing them as `committee_generation`.
+    With ASYNC_PRICING_WORKERS > 0, pricing threads look for committees whose derivative exceeds all present ones while
+    the convex program is re-solved (see `_AsyncPricing`).
     """
+    import cvxpy as cp
+    start_time = time()
     output_lines = ["Using Nash algorithm."]
 
-    assert not check_same_address
-    households = None
+    households = _compute_households(columns_data, check_same_address_columns) if check_same_address else None
 
     # `new_committee_model` is an integer linear program (ILP) used for discovering new feasible committees.
     # We will use it many times, putting different weights on the inclusion of different agents to find many feasible
     # committees.
-    new_committee_model, agent_vars, infeasible = _setup_committee_generation(categories, people, number_people_wanted, check_same_address, households)
+    if committee_generation is None:
+        new_committee_model, agent_vars, infeasible = _setup_committee_generation(categories, people,
+                                                                      number_people_wanted, check_same_address, households)
+    else:
+        (new_committee_model, agent_vars), infeasible = committee_generation[:2], False
+    if infeasible:
+        return None, None, output_lines
 
     # Start by finding committees including every agent, and learn which agents cannot possibly be included.
-    committees: List[FrozenSet[str]]  # set of feasible committees, add more over time
+    committees: _PanelStore  # set of feasible committees, add more over time
     covered_agents: FrozenSet[str]  # all agent ids for agents that can actually be included
-    committee_set, covered_agents, new_output_lines = _generate_initial_committees(new_committee_model, agent_vars,
-                                                                                   2 * len(people))
-    committees = list(committee_set)
+    committees, covered_agents, new_output_lines = _generate_initial_committees(
+        new_committee_model, agent_vars, 2 * len(people) if initial_committees is None else 0,
+        initial_committees or ())
     output_lines += new_output_lines
 
     # Map the covered agents to indices in a list for easier matrix representation.
@@ -681,15 +1780,21 @@ def find_opt_distribution_nash(categories, people, columns_data, number_people_w
     # probability of outputting this committee is maximal. If this partial derivative is less than the maximal partial
     # derivative of any committee already in `committees`, the Karush-Kuhn-Tucker conditions (which are sufficient in
     # this case) imply that the distribution is optimal even with all other committees receiving probability 0.
-    start_lambdas = [1 / len(committees) for _ in committees]
+    start_lambdas = _initial_lottery(committees, initial_committees or (), initial_probabilities)
+    if start_lambdas is None:
+        start_lambdas = [1 / len(committees) for _ in range(len(committees))]
+    pricer = (_GreedyPricer(categories, people, number_people_wanted, agent_vars, households)
+              if HEURISTIC_PRICING == 1 else None)
+    pricing = (_AsyncPricing(ASYNC_PRICING_WORKERS, categories, people, number_people_wanted, check_same_address,
+                             households) if ASYNC_PRICING_WORKERS > 0 else None)
     while True:
         lambdas = cp.Variable(len(committees))  # probability of outputting a specific committee
         lambdas.value = start_lambdas
         # A is a binary matrix, whose (i,j)th entry indicates whether agent `feasible_agents[i]`
-        matrix = _committees_to_matrix(committees, entitlements, contributes_to_entitlement)
+        matrix = _incidence_matrix(committees, entitlements)
         assert matrix.shape == (len(entitlements), len(committees))
 
-        objective = cp.Maximize(cp.sum(cp.log(matrix * lambdas)))
+        objective = cp.Maximize(cp.sum(cp.log(matrix @ lambdas)))
         constraints = [0 <= lambdas, sum(lambdas) == 1]
         problem = cp.Problem(objective, constraints)
         # TODO: test relative performance of both solvers, see whether warm_start helps.
@@ -700,7 +1805,7 @@ def find_opt_distribution_nash(categories, people, columns_data, number_people_w
             # solver. But hope that SCS is more stable.
             output_lines.append(_print("Had to switch to ECOS solver."))
             nash_welfare = problem.solve(solver=cp.ECOS, warm_start=True)
-        scaled_welfare = nash_welfare - len(entitlements) * log(number_people_wanted / len(entitlements))
+        scaled_welfare = nash_welfare - len(entitlements) * math.log(number_people_wanted / len(entitlements))
         output_lines.append(_print(f"Scaled Nash welfare is now: {scaled_welfare}."))
 
         assert lambdas.value.shape == (len(committees),)
@@ -709,31 +1814,192 @@ def find_opt_distribution_nash(categories, people, columns_data, number_people_w
         assert (entitled_utilities > EPS2).all()
         entitled_reciprocals = 1 / entitled_utilities
         assert entitled_reciprocals.shape == (len(entitlements),)
-        differentials = entitled_reciprocals.dot(matrix)
+        differentials = matrix.T.dot(entitled_reciprocals)
         assert differentials.shape == (len(committees),)
 
-        obj = []
-        for id in covered_agents:
-            obj.append(entitled_reciprocals[contributes_to_entitlement[id]] * agent_vars[id])
-        new_committee_model.objective = mip.xsum(obj)
-        new_committee_model.optimize()
-
-        new_set = _ilp_results_to_committee(agent_vars)
+        # A committee found by the greedy pricer whose derivative exceeds all present ones is added without solving
+        # the ILP. Its derivative is no maximum, so it gives no bound on the Nash welfare.
+        reciprocal_weights = {id: entitled_reciprocals[contributes_to_entitlement[id]] for id in covered_agents}
+        # Committees found by the asynchronous pricing threads are added likewise; only once they find none, the
+        # committee is priced synchronously below.
+        new_sets = _async_columns(pricing, reciprocal_weights, differentials.max() + EPS_NASH, committees, start_time)
+        if len(new_sets) > 0:
+            for new_set in new_sets:
+                committees.add(new_set)
+            output_lines.append(_print(f"Asynchronous pricing found {len(new_sets)} committees."))
+            # the new committees start at probability 0 (ndarray.resize works in place and returns None)
+            start_lambdas = np.concatenate([lambdas.value, np.zeros(len(committees) - len(lambdas.value))])
+            continue
+        new_set = _greedy_column(pricer, committees, reciprocal_weights, differentials.max() + EPS_NASH, start_time)
+        exact = new_set is None
+        if exact:
+            new_set = _price_committee(new_committee_model, agent_vars, reciprocal_weights)
         value = sum(entitled_reciprocals[contributes_to_entitlement[id]] for id in new_set)
-        if value <= differentials.max() + EPS_NASH:
+
+        log_welfare = np.log(entitled_utilities).sum()
+        log_welfare_bound = log_welfare + value - lambdas.value.dot(differentials) if exact else math.inf
+        converged = value <= differentials.max() + EPS_NASH
+        stopped = None if converged else _opt_stop_reason(
+            start_time, math.exp((log_welfare_bound - log_welfare) / len(entitlements)) - 1)
+        if converged or stopped is not None:
             probabilities = np.array(lambdas.value).clip(0, 1)
             probabilities = list(probabilities / sum(probabilities))
-
-            return committees, probabilities, output_lines
+            if stopped is not None:
+                output_lines.append(_print(f"Stopped early ({stopped} budget): log Nash welfare {log_welfare:.4f}, "
+                                           f"optimum at most {log_welfare_bound:.4f}."))
+            _record_certificate(certificates, 'nash', 0, log_welfare, max(log_welfare, log_welfare_bound), stopped,
+                                start_time)
+            if pricing is not None:
+                pricing.close()
+
+            return list(committees), probabilities, output_lines
         else:
             print(value, differentials.max(), value - differentials.max())
             assert new_set not in committees
-            committees.append(new_set)
-            start_lambdas = np.array(lambdas.value).resize(len(committees))
+            committees.add(new_set)
+            # the new committees start at probability 0 (ndarray.resize works in place and returns None)
+            start_lambdas = np.concatenate([lambdas.value, np.zeros(len(committees) - len(lambdas.value))])
+
 
+def resolve_after_dropouts(objective, committees, dropouts, categories, people, number_people_wanted,
+                           columns_data=None, probabilities=None, duals=None):
+    """Updates an OPT distribution for `objective` ('leximin', 'maximin' or 'nash') after the respondents with ids in
+    `dropouts` left the pool. The panels in `committees` (of the earlier OPT solution) that contain no dropout are still
+    feasible, so the column generation is warm-started from them rather than rerun from scratch. If the earlier
+    `probabilities` (and, for maximin or a maximin-seeded leximin, the dual weights `duals` of the earlier solution, as
+    saved in ..._opt_duals.csv) are given, the master problem also starts from the surviving part of that lottery and
+    from those weights (see `_warm_started_opt`).
+
+    Returns (committees, probabilities, output_lines, remaining_people) for the pool without the dropouts.
+    """
+    dropouts = set(dropouts)
+    remaining_people = {id: person for id, person in people.items() if id not in dropouts}
+    survives = [dropouts.isdisjoint(committee) for committee in committees]
+    surviving = [frozenset(committee) for committee, ok in zip(committees, survives) if ok]
+    output_lines = [_print(f"{len(surviving)} of {len(committees)} panels survive {len(dropouts)} dropouts.")]
+    if probabilities is not None:
+        probabilities = [p for p, ok in zip(probabilities, survives) if ok]
+        output_lines.append(_print(f"The surviving panels carried {sum(probabilities):.2%} of the probability."))
+        probabilities = [p / sum(probabilities) for p in probabilities] if sum(probabilities) > 0 else None
+    if duals is not None:
+        duals = {id: weight for id, weight in duals.items() if id not in dropouts}
+
+    committees, probabilities, new_output_lines = _warm_started_opt(objective, categories, remaining_people,
+                                                                    number_people_wanted, surviving,
+                                                                    columns_data=columns_data,
+                                                                    initial_probabilities=probabilities,
+                                                                    initial_duals=duals)
+    if committees is None:
+        raise ValueError(f"The quotas cannot be satisfied without the {len(dropouts)} dropouts.")
+
+    return committees, probabilities, output_lines + new_output_lines, remaining_people
+
+
+def resolve_after_quota_edits(objective, committees, categories, new_categories, people, number_people_wanted,
+                              committee_generation=None, columns_data=None, households=None):
+    """Updates an OPT distribution for `objective` after the quotas changed from `categories` to `new_categories`. The
+    panels in `committees` (of the earlier OPT solution) that still satisfy the new quotas (and have at most one member
+    per household, with `households`) seed the column generation.
+    If the pricing ILP of the earlier solution is passed as `committee_generation` (model, agent variables, quota
+    matrix and households, as returned by `_committee_generation_for_size`), its quota rows are updated in place, and
+    presolved for its households, rather than building a new one.
+
+    Returns (committees, probabilities, output_lines).
+    """
+    output_lines = []
+    for feature in new_categories:
+        for value in new_categories[feature]:
+            old = categories.get(feature, {}).get(value, {"min": None, "max": None})
+            new = new_categories[feature][value]
+            if (old["min"], old["max"]) != (new["min"], new["max"]):
+                output_lines.append(_print(f"Quota {feature}={value} changed from [{old['min']}, {old['max']}] to "
+                                           f"[{new['min']}, {new['max']}]."))
+    feasible = _satisfies_quotas(committees, new_categories, people, number_people_wanted, households)
+    kept = [frozenset(committee) for committee, ok in zip(committees, feasible) if ok]
+    output_lines.append(_print(f"{len(kept)} of {len(committees)} panels satisfy the new quotas."))
+
+    if committee_generation is not None and _update_committee_generation(*committee_generation, new_categories,
+                                                                         people, number_people_wanted):
+        raise ValueError("The new quotas cannot be satisfied.")
+    committees, probabilities, new_output_lines = _warm_started_opt(objective, new_categories, people,
+                                                                    number_people_wanted, kept, committee_generation,
+                                                                    columns_data)
+    if committees is None:
+        raise ValueError("The new quotas cannot be satisfied.")
+
+    return committees, probabilities, output_lines + new_output_lines
+
+
+def _warm_started_opt(objective, categories, people, number_people_wanted, initial_committees,
+                      committee_generation=None, columns_data=None, initial_probabilities=None, initial_duals=None):
+    """Runs `find_opt_distribution_<objective>` from `initial_committees`, and from the lottery
+    `initial_probabilities` over them and the maximin dual weights `initial_duals`, if given: maximin and Nash start
+    their master problem from the lottery, maximin takes the weights as its first stability center, and leximin, given
+    both, gets them as its `seed` (the weights may then fix its first level at once). Returns (committees, probabilities,
+    output_lines), where `committees` is None if the quotas are infeasible. Households are respected if
+    `check_same_address` is set and `columns_data` is given.
+    """
+    same_address = check_same_address and columns_data is not None
+    if objective == 'leximin':
+        seed = None
+        if initial_probabilities is not None and initial_duals is not None:
+            seed = (initial_committees, initial_probabilities, initial_duals)
+        return find_opt_distribution_leximin(categories, people, columns_data, number_people_wanted, same_address,
+                                             check_same_address_columns, initial_committees=initial_committees,
+                                             committee_generation=committee_generation, seed=seed)
+    if objective == 'maximin':
+        return find_opt_distribution_maximin(categories, people, columns_data, number_people_wanted, same_address,
+                                             check_same_address_columns, initial_committees=initial_committees,
+                                             committee_generation=committee_generation,
+                                             initial_probabilities=initial_probabilities,
+                                             initial_duals=initial_duals)[:3]
+    return find_opt_distribution_nash(categories, people, columns_data, number_people_wanted, same_address,
+                                      check_same_address_columns, initial_committees=initial_committees,
+                                      committee_generation=committee_generation,
+                                      initial_probabilities=initial_probabilities)
+
+
+def _edit_quotas(categories, quota_edits):
+    """Copy of `categories` with the quotas {(feature, value): (min, max)} of `quota_edits` replaced."""
+    edited = {feature: {value: dict(categories[feature][value]) for value in categories[feature]}
+              for feature in categories}
+    for (feature, value), (lower, upper) in quota_edits.items():
+        edited[feature][value]["min"] = lower
+        edited[feature][value]["max"] = upper
+    return edited
+
+
+def _panel_size_quotas(categories, number_people_wanted, size, quota_edits):
+    """Quotas for panels of `size` people: the quotas in `categories` (for panels of `number_people_wanted` people)
+    scaled proportionally, lower quotas rounded down and upper quotas rounded up, then overridden by the quotas
+    {(feature, value): (min, max)} of `quota_edits`."""
+    ratio = size / number_people_wanted
+    scaled = {feature: {value: dict(categories[feature][value],
+                                    min=math.floor(categories[feature][value]["min"] * ratio + EPS2),
+                                    max=min(math.ceil(categories[feature][value]["max"] * ratio - EPS2), size))
+                        for value in categories[feature]}
+              for feature in categories}
+    return _edit_quotas(scaled, quota_edits)
+
+
+def _committee_generation_for_size(committee_generation, categories, people, number_people_wanted, households=None):
+    """Pricing ILP for panels of `number_people_wanted` people under the quotas `categories` (and the household
+    constraints of `households`, if any). The ILP is built on the first call (`committee_generation` None); afterwards,
+    only the right-hand sides of its size and quota rows are changed, on the quota matrix of the pool and for the
+    households kept next to it. Returns (model, agent variables, quota matrix, households), or None if no such panel
+    exists.
+    """
+    if committee_generation is None:
+        quota_matrix = _quota_matrix(categories, people)
+        model, agent_vars, infeasible = _setup_committee_generation(categories, people, number_people_wanted,
+                                                                    households is not None, households, quota_matrix)
+        committee_generation = (model, agent_vars, quota_matrix, households)
+    else:
+        infeasible = _update_committee_generation(*committee_generation, categories, people, number_people_wanted)
+    return None if infeasible else committee_generation
 
 
-def build_dictionaries(categories_df,respondents_df):
+def build_dictionaries(categories_df,respondents_df,address_columns=()):
     """ reads data into dictionaries
          categories: categories["feature"]["value"] is a dictionary with keys "min", "max", "selected", "remaining".
          people: people["nationbuilder_id"] is dictionary mapping "feature" to "value" for a person.
@@ -750,7 +2016,9 @@ def build_dictionaries(categories_df,respondents_df):
 #for instance in ['sf_a_35', 'sf_b_20', 'sf_c_44', 'sf_d_40', 'sf_e_110', 'cca_75', 'hd_30', 'mass_24', 'nexus_170', 'obf_30']:
     categories = {}
     people = {}
-    columns_data = None # unset because never used
+    columns_data = None # only needed for the household constraints, from the columns in `address_columns`
+    if len(address_columns) > 0:
+        columns_data = respondents_df.set_index('nationbuilder_id')[list(address_columns)].to_dict('index')
 
     # fill categories
     for category in list(categories_df['category'].unique()):
@@ -772,6 +2040,79 @@ def build_dictionaries(categories_df,respondents_df):
 
 
 
+class UniformLottery:
+    """M-uniform lottery over `committees`: panel j is drawn with probability counts[j] / M, where the counts are
+    non-negative int32 that sum to M. Marginals are computed as exact integer counts (number of the M panels containing
+    each agent) with one sparse product, so that no floating-point drift accumulates before the final division by M.
+    """
+
+    def __init__(self, committees, counts, M):
+        self.committees = committees
+        self.counts = np.asarray(counts, dtype=np.int32)
+        self.M = int(M)
+
+    @classmethod
+    def from_probabilities(cls, committees, probabilities, M, tolerance=1e-3):
+        """Lottery from the probabilities returned by a rounding algorithm, which must be multiples of 1/M up to
+        `tolerance` panels."""
+        scaled = np.asarray(probabilities, dtype=float) * M
+        counts = np.rint(scaled)
+        if len(counts) > 0 and np.abs(scaled - counts).max() > tolerance:
+            raise ValueError(f"Probabilities are not multiples of 1/{M} (off by up to "
+                             f"{np.abs(scaled - counts).max():.2g} panels).")
+        return cls(committees, counts, M)
+
+    @property
+    def probabilities(self):
+        return self.counts / self.M
+
+    def marginal_counts(self, agents):
+        """Number of the M panels on which each agent in `agents` sits, as exact integers."""
+        return _incidence_matrix(self.committees, list(agents)).astype(np.int64) @ self.counts.astype(np.int64)
+
+    def marginals(self, agents):
+        return self.marginal_counts(agents) / self.M
+
+    @staticmethod
+    def check_counts(counts, M):
+        """Raises ValueError unless every column of the panel × lottery count matrix `counts` (dense or sparse) is
+        non-negative and sums to M. Cheap enough to run on every replicate of a batch."""
+        if counts.min() < 0:
+            raise ValueError("Negative panel count in M-uniform lottery.")
+        sums = np.asarray(counts.sum(axis=0)).ravel()
+        if (sums != M).any():
+            raise ValueError(f"Panel counts of {(sums != M).sum()} lotteries do not sum to M = {M}.")
+
+    def validate(self, categories, people, number_people_wanted, households=None):
+        """Checks that the counts sum to M and that all panels drawn with positive probability satisfy the quotas in
+        `categories` for the pool `people` (and have at most one member per household, with `households`), in bulk.
+        Returns the lottery, so that it can be chained."""
+        UniformLottery.check_counts(self.counts, self.M)
+        support = np.flatnonzero(self.counts)
+        feasible = _satisfies_quotas([self.committees[j] for j in support], categories, people, number_people_wanted,
+                                     households)
+        if not feasible.all():
+            raise ValueError(f"{(~feasible).sum()} panels in the support of the lottery violate the quotas or household "
+                             f"constraints.")
+        return self
+
+    def save(self, path):
+        """Compact serialization: M, the int32 counts and the committees as int32 CSR arrays (members, offsets)."""
+        sizes = [len(committee) for committee in self.committees]
+        with open(path, 'wb') as f:
+            np.savez_compressed(f, M=self.M, counts=self.counts,
+                                members=np.fromiter((id for committee in self.committees for id in committee),
+                                                    dtype=np.int32, count=sum(sizes)),
+                                offsets=np.concatenate([[0], np.cumsum(sizes)]).astype(np.int32))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as saved:
+            members, offsets = saved['members'], saved['offsets']
+            committees = [members[offsets[j]:offsets[j + 1]].tolist() for j in range(len(offsets) - 1)]
+            return cls(committees, saved['counts'], int(saved['M']))
+
+
 def randomized_round_pipage(probabilities,M):
     """implements pipage rounding as in Gandhi et al 2006.
        inputs: probabilities - probabilities associated with each panel
@@ -832,34 +2173,41 @@ def beckfiala_round(committees,probabilities,people,M,k):
     probs_round = [int(p*M) for p in probabilities]
     curr_probs = [probabilities[i]*M - probs_round[i]for i in range(len(probabilities))]
 
-    # find value of target probability of each agent
-    target_agent_probs = {id: 0 for id in people}
-    num_active_committees_agent = {id: 0 for id in people}
-    for c in range(len(committees)):
-        for id in committees[c]:
-            target_agent_probs[id] = target_agent_probs[id] + curr_probs[c]
-            num_active_committees_agent[id] += 1
+    # find value of target probability of each agent (agents on the same panels share their constraint)
+    rows, _, _ = _aggregate_rows(_incidence_matrix(committees, list(people)))
+    rounded = _beckfiala_round_remainders(rows, curr_probs, rows.dot(np.array(curr_probs)), k)
+    return [(probs_round[cnum] + rounded[cnum])/M for cnum in range(len(committees))]
+
+
+def _beckfiala_round_remainders(matrix, curr_probs, targets, k):
+    """Rounds the fractional remainders `curr_probs` of the scaled panel probabilities to 0/1 by the iterated LP of
+    `beckfiala_round`, given the agent × panel incidence `matrix` and the agents' remainder sums `targets` (so that the
+    scaling can be done for many M at once). Agents are the rows of `matrix`; since agents with the same row are
+    treated alike, one row per membership signature (see `_aggregate_rows`) gives the same rounding. Returns the 0/1
+    value of each panel.
+    """
+    import gurobipy as grb
+    agents = range(matrix.shape[0])
+    n_committees = matrix.shape[1]
+    members = sp.csc_matrix(matrix)  # the agents on each panel
+    target_agent_probs = dict(zip(agents, targets))
+    num_active_committees_agent = dict(zip(agents, matrix.dot(np.ones(n_committees)).astype(int)))
 
     model = grb.Model()
 
     # VARIABLES
-    committee_variables = [model.addVar(lb=0.,ub=1) for c in committees] 
-
-    agent_panel_variables = {id: [] for id in people}
-    for committee, var in zip(committees, committee_variables):
-        for id in committee:
-            agent_panel_variables[id].append(var)
+    committee_mvar = model.addMVar(n_committees, lb=0., ub=1.)
+    committee_variables = committee_mvar.tolist()
 
     # LP
-    model.addConstr(grb.quicksum(committee_variables)==sum(curr_probs)) # sum must be preserved
+    model.addMConstr(sp.csr_matrix(np.ones((1, n_committees))), committee_mvar, '=',
+                     np.array([sum(curr_probs)])) # sum must be preserved
 
-    agent_constraints = {}
-    for id in people:
-        agent_constraints[id] = model.addConstr(grb.quicksum(agent_panel_variables[id])==target_agent_probs[id])
-        
+    agent_constraints = dict(zip(agents, model.addMConstr(matrix, committee_mvar, '=',
+                                                          np.array([target_agent_probs[id] for id in agents])).tolist()))
 
-    optimistic_marginals = {id : num_active_committees_agent[id] for id in people}
-    pessimistic_marginals = {id : 0 for id in people}
+    optimistic_marginals = {id : num_active_committees_agent[id] for id in agents}
+    pessimistic_marginals = {id : 0 for id in agents}
 
 
     # Iteratively solve the LP, dropping the second type of constraints as we go
@@ -878,7 +2226,7 @@ def beckfiala_round(committees,probabilities,people,M,k):
             if lp_value < EPS: 
                 determined_variables[cnum] = False 
                 model.addConstr(C==0.)
-                for id in committees[cnum]:
+                for id in members.indices[members.indptr[cnum]:members.indptr[cnum + 1]]:
                     optimistic_marginals[id] -=1
                     num_active_committees_agent[id] -= 1
 
@@ -887,17 +2235,13 @@ def beckfiala_round(committees,probabilities,people,M,k):
                 determined_variables[cnum] = True
                 model.addConstr(C==1.)
 
-                for id in committees[cnum]:
+                for id in members.indices[members.indptr[cnum]:members.indptr[cnum + 1]]:
                     pessimistic_marginals[id] += 1
                     num_active_committees_agent[id] -= 1
 
 
-        if len(determined_variables) == len(committees):
-            # construct rounded probabilities:
-            for cnum in range(len(committees)):
-                probs_round[cnum] = (probs_round[cnum] + committee_variables[cnum].X)/M
-
-            return probs_round
+        if len(determined_variables) == n_committees:
+            return [round(C.X) for C in committee_variables]
 
         # drop any constraints that are almost satisfied, within tolerance of k
         constraints_to_delete = []
@@ -907,7 +2251,7 @@ def beckfiala_round(committees,probabilities,people,M,k):
                 constraints_to_delete.append(id)
 
             # if agent is on all active panels
-            elif num_active_committees_agent[id] == len(committees) - len(determined_variables):
+            elif num_active_committees_agent[id] == n_committees - len(determined_variables):
                 constraints_to_delete.append(id)
 
         assert len(constraints_to_delete) > 0
@@ -919,15 +2263,164 @@ def beckfiala_round(committees,probabilities,people,M,k):
         
 
 
-def minimax_change_round(committees,probabilities,people,marginals,M):
+def discrepancy_walk_round(committees,probabilities,people,M,k):
+    """implements rounding by a Gaussian discrepancy walk (in the style of Lovett-Meka and Bansal), needing no LP solver.
+       inputs: committees - list of all panels in support of optimal unconstrained distribution
+               probabilities - probabilities associated with each panel in committees
+               people - list of people in all committees
+               M - number of panels over which you want the uniform lottery to be
+               k - panel size (unused, as the walk adapts its threshold; kept to be called like beckfiala_round)
+    """
+    scaled = np.asarray(probabilities, dtype=float) * M
+    floors = np.floor(scaled + EPS2).astype(int)
+    remainders = np.clip(scaled - floors, 0., 1.)
+    rounded = _discrepancy_walk_remainders(_incidence_matrix(committees, list(people)), remainders)
+    return list((floors + rounded) / M)
+
+
+class _DiscrepancyWalk:
+    """Gaussian discrepancy walk on x ∈ [0, 1]^panels, starting at `start`, that keeps |rows · (x - start)| ≤ λ for every
+    row of the sparse matrix `rows` and preserves Σ x, until every coordinate is 0 or 1 (see
+    `_discrepancy_walk_remainders`). The walk moves in random Gaussian directions, projected orthogonally to the all-ones
+    vector and to the tight rows, whose discrepancy reached λ = `threshold` (and stays there), within the coordinates
+    that have not reached 0 or 1 yet (the others stay where they are). Each step goes as far as it can, until one more
+    coordinate reaches 0 or 1 or one more row becomes tight. When the constraints leave no direction, λ grows by a
+    factor, which releases the tight rows.
+
+    The constraints are kept as orthonormal vectors (rows of `basis`) over a window of coordinates: a new tight row is
+    added by Gram-Schmidt, and when coordinate j freezes, its column is zeroed and the vectors are made orthonormal again
+    by the rank-one correction (I - q qᵀ)^(-1/2) = I + c q qᵀ, q being the former column. Once half of the window is
+    frozen, the window shrinks to the free coordinates, so that a step costs O(rank · free coordinates).
+    """
+
+    def __init__(self, rows, start, threshold):
+        self.rows = rows
+        self.start = start
+        self.y = start.copy()
+        self.threshold = threshold
+        self.frozen = np.zeros(len(start), dtype=bool)
+        self.tight = np.zeros(rows.shape[0], dtype=bool)
+        self._compact()
+
+    def _compact(self):
+        self.free = np.flatnonzero(~self.frozen)
+        self.window_rows = self.rows[:, self.free].tocsr()
+        self.discrepancy = self.rows @ (self.y - self.start)
+        self._rebuild()
+
+    def _rebuild(self):
+        """Orthonormalizes the all-ones vector and the tight rows over the free coordinates of the window."""
+        live = ~self.frozen[self.free]
+        vectors = np.vstack([np.ones((1, len(self.free))),
+                             self.window_rows[np.flatnonzero(self.tight)].toarray()]) * live
+        q, r = np.linalg.qr(vectors.T)
+        independent = np.abs(np.diag(r)) > 1e-9 * max(1., np.abs(np.diag(r)).max())
+        self.rank = int(independent.sum())
+        self.basis = np.zeros((min(len(self.free), self.rows.shape[0] + 1), len(self.free)))
+        self.basis[:self.rank] = q[:, independent].T
+
+    def _extend(self, vector):
+        live = ~self.frozen[self.free]
+        vector = vector * live
+        norm = np.linalg.norm(vector)
+        basis = self.basis[:self.rank]
+        for _ in range(2):  # Gram-Schmidt twice, for numerical stability
+            vector -= basis.T @ (basis @ vector)
+        if self.rank < len(self.basis) and np.linalg.norm(vector) > 1e-9 * norm:
+            self.basis[self.rank] = vector / np.linalg.norm(vector)
+            self.rank += 1
+
+    def _freeze(self, position):
+        self.frozen[self.free[position]] = True
+        self.y[self.free[position]] = np.rint(self.y[self.free[position]])
+        basis = self.basis[:self.rank]
+        column = basis[:, position].copy()
+        basis[:, position] = 0.
+        norm = column @ column
+        if norm >= 1 - 1e-9:
+            # some constraint lived on this coordinate only and is now void
+            self._rebuild()
+        elif norm > 0:
+            # in place (basis.T is the Fortran-ordered matrix BLAS expects): basis += c · column (column · basis)
+            dger((1 / math.sqrt(1 - norm) - 1) / norm, column @ basis, column, a=basis.T, overwrite_a=1)
+
+    def run(self, growth):
+        """Walks until every coordinate is 0 or 1. Returns x; every row's discrepancy is at most `self.threshold`."""
+        while not self.frozen.all():
+            if (~self.frozen).sum() <= len(self.free) / 2:
+                self._compact()
+            live = ~self.frozen[self.free]
+            basis = self.basis[:self.rank]
+            direction = np.random.standard_normal(len(self.free)) * live
+            direction -= basis.T @ (basis @ direction)
+            direction[~live] = 0.
+            if self.rank >= live.sum() or np.abs(direction).max() <= 1e-9:
+                if not self.tight.any():
+                    # only Σ x is left to preserve, i.e. at most one coordinate is fractional and it is integral
+                    self.y[~self.frozen] = np.rint(self.y[~self.frozen])
+                    break
+                self.threshold *= growth
+                self.tight = np.abs(self.discrepancy) >= self.threshold - 1e-9
+                self._rebuild()
+                continue
+
+            y = self.y[self.free]
+            change = self.window_rows @ direction
+            with np.errstate(divide='ignore', invalid='ignore'):
+                to_box = np.where(direction > 1e-12, (1 - y) / direction,
+                                  np.where(direction < -1e-12, -y / direction, np.inf))
+                to_threshold = np.where(change > 1e-12, (self.threshold - self.discrepancy) / change,
+                                        np.where(change < -1e-12, (-self.threshold - self.discrepancy) / change,
+                                                 np.inf))
+            to_threshold[self.tight] = np.inf
+            step = min(to_box.min(), to_threshold.min())
+            y = np.clip(y + step * direction, 0., 1.)
+            self.y[self.free] = y
+            self.discrepancy += step * change
+
+            for position in np.flatnonzero(live & ((y <= 1e-9) | (y >= 1 - 1e-9) | (to_box <= step))):
+                self._freeze(position)
+            for row in np.flatnonzero(~self.tight & (np.abs(self.discrepancy) >= self.threshold - 1e-9)):
+                self.tight[row] = True
+                self._extend(self.window_rows[row].toarray().ravel())
+        return self.y
+
+
+def _discrepancy_walk_remainders(matrix, remainders, threshold=None, growth=1.5):
+    """Rounds the fractional `remainders` of the scaled panel probabilities to 0/1 by a `_DiscrepancyWalk`, such that
+    the total sum is preserved and the remainder sum of every agent (row of the agent × panel incidence `matrix`) moves
+    by at most the final threshold, which starts at `threshold` panels and grows by `growth` whenever the walk is
+    stuck. Agents with the same row over the fractional panels share one constraint (see `_aggregate_rows`). The
+    default threshold is sqrt(ln R) for R distinct rows, the scale of the partial-colouring bound of Lovett and Meka;
+    starting lower barely improves the result but makes the walk take many more steps against many tight rows.
+    Returns the 0/1 value of each panel.
+    """
+    x = np.asarray(remainders, dtype=float).copy()
+    fractional = np.flatnonzero((x > EPS2) & (x < 1 - EPS2))
+    x[x <= EPS2] = 0.
+    x[x >= 1 - EPS2] = 1.
+    if len(fractional) > 0:
+        rows, _, _ = _aggregate_rows(matrix[:, fractional])
+        rows = rows[np.flatnonzero(np.diff(rows.indptr))]
+        if threshold is None:
+            threshold = max(1., math.sqrt(math.log(max(rows.shape[0], 1))))
+        walk = _DiscrepancyWalk(rows, x[fractional], threshold)
+        x[fractional] = walk.run(growth)
+        print(f"Discrepancy walk rounded {len(fractional)} remainders, every agent within {walk.threshold:.3g} panels.")
+    return np.rint(x).astype(int)
+
+
+def minimax_change_round(committees,probabilities,people,marginals,M,start=None):
     """ finds uniform lottery that minimizes the maximum deivation of any agent's marginal from those implied by optimal distribution 
         inputs: committees = list of committees in support of optimal unconstrained distribution
                 probabilities = probabilities of choosing all panels in optimal unconstrained distribution
                 people = list of agents included on any committee in committees (should be all agents)
                 marginals = marginals given by probabilities, the optimal distribution over panels
                 M = the number of panels over which you want a uniform lottery
+                start = optional panel counts summing to M, passed to the solver as initial solution
         outputs: vector of probabilities, one assigned to each committee (in order of committees list)
     """
+    import mip
 
     model = mip.Model(sense=mip.MINIMIZE)
 
@@ -935,24 +2428,29 @@ def minimax_change_round(committees,probabilities,people,marginals,M):
     committee_variables = [model.add_var(var_type=mip.INTEGER, lb=0., ub=mip.INF) for _ in committees]
     model.add_constr(mip.xsum(committee_variables) == M)
     
-    # people-on-panel variables
-    agent_panel_variables = {id: [] for id in people}
-    for committee, var in zip(committees, committee_variables):
-        for id in committee:
-            if id in people:
-                agent_panel_variables[id].append(var)
-
     upper = model.add_var(var_type=mip.CONTINUOUS, lb=0.)
 
-    # sum of all variables pertaining to a given agent 
-    for id in people:
-        model.add_constr(marginals[id]*M - mip.xsum(agent_panel_variables[id]) <= upper)
-        model.add_constr(mip.xsum(agent_panel_variables[id]) - marginals[id]*M <= upper)
+    # sum of all variables pertaining to a given agent; agents on the same panels have the same count, so per
+    # membership signature only the largest and the smallest target bind
+    agents = list(people)
+    rows, _, inverse = _aggregate_rows(_incidence_matrix(committees, agents))
+    targets = np.array([marginals[id]*M for id in agents])
+    highest = np.full(rows.shape[0], -np.inf)
+    lowest = np.full(rows.shape[0], np.inf)
+    np.maximum.at(highest, inverse, targets)
+    np.minimum.at(lowest, inverse, targets)
+    for high, low, agent_count in zip(highest, lowest, _mip_row_sums(rows, committee_variables)):
+        model.add_constr(high - agent_count <= upper)
+        model.add_constr(agent_count - low <= upper)
 
 
     model.objective = upper
+    if start is not None:
+        # the objective variable is part of the start as well, or the solver would take it at 0 (infeasible here)
+        start_counts = rows @ np.asarray(start, dtype=float)
+        model.start = ([(var, float(count)) for var, count in zip(committee_variables, start)]
+                       + [(upper, float(max((highest - start_counts).max(), (start_counts - lowest).max())))])
 
-    
     model.optimize(max_seconds=1800)
     rounded_probabilities = [round(var.x) / M for var in committee_variables]
 
@@ -961,44 +2459,304 @@ def minimax_change_round(committees,probabilities,people,marginals,M):
 
 
 
-def compute_marginals(committees,probabilities,n):
-    marginals = [0 for i in range(n)]
+# score by which rounded lotteries are compared under each objective, and whether larger (1) or smaller (-1) is better
+_OBJECTIVE_SCORES = {'maximin': ('min_marginal', 1), 'nash': ('geometric_mean', 1), 'leximin': ('max_deviation', -1)}
+
+# names of these scores among the lottery_metrics metrics
+_METRIC_SCORES = {'maximin': 'min_marginal', 'nash_welfare': 'geometric_mean', 'max_abs_deviation': 'max_deviation',
+                  'mean_abs_deviation': 'mean_deviation'}
+
+
+def randomized_round_pipage_batch(probabilities, M, R):
+    """Draws R independent pipage roundings of `probabilities` to multiples of 1/M at once. Like
+    `randomized_round_pipage`, each step pairs the panel whose remainder is still fractional with the next panel, and
+    moves probability between the two until one of them is integral; here, the steps are taken for all R replicates
+    simultaneously, so the Python loop runs over the panels only.
 
-    for c in range(len(committees)):
-        committee = committees[c]
+    Returns (base, extra): the integer vector ⌊M p⌋ shared by all replicates, and a sparse 0/1 matrix with one row per
+    panel and one column per replicate marking the panels whose remainder was rounded up. Replicate r gives panel j
+    probability (base[j] + extra[j, r]) / M.
+    `M` may also be an array of R lottery sizes, one per replicate; base is then a panel × replicate matrix, and
+    replicate r gives panel j probability (base[j, r] + extra[j, r]) / M[r].
+    """
+    probabilities = np.asarray(probabilities, dtype=float)
+    scaled = np.multiply.outer(probabilities, M)
+    base = np.floor(scaled + EPS2).astype(int)
+    remainders = np.clip(scaled - base, 0., 1.)
+    fractional = np.flatnonzero(((remainders > EPS2) & (remainders < 1 - EPS2)).reshape(len(probabilities), -1)
+                                .any(axis=1))
+
+    open_index = np.full(R, -1)  # per replicate, the panel whose remainder is still fractional (-1: none)
+    open_value = np.zeros(R)
+    rows, columns = [], []
+    replicates = np.arange(R)
+    for j in fractional:
+        a = open_value
+        b = remainders[j]
+        alpha = np.minimum(1 - a, b)  # moved from j to the open panel
+        beta = np.minimum(a, 1 - b)  # moved from the open panel to j
+        to_j = np.random.random_sample(R) * (alpha + beta) <= alpha
+        a, b = np.where(to_j, a - beta, a + alpha), np.where(to_j, b + beta, b - alpha)
+        for value, index in ((a, open_index), (b, np.full(R, j))):
+            up = value >= 1 - EPS2
+            rows.append(index[up])
+            columns.append(replicates[up])
+        b_open = (b > EPS2) & (b < 1 - EPS2)
+        a_open = (a > EPS2) & (a < 1 - EPS2)
+        open_index = np.where(b_open, j, np.where(a_open, open_index, -1))
+        open_value = np.where(b_open, b, np.where(a_open, a, 0.))
+    up = open_value >= 0.5  # the remainders sum to an integer, so anything left open is 0 or 1 up to rounding errors
+    rows.append(open_index[up])
+    columns.append(replicates[up])
+
+    rows = np.concatenate(rows) if len(rows) > 0 else np.zeros(0, dtype=int)
+    columns = np.concatenate(columns) if len(columns) > 0 else np.zeros(0, dtype=int)
+    extra = sp.csc_matrix((np.ones(len(rows)), (rows, columns)), shape=(len(probabilities), R))
+    return base, extra
+
+
+def best_of_r_pipage(obj, committees, probabilities, marginals, covered_agents, M, R, batch_size=4096):
+    """Draws R pipage roundings of the OPT lottery and keeps the best one under objective `obj` (see
+    `_OBJECTIVE_SCORES`). The marginals of a batch of replicates are one sparse product of the agent × panel incidence
+    matrix with the panel × replicate count matrix; batches of `batch_size` replicates keep the memory bounded.
+
+    Returns (UniformLottery of the best replicate, pd.DataFrame with the scores of all R replicates).
+    """
+    n = len(marginals)
+    incidence = _incidence_matrix(committees, list(range(n)))
+    covered = np.array(list(covered_agents))
+    base, extra = randomized_round_pipage_batch(probabilities, M, R)
+    incidence = incidence.astype(np.int64)
+
+    scores = {name: [] for name in _METRIC_SCORES.values()}
+    for start in range(0, R, batch_size):
+        counts = base[:, None] + extra[:, start:start + batch_size].toarray().astype(np.int64)
+        UniformLottery.check_counts(counts, M)
+        metrics = marginals_metrics(lottery_marginals(incidence, counts) / M, marginals, covered)
+        for metric, name in _METRIC_SCORES.items():
+            scores[name].append(metrics[metric])
+    scores = pd.DataFrame({name: np.concatenate(values) for name, values in scores.items()})
+
+    score_name, sign = _OBJECTIVE_SCORES[obj]
+    best = int(np.lexsort((scores['max_deviation'].values, -sign * scores[score_name].values))[0])
+    print(f"Best of {R} pipage roundings: {score_name} {scores[score_name][best]:.4f} (median "
+          f"{scores[score_name].median():.4f}).")
+    return UniformLottery(committees, base + extra[:, best].toarray().ravel(), M), scores
+
+
+def _run_seeded(seed, function, *args):
+    """Runs `function(*args)` in a portfolio worker, with both random number generators seeded by `seed`."""
+    random.seed(seed)
+    np.random.seed(seed)
+    return function(*args)
+
+
+def _score_lottery(committees, probabilities, opt_marginals, covered_agents):
+    """Scores of a lottery under every objective: its minimum and geometric mean marginal over `covered_agents`, and
+    its maximum deviation from the OPT marginals."""
+    metrics = lottery_metrics(_incidence_matrix(committees, list(range(len(opt_marginals)))), probabilities,
+                              opt_marginals, covered_agents)
+    return {name: float(metrics[metric]) for metric, name in _METRIC_SCORES.items()}
+
+
+def rounding_portfolio(obj, committees, probabilities, marginals, people, covered_agents, M, k):
+    """Runs the rounding methods for objective `obj` concurrently in a process pool and keeps the best M-uniform lottery:
+    the one with the largest minimum marginal (maximin), the largest geometric mean (nash) or the smallest maximum
+    deviation from the OPT `marginals` (leximin). The pool is terminated after PORTFOLIO_BUDGET seconds, and as soon as
+    some lottery cannot be beaten: once the method that is exact for the objective (ILP for maximin and nash, MMC for
+    leximin) finished, or once a lottery reaches the OPT value. Single methods are not cancelled when dominated: the only
+    bound on what a method can still reach is the OPT value, so a method is dominated exactly when the pool stops.
+
+    Returns (name of best method, its probabilities, score table as a pd.DataFrame with one row per method).
+    """
+    # cheap methods first, so that they finish even if the ILPs occupy all workers until the budget runs out
+    tasks = {f'pipage_{seed}': (randomized_round_pipage, (probabilities, M)) for seed in range(PORTFOLIO_PIPAGE_SEEDS)}
+    tasks['DW'] = (discrepancy_walk_round, (committees, probabilities, people, M, k))
+    tasks['BF'] = (beckfiala_round, (committees, probabilities, people, M, k))
+    tasks['MMC'] = (minimax_change_round, (committees, probabilities, people, marginals, M))
+    if obj == 'maximin':
+        tasks['ILP'] = (_find_maximin_primal_discrete, (committees, covered_agents, M))
+    if obj == 'nash':
+        tasks['ILP'] = (_find_nash_primal_discrete_gurobi, (committees, covered_agents, M))
+    exact = 'MMC' if obj == 'leximin' else 'ILP'
+    score_name, sign = _OBJECTIVE_SCORES[obj]
+    opt_score = _score_lottery(committees, probabilities, marginals, covered_agents)[score_name]
 
-        for i in committee:
-                marginals[i] = marginals[i] + probabilities[c]
+    start = time()
+    rows = {name: {'method': name, 'status': 'timeout', 'seconds': None} for name in tasks}
+    rounded = {}
+    # The workers are spawned rather than forked, since this process may have loaded gurobipy and CBC already.
+    with multiprocessing.get_context('spawn').Pool(PORTFOLIO_WORKERS) as workers:
+        pending = {name: workers.apply_async(_run_seeded, (seed, function) + args)
+                   for seed, (name, (function, args)) in enumerate(tasks.items())}
+        unbeatable = False
+        while len(pending) > 0 and not unbeatable and time() - start < PORTFOLIO_BUDGET:
+            for name in [name for name, result in pending.items() if result.ready()]:
+                rows[name]['seconds'] = time() - start
+                try:
+                    rounded[name] = list(pending.pop(name).get())
+                except Exception as e:
+                    rows[name]['status'] = f'failed: {e}'
+                    continue
+                rows[name]['status'] = 'done'
+                rows[name].update(_score_lottery(committees, rounded[name], marginals, covered_agents))
+                unbeatable |= name == exact or sign * rows[name][score_name] >= sign * opt_score - EPS2
+            sleep(0.05)
+        for name in pending:
+            if unbeatable:
+                rows[name]['status'] = 'cancelled'
+        workers.terminate()
+
+    if len(rounded) == 0:
+        raise ValueError(f"No rounding method finished within {PORTFOLIO_BUDGET} seconds.")
+    best = max(rounded, key=lambda name: (sign * rows[name][score_name], -rows[name]['max_deviation']))
+    scores = pd.DataFrame(list(rows.values()))
+    scores['best'] = scores['method'] == best
+    print(f"Rounding portfolio: {best} is best with {score_name} {rows[best][score_name]:.4f} "
+          f"(OPT {opt_score:.4f}).")
+    return best, rounded[best], scores
+
+
+def _scale_counts(counts, M):
+    """Scales panel counts to sum to M, by largest remainders; used to warm-start the ILP for M from the solution
+    for a smaller M."""
+    scaled = np.asarray(counts, dtype=float) * M / np.sum(counts)
+    result = np.floor(scaled).astype(int)
+    result[np.argsort(result - scaled, kind='stable')[:M - result.sum()]] += 1
+    return result
 
-    return marginals
 
+def m_sweep(obj, committees, probabilities, marginals, people, covered_agents, k, Ms, C):
+    """Rounds one OPT lottery to an M-uniform lottery for every M in `Ms`, by all rounding methods applicable to
+    objective `obj`. The panels are put into a _PanelStore once, so that all methods share one incidence matrix. Pipage
+    rounding draws one replicate per M in a single batch, and Beck-Fiala (and the discrepancy walk) scales the
+    probabilities and computes the agents' remainder sums for all M at once. Going through `Ms` in increasing order, each ILP is warm-started from its
+    solution for the previous M, scaled up.
 
-def save_results(committees,probabilities,filestem,n,rep=None):
+    Returns (dict of method -> list of UniformLottery, one per M in increasing order, pd.DataFrame with one row per
+    method and M holding its running time, scores and the theoretical bounds of `compute_theoretical_bounds_indloss`).
+    The time of the batched methods is split evenly over all M.
+    """
+    Ms = sorted(Ms)
+    store = _PanelStore(people)
+    for committee in committees:
+        store.add(committee)
+    assert len(store) == len(committees), "OPT panels are not distinct."
+    probabilities = np.asarray(probabilities, dtype=float)
+    incidence = store.incidence()
+    counts = {}
+    seconds = {}
 
-    # save panel distribution
+    start = time()
+    base, extra = randomized_round_pipage_batch(probabilities, np.array(Ms), len(Ms))
+    counts['pipage'] = base + extra.toarray().astype(int)
+    seconds['pipage'] = [(time() - start) / len(Ms)] * len(Ms)
+
+    start = time()
+    scaled = np.multiply.outer(probabilities, Ms)
+    floors = np.floor(scaled).astype(int)
+    remainders = scaled - floors
+    rows, _, _ = _aggregate_rows(incidence)
+    targets = rows @ remainders
+    counts['BF'] = floors + np.column_stack([_beckfiala_round_remainders(rows, remainders[:, i], targets[:, i], k)
+                                             for i in range(len(Ms))])
+    seconds['BF'] = [(time() - start) / len(Ms)] * len(Ms)
+
+    start = time()
+    counts['DW'] = floors + np.column_stack([_discrepancy_walk_remainders(rows, remainders[:, i])
+                                             for i in range(len(Ms))])
+    seconds['DW'] = [(time() - start) / len(Ms)] * len(Ms)
+
+    ilps = {'MMC': lambda M, start: minimax_change_round(store, probabilities, people, marginals, M, start)}
+    if obj == 'maximin':
+        ilps['ILP'] = lambda M, start: _find_maximin_primal_discrete(store, covered_agents, M, start)
+    if obj == 'nash':
+        ilps['ILP'] = lambda M, start: _find_nash_primal_discrete_gurobi(store, covered_agents, M, start)
+    for method, solve in ilps.items():
+        counts[method] = np.zeros((len(committees), len(Ms)), dtype=int)
+        seconds[method] = []
+        for i, M in enumerate(Ms):
+            start = time()
+            warm_start = _scale_counts(counts[method][:, i - 1], M) if i > 0 else None
+            counts[method][:, i] = UniformLottery.from_probabilities(store, solve(M, warm_start), M).counts
+            seconds[method].append(time() - start)
+
+    opt_marginals = np.asarray(marginals)[store.agents]
+    covered = [store._position[id] for id in covered_agents]
+    rows = []
+    lotteries = {}
+    for method in counts:
+        UniformLottery.check_counts(counts[method], np.array(Ms))
+        lotteries[method] = [UniformLottery(committees, counts[method][:, i], M) for i, M in enumerate(Ms)]
+        metrics = marginals_metrics(lottery_marginals(incidence, counts[method]) / np.array(Ms), opt_marginals, covered)
+        for i, M in enumerate(Ms):
+            bounds = compute_theoretical_bounds_indloss(k, M, len(people), C)
+            rows.append(dict({'M': M, 'method': method, 'seconds': seconds[method][i]},
+                             **{name: metrics[metric][i] for metric, name in _METRIC_SCORES.items()},
+                             bound_bf=bounds['bf'], bound_panelLP=bounds['panelLP'],
+                             indloss=min(bounds['bf'], bounds['panelLP'])))
+    return lotteries, pd.DataFrame(rows).sort_values(['M', 'method'], ignore_index=True)
+
+
+def compute_marginals(committees,probabilities,n):
+    return list(lottery_marginals(_incidence_matrix(committees, list(range(n))), probabilities))
+
+
+def save_results(committees,probabilities,filestem,n,rep=None,opt_filestem=None):
+    """ `probabilities` may also be a UniformLottery over `committees`, whose marginals are then exact and which is
+        additionally saved compactly as ...lottery.npz
+    """
+    lottery = None
+    if isinstance(probabilities, UniformLottery):
+        lottery = probabilities
+        probabilities = list(lottery.probabilities)
+
+    # save panel distribution (all files are written atomically, so that a job run twice by the job queue is harmless)
     results_df = pd.DataFrame({'committees':committees, 'probabilities':probabilities})
     if rep==None:   
-        results_df.to_csv(filestem+'probabilities.csv')
+        atomic_write(filestem+'probabilities.csv', results_df.to_csv)
     else:
-        results_df.to_csv(filestem+'probabilities_rep'+str(rep)+'.csv')
+        atomic_write(filestem+'probabilities_rep'+str(rep)+'.csv', results_df.to_csv)
 
     # compute and save marginals
-    marginals = compute_marginals(committees,probabilities,n)
+    if lottery is None:
+        marginals = compute_marginals(committees,probabilities,n)
+    else:
+        marginals = lottery.marginals(range(n))
+        atomic_write(filestem+'lottery.npz' if rep==None else filestem+'lottery_rep'+str(rep)+'.npz', lottery.save)
     marginals_df = pd.DataFrame({'marginals':marginals})
     if rep==None:
-        marginals_df.to_csv(filestem+'marginals.csv')
+        marginals_path = filestem+'marginals.csv'
     else:
-        marginals_df.to_csv(filestem+'marginals_rep'+str(rep)+'.csv')
+        marginals_path = filestem+'marginals_rep'+str(rep)+'.csv'
+    atomic_write(marginals_path, marginals_df.to_csv)
 
+    # compute the metrics of the saved marginals once, so that the plotting script finds them in the cache (the
+    # metrics of replicates are computed as one batch once all are saved, see `replicate_metrics`)
+    if rep==None:
+        artifact_metrics(marginals_path)
+        if opt_filestem is not None:
+            artifact_metrics(marginals_path, opt_filestem+'marginals.csv')
 
-# # # # # # # # # # # # # # # # MAIN # # # # # # # # # # # # # # # # # # #
 
+def load_results(filestem):
+    """ reads the committees and probabilities saved by `save_results` """
+    results_df = pd.read_csv(filestem+'probabilities.csv')
+    committees = [[int(results_df['committees'].values[i][11:-2].split(',')[j]) for j in range(len(results_df['committees'].values[i][11:-2].split(',')))] for i in range(len(list(results_df['committees'].values)))]
+    return committees, results_df['probabilities']
 
-timings = {}
 
+def load_duals(filestem):
+    """ reads the maximin dual weights saved next to the OPT solution, or None if there are none """
+    if not os.path.exists(filestem+'duals.csv'):
+        return None
+    duals_df = pd.read_csv(filestem+'duals.csv')
+    return dict(zip(duals_df['agents'], duals_df['weights']))
 
-for instance in instances:
-    
+
+def analyze_instance(instance, objective_names):
+    """Runs the analysis selected in the parameter block on `instance` for the objectives in `objective_names`.
+    Returns the time it took in seconds."""
     start = time()
 
     # read in & construct necessary information about instance
@@ -1008,75 +2766,200 @@ for instance in instances:
     k = int(instance[instance.rfind('_')+1:])
 
     number_people_wanted = int(instance[instance.rfind('_')+1:]) # get number of people on panel from instance name
-    categories, people, columns_data = build_dictionaries(categories_df,respondents_df)
+    categories, people, columns_data = build_dictionaries(categories_df,respondents_df,
+                                                          check_same_address_columns if check_same_address else ())
+    households = _compute_households(columns_data, check_same_address_columns) if check_same_address else None
 
 
 
-    objectives = {}
-    if LEXIMIN==1:
-        objectives['leximin'] = '../intermediate_data/'+instance+'_m'+str(M)+'_leximin_'
-    if MAXIMIN==1:
-        objectives['maximin'] = '../intermediate_data/'+instance+'_m'+str(M)+'_maximin_'
-    if NASH==1:
-        objectives['nash'] = '../intermediate_data/'+instance+'_m'+str(M)+'_nash_'
+    objectives = {obj: '../intermediate_data/'+instance+'_m'+str(M)+'_'+obj+'_' for obj in objective_names}
     
 
-    for obj in objectives:
+    # with PANEL_SIZES, the pool is parsed once and every objective is run for every panel size, on one pricing ILP
+    instance_categories = categories
+    instance_k = k
+    committee_generation = None
+    for obj, size in [(obj, size) for obj in objectives for size in (PANEL_SIZES or [instance_k])]:
         stub = objectives[obj]
+        if len(PANEL_SIZES) > 0:
+            stub = stub + 'k' + str(size) + '_'
+            k = number_people_wanted = size
+            categories = _panel_size_quotas(instance_categories, instance_k, size, PANEL_SIZE_QUOTAS.get(size, {}))
 
         if OPT == 1:
+            telemetry = []
+            certificates = []
+            if len(PANEL_SIZES) > 0 or len(QUOTA_EDITS) > 0:
+                # one pricing ILP for all panel sizes, whose quota rows the quota edits below also update in place
+                committee_generation = _committee_generation_for_size(committee_generation, categories, people,
+                                                                      number_people_wanted, households)
+                if committee_generation is None:
+                    print(f"No feasible panels of size {size}.")
+                    continue
+            duals = {}
             if obj =='leximin':
+                seed = None
+                if LEXIMIN_SEED is not None:
+                    seed_stub = ('../intermediate_data/'+instance+'_m'+str(M)+'_'+LEXIMIN_SEED+'_'
+                                 + stub[len(objectives[obj]):])
+                    seed_committees, seed_probabilities = load_results(seed_stub + 'opt_')
+                    seed_duals = load_duals(seed_stub + 'opt_') if LEXIMIN_SEED == 'maximin' else None
+                    seed = (seed_committees, seed_probabilities, seed_duals)
                 committees, probabilities, output_lines = find_opt_distribution_leximin(categories, people,
-                                                            columns_data, number_people_wanted, check_same_address, check_same_address_columns)
+                                                            columns_data, number_people_wanted, check_same_address, check_same_address_columns, telemetry, certificates,
+                                                            committee_generation=committee_generation, seed=seed)
             if obj == 'maximin':
                 committees, probabilities, output_lines, infeasible = find_opt_distribution_maximin(categories, people,
-                                                            columns_data, number_people_wanted, check_same_address, check_same_address_columns)
+                                                            columns_data, number_people_wanted, check_same_address, check_same_address_columns, telemetry, certificates,
+                                                            committee_generation=committee_generation, duals=duals)
             if obj == 'nash':
                 committees, probabilities, output_lines = find_opt_distribution_nash(categories, people, columns_data, 
-                                                            number_people_wanted, check_same_address, check_same_address_columns)
+                                                            number_people_wanted, check_same_address, check_same_address_columns, certificates,
+                                                            committee_generation=committee_generation)
             print(output_lines)
             save_results(committees, probabilities, stub + 'opt_',n)
+            if len(duals) > 0:
+                duals_df = pd.DataFrame({'agents': list(duals), 'weights': list(duals.values())})
+                atomic_write(stub + 'opt_duals.csv', duals_df.to_csv)
+            if len(telemetry) > 0:
+                atomic_write(stub + 'opt_convergence.csv', pd.DataFrame(telemetry).to_csv)
+            atomic_write(stub + 'opt_certificate.csv', pd.DataFrame(certificates).to_csv)
 
         # read in committees from OPT solution for rest of rounding computations
-        results_df = pd.read_csv(stub + 'opt_probabilities.csv')
-        committees = [[int(results_df['committees'].values[i][11:-2].split(',')[j]) for j in range(len(results_df['committees'].values[i][11:-2].split(',')))] for i in range(len(list(results_df['committees'].values)))]
-        probabilities = results_df['probabilities']
+        committees, probabilities = load_results(stub + 'opt_')
         marginals_df = pd.read_csv(stub + 'opt_marginals.csv')
         marginals = marginals_df['marginals'].values
+        pool = people
+        quotas = categories
+
+        if len(DROPOUTS) > 0:
+            committees, probabilities, output_lines, pool = resolve_after_dropouts(obj, committees, DROPOUTS, categories,
+                                                                                   people, number_people_wanted,
+                                                                                   columns_data=columns_data,
+                                                                                   probabilities=list(probabilities),
+                                                                                   duals=load_duals(stub + 'opt_'))
+            print(output_lines)
+            stub = stub + 'dropout_'
+            save_results(committees, probabilities, stub + 'opt_', n)
+            committees = [sorted(committee) for committee in committees]
+            marginals = np.array(compute_marginals(committees, probabilities, n))
+
+        if len(QUOTA_EDITS) > 0:
+            quotas = _edit_quotas(categories, QUOTA_EDITS)
+            committees, probabilities, output_lines = resolve_after_quota_edits(
+                obj, committees, categories, quotas, pool, number_people_wanted, committee_generation, columns_data,
+                households)
+            print(output_lines)
+            stub = stub + 'quota_edit_'
+            save_results(committees, probabilities, stub + 'opt_', n)
+            committees = [sorted(committee) for committee in committees]
+            marginals = np.array(compute_marginals(committees, probabilities, n))
+        # agents on some OPT panel (all of them, unless presolve proved some agents cannot be selected at all)
+        on_some_panel = set(id for committee in committees for id in committee)
+        covered_agents = [id for id in pool if id in on_some_panel]
 
         if ILP == 1: # note: ILP is only a valid choice for NASH or MAXIMIN
             if obj =='maximin':
-                probabilities_rounded = _find_maximin_primal_discrete(committees, people, M)
+                probabilities_rounded = _find_maximin_primal_discrete(committees, covered_agents, M)
 
             if obj =='nash':
-                probabilities_rounded = _find_nash_primal_discrete_gurobi(committees,people,M)
+                probabilities_rounded = _find_nash_primal_discrete_gurobi(committees,covered_agents,M)
                 #probabilities_rounded = find_rounded_distribution_nash(committees,people,M) # solve with baron solver instead
 
-            save_results(committees,probabilities_rounded, stub+'ILProunded_',n)
+            lottery = UniformLottery.from_probabilities(committees, probabilities_rounded, M).validate(quotas, pool, k, households)
+            save_results(committees, lottery, stub+'ILProunded_',n, opt_filestem=stub + 'opt_')
 
         if ILP_MINIMIAX_CHANGE == 1:   
-            probabilities_rounded = minimax_change_round(committees,probabilities,people,marginals,M)
-            save_results(committees,probabilities_rounded,stub + 'ILP_MMC_rounded_',n)
+            probabilities_rounded = minimax_change_round(committees,probabilities,pool,marginals,M)
+            lottery = UniformLottery.from_probabilities(committees, probabilities_rounded, M).validate(quotas, pool, k, households)
+            save_results(committees, lottery, stub + 'ILP_MMC_rounded_',n, opt_filestem=stub + 'opt_')
 
 
         if BECK_FIALA == 1:
-            probabilities_rounded = beckfiala_round(committees,probabilities,people,M,k)
-            save_results(committees,probabilities_rounded, stub+'BFrounded_',n)
+            probabilities_rounded = beckfiala_round(committees,probabilities,pool,M,k)
+            lottery = UniformLottery.from_probabilities(committees, probabilities_rounded, M).validate(quotas, pool, k, households)
+            save_results(committees, lottery, stub+'BFrounded_',n, opt_filestem=stub + 'opt_')
+
+        if DISCREPANCY_WALK == 1:
+            probabilities_rounded = discrepancy_walk_round(committees,probabilities,pool,M,k)
+            lottery = UniformLottery.from_probabilities(committees, probabilities_rounded, M).validate(quotas, pool, k, households)
+            save_results(committees, lottery, stub+'DWrounded_',n, opt_filestem=stub + 'opt_')
+
+        if BEST_OF_R == 1:
+            lottery, scores = best_of_r_pipage(obj, committees, probabilities, marginals, covered_agents, M,
+                                               BEST_OF_R_REPLICATES)
+            save_results(committees, lottery.validate(quotas, pool, k, households), stub + 'BESTofRrounded_', n,
+                         opt_filestem=stub + 'opt_')
+            atomic_write(stub + 'BESTofR_scores.csv', scores.to_csv)
+
+        if ROUNDING_PORTFOLIO == 1:
+            best, probabilities_rounded, scores = rounding_portfolio(obj, committees, list(probabilities), marginals,
+                                                                     pool, covered_agents, M, k)
+            lottery = UniformLottery.from_probabilities(committees, probabilities_rounded, M).validate(quotas, pool, k, households)
+            save_results(committees, lottery, stub + 'PORTFOLIOrounded_', n, opt_filestem=stub + 'opt_')
+            atomic_write(stub + 'portfolio_scores.csv', scores.to_csv)
+
+        if len(M_SWEEP) > 0:
+            C = len(respondents_df.groupby(list(categories_df['category'].unique())))
+            lotteries, sweep = m_sweep(obj, committees, probabilities, marginals, pool, covered_agents, k, M_SWEEP, C)
+            for method, method_lotteries in lotteries.items():
+                for lottery in method_lotteries:
+                    atomic_write(stub + 'Msweep_' + method + '_m' + str(lottery.M) + '_lottery.npz',
+                                 lottery.validate(quotas, pool, k, households).save)
+            atomic_write(stub + 'Msweep.csv', sweep.to_csv)
+            print(sweep)
 
         if RANDOMIZED == 1:
             print(instance)
             for rep in range(RANDOMIZED_REPLICATES):
                 probabilities_rounded = randomized_round_pipage(probabilities,M)
-                save_results(committees,probabilities_rounded,stub + 'RANDrounded_',n,rep)
+                lottery = UniformLottery.from_probabilities(committees, probabilities_rounded, M).validate(quotas, pool, k, households)
+                save_results(committees,lottery,stub + 'RANDrounded_',n,rep,stub + 'opt_')
                 if rep%100==0:
                     print(rep)
+            replicate_metrics([stub + 'RANDrounded_marginals_rep'+str(rep)+'.csv' for rep in range(RANDOMIZED_REPLICATES)],
+                              stub + 'RANDrounded_marginals.metrics.npz')
 
     end = time()
-    timings[instance] = end - start
+    return end - start
+
 
-#write timings to file:
-with open("../intermediate_data/timings.txt", 'w') as f: 
-    for key, value in timings.items(): 
-        f.write('%s:%s\n' % (key, value))
+# # # # # # # # # # # # # # # # MAIN # # # # # # # # # # # # # # # # # # #
 
 
+if __name__ == '__main__':
+    np.random.seed(1)
+    random.seed(1)
+
+    timings = {}
+
+
+    objective_names = [obj for obj, flag in (('leximin', LEXIMIN), ('maximin', MAXIMIN), ('nash', NASH)) if flag == 1]
+    # with LEXIMIN_SEED, leximin reads the OPT solution of the seed objective, so that one is computed first
+    objective_names.sort(key=lambda obj: obj != LEXIMIN_SEED)
+
+    if JOB_QUEUE is None:
+        for instance in instances:
+            timings[instance] = analyze_instance(instance, objective_names)
+
+    else:
+        # distributed: submit one job per instance and objective (jobs already in the queue are kept), then work on the queue
+        # until it is empty; every process running this script on a host sharing ../intermediate_data does the same. With
+        # LEXIMIN_SEED, a leximin job waits for the job computing its seed (if that one is run as well).
+        queue = JobQueue(JOB_QUEUE, JOB_LEASE_SECONDS)
+        dependencies = {}
+        if 'leximin' in objective_names and LEXIMIN_SEED in objective_names:
+            dependencies = {instance+'/leximin/m'+str(M): [instance+'/'+LEXIMIN_SEED+'/m'+str(M)] for instance in instances}
+        queue.submit({instance+'/'+obj+'/m'+str(M): {'instance': instance, 'objective': obj}
+                      for instance in instances for obj in objective_names}, dependencies)
+        run_worker(queue, lambda job: analyze_instance(job['instance'], [job['objective']]))
+        # a worker only returns once no job is pending or running, so every worker writes the same timings: those the
+        # queue recorded for all jobs
+        timings = queue.seconds()
+
+    #write timings to file (atomically, since every worker of a job queue writes it):
+    def write_timings(temporary):
+        with open(temporary, 'w') as f:
+            for key, value in timings.items():
+                f.write('%s:%s\n' % (key, value))
+    atomic_write("../intermediate_data/timings.txt", write_timings)
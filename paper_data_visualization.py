@@ -1,15 +1,14 @@
-import pandas as pd 
-import numpy as np 
-import mip
+import pandas as pd
+import numpy as np
 import os
 import matplotlib
+matplotlib.use('Agg')  # headless: figures are rendered in worker processes and only written to file
 import matplotlib.pyplot as plt
-import csv
-import math
-import random
-from scipy.stats.mstats import gmean
+import multiprocessing
 from matplotlib.lines import Line2D
 from mpl_toolkits.axes_grid.inset_locator import (inset_axes, InsetPosition,mark_inset)
+from job_queue import atomic_write
+from lottery_metrics import artifact_metrics, file_hash, replicate_metrics, sort_by_reference, theoretical_bounds
 
 
 #import planar
@@ -32,54 +31,32 @@ NASH = 0
 
 # which rounding algorithms to analyze
 ILP = 0
-ILP_MINIMAX_CHANGE = 1               
+ILP_MINIMAX_CHANGE = 1
 BECK_FIALA = 1
 RANDOMIZED = 1
 RANDOMIZED_REPLICATES = 1000
 THEORY = 1
 
-# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
-
-
-instance_names = []
-for instance in instances:
-    instance_names.append(instance[0:instance.rfind('_')])
-
-
-def compute_theoretical_bounds_indloss(k,M,n,C):
-    """ Computes two potentially best theoretical upper bounds on change in any marginal in terms of instance parameters
-    """
-    bounds = {}
-    bounds['bf'] = k/M
-    bounds['panelLP'] = math.sqrt((1 + math.log(2)/math.log(C))/2)*math.sqrt(C * math.log(C))/M + 1/M
-    return bounds
+# number of processes rendering figures (None = one per core)
+PLOT_WORKERS = None
 
+# level of detail of the leximin plots: each series in the main plot is reduced to its min/max envelope over this many
+# bins of agents (the inset is drawn at full resolution)
+LOD_BINS = 2000
 
-def add_dset_to_plot(x,y,c,level):
-    for xcoord in x:
-        leftend = xcoord+0.05+0.9/3*level
-        rightend = leftend + 0.9/3
-        plt.plot([leftend,rightend],[y[xcoord],y[xcoord]],c)
-
-
-
-
-# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
-# plot comparing fairness (Figure 1 & corresponding figure in Appendix)
- # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # 
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
 
-######### Build Data ###########
-opt_plot_data = []
-ilp_plot_data = []
-bf_plot_data = []
-rand_plot_data = []
-rand_std_dev = []
-theory_plot_data = []
+# The plots are made in two stages:
+#   1. data preparation: for every instance, the plot table (instance parameters n, k, C, the metrics or sorted marginals
+#      of OPT and of the rounded lotteries, and the theoretical bounds) is computed from the analysis artifacts and
+#      written to ..._plotdata.npz. A table is only recomputed if one of the files it is computed from changed.
+#   2. rendering: each figure is drawn from the plot tables alone, in a pool of processes. A figure is only re-rendered
+#      if its plot tables changed since it was last written (their hash is kept next to the figure, in ....inputs).
 
-for instance in instances:
 
-    # construct all data
+def _instance_parameters(instance):
+    """n, k and the number C of distinct feature vectors in the pool of `instance`."""
     categories_df = pd.read_csv('../data_panelot/'+instance+'/categories.csv')
     respondents_df = pd.read_csv('../data_panelot/'+instance+'/respondents.csv')
     n = len(respondents_df)
@@ -88,75 +65,129 @@ for instance in instances:
     # compute number of unique realized feature-vectors in pool
     categories = list(categories_df['category'].unique())
     C = len(respondents_df.groupby(categories))
+    return n, k, C
 
 
-    if MAXIMIN == 1:
-        stub = '../intermediate_data/'+instance+'_m'+str(M)+'_maximin_'
-
-    elif NASH == 1:
-        stub = '../intermediate_data/'+instance+'_m'+str(M)+'_nash_'
-
+def _input_files(instance, stub):
+    files = ['../data_panelot/'+instance+'/categories.csv', '../data_panelot/'+instance+'/respondents.csv',
+             stub+'opt_marginals.csv']
+    if LEXIMIN == 1:
+        files += [stub+'ILP_MMC_rounded_marginals.csv', stub+'BFrounded_marginals.csv']
     else:
-        break
-        
-
-    OPT_probabilities_df = pd.read_csv(stub+'opt_probabilities.csv')
-    OPT_marginals_df = pd.read_csv(stub+'opt_marginals.csv')
-
-    committees = [[int(OPT_probabilities_df['committees'].values[i][11:-2].split(',')[j]) for j in range(len(OPT_probabilities_df['committees'].values[i][11:-2].split(',')))] for i in range(len(list(OPT_probabilities_df['committees'].values)))]
-
-
-    OPT_marginals = OPT_marginals_df['marginals']
-
-    if MAXIMIN==1:
-        opt_plot_data.append(min(OPT_marginals))
-    elif NASH==1:
-        opt_plot_data.append(gmean(OPT_marginals))
-
+        files += [stub+'ILProunded_marginals.csv'] if ILP == 1 else []
+        files += [stub+'BFrounded_marginals.csv'] if BECK_FIALA == 1 else []
+    if RANDOMIZED == 1:
+        files += [stub+'RANDrounded_marginals_rep'+str(rep)+'.csv' for rep in range(RANDOMIZED_REPLICATES)]
+    return files
+
+
+def _leximin_table(instance, stub):
+    n, k, C = _instance_parameters(instance)
+
+    # read in data
+    marginals = pd.read_csv(stub + 'opt_marginals.csv')['marginals'].values
+    marginals_ILP_rounded = pd.read_csv(stub + 'ILP_MMC_rounded_marginals.csv')['marginals'].values
+    marginals_BF_rounded = pd.read_csv(stub + 'BFrounded_marginals.csv')['marginals'].values
+    rand_data = np.column_stack([pd.read_csv(stub+'RANDrounded_marginals_rep'+str(rep)+'.csv')['marginals'].values
+                                 for rep in range(RANDOMIZED_REPLICATES)])
+
+    # sort everything by optimal marginals
+    return {'n': n, 'k': k, 'C': C,
+            'indloss': theoretical_bounds(k,M,n,C,marginals)['indloss'],
+            'opt': artifact_metrics(stub + 'opt_marginals.csv')['leximin_profile'],
+            'ilp': sort_by_reference(marginals_ILP_rounded, marginals),
+            'rand': sort_by_reference(rand_data.mean(axis=1), marginals),
+            'rand_std': rand_data.std(axis=1).max(),
+            'bf': sort_by_reference(marginals_BF_rounded, marginals)}
+
+
+def _comparison_table(instance, stub, metric):
+    n, k, C = _instance_parameters(instance)
+    OPT_marginals = pd.read_csv(stub+'opt_marginals.csv')['marginals']
+    table = {'n': n, 'k': k, 'C': C, 'opt': float(artifact_metrics(stub+'opt_marginals.csv')[metric])}
 
     if ILP==1:
-        ILP_marginals = pd.read_csv(stub+'ILProunded_marginals.csv')['marginals']
-
-        if MAXIMIN==1:
-            ilp_plot_data.append(min(ILP_marginals))
-        elif NASH==1:
-            ilp_plot_data.append(gmean(ILP_marginals))
+        table['ilp'] = float(artifact_metrics(stub+'ILProunded_marginals.csv')[metric])
 
     if BECK_FIALA==1:
-        BF_marginals = pd.read_csv(stub+'BFrounded_marginals.csv')['marginals']  
-
-        if MAXIMIN==1:
-            bf_plot_data.append(min(BF_marginals))
-        elif NASH==1:
-            bf_plot_data.append(gmean(BF_marginals))
+        table['bf'] = float(artifact_metrics(stub+'BFrounded_marginals.csv')[metric])
 
     if RANDOMIZED==1:
-        rand_data = []
-        for rep in range(RANDOMIZED_REPLICATES):
-            RAND_marginals = pd.read_csv(stub+'RANDrounded_marginals.csv')['marginals']  
+        rand_data = replicate_metrics([stub+'RANDrounded_marginals_rep'+str(rep)+'.csv' for rep in range(RANDOMIZED_REPLICATES)],
+                                      stub+'RANDrounded_marginals.metrics.npz')[metric]
+        table['rand'] = np.mean(rand_data)
+        table['rand_std'] = np.std(rand_data)
 
-            if MAXIMIN==1:
-                rand_data.append(min(RAND_marginals))
-            elif NASH==1:
-                rand_data.append(gmean(RAND_marginals))
+    if THEORY==1:
+        table['theory'] = theoretical_bounds(k,M,n,C,OPT_marginals)[metric]
+    return table
+
+
+def prepare_plot_data(instance, objective, metric=None):
+    """Data-preparation stage: writes the plot table of `instance` for `objective` to ..._plotdata.npz, unless the
+    table there was computed from the same input files already. Returns the path of the table."""
+    stub = '../intermediate_data/'+instance+'_m'+str(M)+'_'+objective+'_'
+    path = stub + 'plotdata.npz'
+    key = file_hash(*_input_files(instance, stub)) + repr((M, ILP, BECK_FIALA, RANDOMIZED, RANDOMIZED_REPLICATES, THEORY))
+    try:
+        with np.load(path) as table:
+            if str(table['key']) == key:
+                return path
+    except (OSError, KeyError):
+        pass
+
+    table = _leximin_table(instance, stub) if objective == 'leximin' else _comparison_table(instance, stub, metric)
+
+    def write(temporary):
+        with open(temporary, 'wb') as f:
+            np.savez(f, key=key, **table)
+    atomic_write(path, write)
+    return path
+
+
+def _load_table(path):
+    with np.load(path) as table:
+        return {name: table[name] for name in table.files if name != 'key'}
+
+
+def render_if_changed(render, figure_path, table_paths, *args):
+    """Rendering stage: calls `render(figure_path, tables, *args)` on the plot tables in `table_paths`, unless
+    `figure_path` was last rendered from the same tables. Returns whether the figure was rendered."""
+    key = file_hash(*table_paths) + repr(args)
+    try:
+        with open(figure_path + '.inputs') as f:
+            if f.read() == key and os.path.exists(figure_path):
+                return False
+    except OSError:
+        pass
+    render(figure_path, [_load_table(path) for path in table_paths], *args)
+    plt.close('all')
+
+    def write(temporary):
+        with open(temporary, 'w') as f:
+            f.write(key)
+    atomic_write(figure_path + '.inputs', write)
+    return True
 
-        rand_plot_data.append(np.mean(rand_data))
-        rand_std_dev.append(np.std(rand_data))
 
-    if THEORY==1:
-        bounds = compute_theoretical_bounds_indloss(k,M,n,C)
+def add_dset_to_plot(x,y,c,level):
+    for xcoord in x:
+        leftend = xcoord+0.05+0.9/3*level
+        rightend = leftend + 0.9/3
+        plt.plot([leftend,rightend],[y[xcoord],y[xcoord]],c)
 
-        if MAXIMIN==1:
-            indloss = min(bounds['bf'],bounds['panelLP'])
-            theory_plot_data.append(min(OPT_marginals) - indloss)
 
-        elif NASH==1:
-            indloss = k*min(bounds['bf'],bounds['panelLP'])
-            theory_plot_data.append(gmean(OPT_marginals) - indloss)
 
 
-###### Build plot ##########
-if NASH == 1 or MAXIMIN ==1:
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# plot comparing fairness (Figure 1 & corresponding figure in Appendix)
+ # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+
+def render_comparison(figure_path, tables, instances, objective):
+    opt_plot_data, ilp_plot_data, bf_plot_data, rand_plot_data, theory_plot_data = (
+        [float(table[name]) if name in table else None for table in tables]
+        for name in ('opt', 'ilp', 'bf', 'rand', 'theory'))
 
     x = list(range(len(instances)))
     plt.figure(figsize=(8,4))
@@ -175,7 +206,6 @@ if NASH == 1 or MAXIMIN ==1:
         add_dset_to_plot(x,ilp_plot_data,'b',0)
 
     if RANDOMIZED==1:
-        print("maximum standard deviation (over randomized rounding replicates) in objective across instances: "+str(max(rand_std_dev)))
         add_dset_to_plot(x,rand_plot_data,'g',1)
 
     if BECK_FIALA==1:
@@ -187,15 +217,15 @@ if NASH == 1 or MAXIMIN ==1:
     plt.xticks(xticks,labels=instance_names)
     plt.xlim(-0.1,len(instances)+0.1)
 
-    if MAXIMIN==1:
+    if objective=='maximin':
         objname = 'IP-Maximin'
         ymax = 0.4
-    elif NASH==1:
+    elif objective=='nash':
         objname = 'IP-NW'
         ymax = 0.6
     plt.ylim(0,ymax)
     plt.text(max(x)+1,ymax*0.925,'m = '+str(M), ha='right')
-    
+
 
     legend_elements = [Line2D([0], [0], color='b', lw=1, label=objname),
                        Line2D([0], [0], color='g', lw=1, label='Pipage'),
@@ -206,9 +236,9 @@ if NASH == 1 or MAXIMIN ==1:
 
     # write in text loss
     yshift1 = 0.0525*ymax/0.4
-    yshift2 = 0.0375*ymax/0.4 
-    yshift3 = 0.0225*ymax/0.4 
-    yshift4 = 0.0075*ymax/0.4 
+    yshift2 = 0.0375*ymax/0.4
+    yshift3 = 0.0225*ymax/0.4
+    yshift4 = 0.0075*ymax/0.4
     for i in range(len(instances)):
         if ILP==1:
             ilp_loss = str(abs(round((opt_plot_data[i] - ilp_plot_data[i])*M,1)))
@@ -222,150 +252,166 @@ if NASH == 1 or MAXIMIN ==1:
         if THEORY == 1:
             theory_loss = str(abs(round((opt_plot_data[i] - theory_plot_data[i])*M,2)))
             plt.text(xticks[i],opt_plot_data[i]+yshift4,'-'+theory_loss+'/m', horizontalalignment='center',fontsize=7.25,color='k')
-        
 
-    # put objective-specific labels 
-    if MAXIMIN==1:
+
+    # put objective-specific labels
+    if objective=='maximin':
         plt.ylabel('Maximin objective value')
-        plt.savefig('../m'+str(M)+'maximin_algos_comparison.pdf',bbox_inches='tight')
-        
-    elif NASH==1:
+    elif objective=='nash':
         plt.ylabel('Nash Welfare objective value')
-        plt.savefig('../m'+str(M)+'nash_algos_comparison.pdf',bbox_inches='tight')
+    plt.savefig(figure_path,bbox_inches='tight')
 
 
 
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 # plot comparing leximin distributions (Figure 2 & corresponding figures in appendix)
- # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # 
-
-
-if LEXIMIN==1:
-
-    # plot features: custom positions for each instance
-         # each entry is a list composed of plot features, in the following order:
-            #[0:3]= inset position: lower x position, lower y position, width, height (all as fractions of plot size)
-            #[4] = fraction of support to cover with inset
-    pf = {'sf_a_35':[0.3,0.4,0.5,0.4,0.2],
-            'sf_b_20':[0.3,0.4,0.5,0.4,0.2],
-            'sf_c_44':[0.3,0.5,0.4,0.4,0.25], 
-            'sf_d_40':[0.3,0.4,0.5,0.4,0.2], 
-            'sf_e_110':[0.3,0.4,0.5,0.4,0.05],
-            'cca_75':[0.3,0.4,0.5,0.4,0.125],
-            'hd_30':[0.3,0.4,0.5,0.4,0.25],
-            'mass_24':[0.3,0.55,0.3,0.4,0.285],
-            'nexus_170':[0.3,0.55,0.4,0.4,0.15],
-            'obf_30':[0.3,0.4,0.5,0.4,0.2],
-            'newd_40':[0.3,0.4,0.5,0.4,0.2]}
-
-
-    for instance in instances:
-
-        # get instance parameters
-        pfi = pf[instance]
-        respondents_df = pd.read_csv('../data_panelot/'+instance+'/respondents.csv')
-        n = len(respondents_df)
-        k = int(instance[instance.rfind('_')+1:]) # get number of people wanted on panel
-
-        categories_df = pd.read_csv('../data_panelot/'+instance+'/categories.csv')
-        categories = list(categories_df['category'].unique())
-        C = len(respondents_df.groupby(categories))
-
-        stub = '../intermediate_data/'+instance+'_m'+str(M)+'_leximin_'
-
-        OPT_probabilities_df = pd.read_csv(stub+'opt_probabilities.csv')
-        committees = [[int(OPT_probabilities_df['committees'].values[i][11:-2].split(',')[j]) for j in range(len(OPT_probabilities_df['committees'].values[i][11:-2].split(',')))] for i in range(len(list(OPT_probabilities_df['committees'].values)))]
-        probabilities = OPT_probabilities_df['probabilities'].values
-
-        # read in data
-        marginals = list(pd.read_csv(stub + 'opt_marginals.csv')['marginals'].values)
-        marginals_ILP_rounded = list(pd.read_csv(stub + 'ILP_MMC_rounded_marginals.csv')['marginals'].values)
-        marginals_BF_rounded = list(pd.read_csv(stub + 'BFrounded_marginals.csv')['marginals'].values)
-        rand_data = []
-        for rep in range(RANDOMIZED_REPLICATES):
-            marginals_RAND_rounded = (pd.read_csv(stub+'RANDrounded_marginals.csv')['marginals'].values)
-            rand_data.append(marginals_RAND_rounded)
-        marginals_RAND_rounded = np.mean(rand_data,axis=0)
-        marginals_RAND_rounded_std = np.std(rand_data,axis=0)
-        
-        # reports maximum standard deviation, since it's so small that it's not being plotted
-        print("in instance "+instance+", maximum standard deviation (over replicates of randomized rounding runs) of any marginal is:" + str(max(marginals_RAND_rounded_std)))
-
-        # sort everything by optimal marginals
-        marginals_ILP_rounded_sorted = [x for y, x in sorted(zip(marginals, marginals_ILP_rounded))]
-        marginals_RAND_rounded_sorted = [x for y, x in sorted(zip(marginals, marginals_RAND_rounded))]
-        marginals_BF_rounded_sorted = [x for y, x in sorted(zip(marginals, marginals_BF_rounded))]
-        marginals_sorted = sorted(marginals)
-
-
-        # make plot
-        fig, ax1 = plt.subplots(figsize=(8,2))
-
-        x = list(range(n+1))
-
-        # shade in regions showing tightest bounds
-        bounds = compute_theoretical_bounds_indloss(k,M,n,C)
-        indloss = min(bounds['bf'],bounds['panelLP'])
-        top= [m+indloss for m in marginals_sorted]
-        bottom=[m-indloss for m in marginals_sorted]
-        plt.fill_between(x,top+[top[-1]],bottom+[bottom[-1]],color='k', alpha = 0.15,step='post')
-
-        # specify main plot
-        ax1.plot(x,marginals_sorted + [marginals_sorted[-1]],'k',alpha=0.5,linewidth=1,drawstyle='steps-post')
-        ax1.plot(x,marginals_ILP_rounded_sorted  + [marginals_ILP_rounded_sorted[-1]],'cornflowerblue',linestyle='--',linewidth=1,alpha=0.5,drawstyle='steps-post')
-        ax1.plot(x,marginals_RAND_rounded_sorted  + [marginals_RAND_rounded_sorted[-1]],'g:',linewidth=1,alpha=0.5,drawstyle='steps-post')
-        ax1.plot(x,marginals_BF_rounded_sorted  + [marginals_RAND_rounded_sorted[-1]],'orange',linestyle='-.',linewidth=1,alpha=0.5,drawstyle='steps-post')
-
-        ax1.set_xlim(0,n+0.5)
-        ax1.set_xticks([])
-        ax1.set_ylabel('marginal probability')
-        ax1.set_xlabel('agents sorted by marginal given by OPT')
-        ax1.set_ylim([-0.01,1.01])
-
-        # legend
-        custom_lines = [Line2D([0], [0], color='black', lw=1),
-                        Line2D([0], [0], color='cornflowerblue', lw=1, linestyle = '--'),
-                        Line2D([0], [0], color='green', lw=1, linestyle= ':'),
-                        Line2D([0], [0], color='orange', lw=1, linestyle='-.')]
-        ax1.legend(custom_lines,['$p^*$','IP-Marginals','Pipage','Beck-Fiala'],loc='upper left',fontsize=8)
-
-        # specify inset plot
-        ax2 = plt.axes([0,0,1,1])
-        ip = InsetPosition(ax1, pfi[0:4])
-        ax2.set_axes_locator(ip)
-
-        ax2.plot(x[:-1],marginals_sorted ,'k',linewidth=0.9,alpha=0.75,drawstyle='steps-post')
-        ax2.plot(x[:-1],marginals_ILP_rounded_sorted,'cornflowerblue',linestyle='--',linewidth=0.9,alpha=0.75,drawstyle='steps-post')
-        ax2.plot(x[:-1],marginals_RAND_rounded_sorted,'g:',linewidth=0.9,alpha=0.75,drawstyle='steps-post')
-        ax2.plot(x[:-1],marginals_BF_rounded_sorted,'orange',linestyle='-.',linewidth=0.9,alpha=0.75,drawstyle='steps-post')
-
-        # draw lines from box corners
-        xmin = 0
-        xmax = int(n*pfi[4])
-
-        ax1.plot([0,pfi[0]*n],[marginals_sorted[0],pfi[1]],'k--',linewidth=0.75)
-        ax1.plot([xmax,(pfi[0]+pfi[2])*n],[marginals_sorted[xmax],pfi[1]],'k--',linewidth=0.75)
-
-        ymin = min([min(marginals_sorted[xmin:xmax]),min(marginals_ILP_rounded_sorted[xmin:xmax]),min(marginals_RAND_rounded_sorted[xmin:xmax]), min(marginals_BF_rounded_sorted[xmin:xmax])])
-        ymax = max([max(marginals_sorted[xmin:xmax]),max(marginals_ILP_rounded_sorted[xmin:xmax]),max(marginals_RAND_rounded_sorted[xmin:xmax]), max(marginals_BF_rounded_sorted[xmin:xmax])])
-        ax2.set_xlim(xmin,xmax)
-        ax2.set_ylim(ymin*(0.99),ymax*(1.01))
-        ax2.set_xticks([])
-
-        # showing span of deviation
-        ax2.set_yticks([])
-
-        textx = (pfi[0]-0.045)*n
-        texty = pfi[3]/2 + pfi[1] 
-        spanlabel = str(int((ymax*1.01 - ymin*0.99)*1000))+'/m'
-        ax1.text(textx,texty,spanlabel,ha = 'center',va='center',fontsize=8)
-        ax1.plot([(pfi[0]-0.02)*n,(pfi[0]-0.01)*n],[pfi[1],pfi[1]],'k',linewidth=0.75)
-        ax1.plot([(pfi[0]-0.02)*n,(pfi[0]-0.01)*n],[pfi[1]+pfi[3],pfi[1]+pfi[3]],'k',linewidth=0.75)
-        ax1.arrow((pfi[0]-0.015)*n,(pfi[3]/2 + pfi[1]),0,pfi[3]/2-0.03,width=0.001/pfi[4],head_width=0.15/pfi[4],head_length=0.007)
-        ax1.arrow((pfi[0]-0.015)*n,(pfi[3]/2 + pfi[1]),0,-(pfi[3]/2-0.03),width=0.001/pfi[4],head_width=0.15/pfi[4],head_length=0.007)
-
-        plt.savefig('../m'+str(M)+'_'+instance+'_leximin_marginals_comparison.pdf',bbox_inches='tight')
-
-
-
+ # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+
+# plot features: custom positions for each instance
+     # each entry is a list composed of plot features, in the following order:
+        #[0:3]= inset position: lower x position, lower y position, width, height (all as fractions of plot size)
+        #[4] = fraction of support to cover with inset
+pf = {'sf_a_35':[0.3,0.4,0.5,0.4,0.2],
+        'sf_b_20':[0.3,0.4,0.5,0.4,0.2],
+        'sf_c_44':[0.3,0.5,0.4,0.4,0.25],
+        'sf_d_40':[0.3,0.4,0.5,0.4,0.2],
+        'sf_e_110':[0.3,0.4,0.5,0.4,0.05],
+        'cca_75':[0.3,0.4,0.5,0.4,0.125],
+        'hd_30':[0.3,0.4,0.5,0.4,0.25],
+        'mass_24':[0.3,0.55,0.3,0.4,0.285],
+        'nexus_170':[0.3,0.55,0.4,0.4,0.15],
+        'obf_30':[0.3,0.4,0.5,0.4,0.2],
+        'newd_40':[0.3,0.4,0.5,0.4,0.2]}
+
+
+def _lod_steps(y, bins, end=None):
+    """Vertices (x, y) of the steps-post curve with value y[i] on [i, i+1) for i = 0, ..., n-1 and ending at x = n with
+    value `end` (default y[-1]), with level-of-detail reduction: runs of equal values are one step, and if more than
+    4·`bins` steps remain, each of `bins` equal-width bins of x keeps only its first and last step and the steps with its
+    smallest and largest value. The reduced curve passes through the same minimum and maximum in every bin and has the
+    same values at the bin boundaries, so at a resolution of `bins` columns it draws the same envelope.
+    """
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    starts = np.flatnonzero(np.r_[True, y[1:] != y[:-1]])
+    if len(starts) > 4 * bins:
+        bin_of = starts * bins // n
+        _, first = np.unique(bin_of, return_index=True)
+        last = np.r_[first[1:] - 1, len(starts) - 1]
+        by_value = np.lexsort((y[starts], bin_of))
+        _, lowest = np.unique(bin_of[by_value], return_index=True)
+        highest = np.r_[lowest[1:] - 1, len(starts) - 1]
+        starts = starts[np.unique(np.concatenate([first, last, by_value[lowest], by_value[highest]]))]
+    return np.r_[starts, n], np.r_[y[starts], y[-1] if end is None else end]
+
+
+def render_leximin(figure_path, tables, pfi):
+    table, = tables
+    n = int(table['n'])
+    indloss = float(table['indloss'])
+    marginals_sorted = list(table['opt'])
+    marginals_ILP_rounded_sorted = list(table['ilp'])
+    marginals_RAND_rounded_sorted = list(table['rand'])
+    marginals_BF_rounded_sorted = list(table['bf'])
+
+    # make plot
+    fig, ax1 = plt.subplots(figsize=(8,2))
+
+    x = list(range(n+1))
+
+    # shade in regions showing tightest bounds (the band follows the OPT marginals, so it has the same steps)
+    x_opt, y_opt = _lod_steps(marginals_sorted, LOD_BINS)
+    plt.fill_between(x_opt,y_opt+indloss,y_opt-indloss,color='k', alpha = 0.15,step='post')
+
+    # specify main plot, each series reduced to its envelope at LOD_BINS bins
+    ax1.plot(x_opt,y_opt,'k',alpha=0.5,linewidth=1,drawstyle='steps-post')
+    ax1.plot(*_lod_steps(marginals_ILP_rounded_sorted, LOD_BINS),'cornflowerblue',linestyle='--',linewidth=1,alpha=0.5,drawstyle='steps-post')
+    ax1.plot(*_lod_steps(marginals_RAND_rounded_sorted, LOD_BINS),'g:',linewidth=1,alpha=0.5,drawstyle='steps-post')
+    ax1.plot(*_lod_steps(marginals_BF_rounded_sorted, LOD_BINS, marginals_RAND_rounded_sorted[-1]),'orange',linestyle='-.',linewidth=1,alpha=0.5,drawstyle='steps-post')
+
+    ax1.set_xlim(0,n+0.5)
+    ax1.set_xticks([])
+    ax1.set_ylabel('marginal probability')
+    ax1.set_xlabel('agents sorted by marginal given by OPT')
+    ax1.set_ylim([-0.01,1.01])
+
+    # legend
+    custom_lines = [Line2D([0], [0], color='black', lw=1),
+                    Line2D([0], [0], color='cornflowerblue', lw=1, linestyle = '--'),
+                    Line2D([0], [0], color='green', lw=1, linestyle= ':'),
+                    Line2D([0], [0], color='orange', lw=1, linestyle='-.')]
+    ax1.legend(custom_lines,['$p^*$','IP-Marginals','Pipage','Beck-Fiala'],loc='upper left',fontsize=8)
+
+    # specify inset plot
+    ax2 = plt.axes([0,0,1,1])
+    ip = InsetPosition(ax1, pfi[0:4])
+    ax2.set_axes_locator(ip)
+
+    # the inset only shows agents xmin to xmax, drawn at full resolution
+    xmin = 0
+    xmax = int(n*pfi[4])
+    window = slice(xmin, xmax+1)
+
+    ax2.plot(x[:-1][window],marginals_sorted[window] ,'k',linewidth=0.9,alpha=0.75,drawstyle='steps-post')
+    ax2.plot(x[:-1][window],marginals_ILP_rounded_sorted[window],'cornflowerblue',linestyle='--',linewidth=0.9,alpha=0.75,drawstyle='steps-post')
+    ax2.plot(x[:-1][window],marginals_RAND_rounded_sorted[window],'g:',linewidth=0.9,alpha=0.75,drawstyle='steps-post')
+    ax2.plot(x[:-1][window],marginals_BF_rounded_sorted[window],'orange',linestyle='-.',linewidth=0.9,alpha=0.75,drawstyle='steps-post')
+
+    # draw lines from box corners
+
+    ax1.plot([0,pfi[0]*n],[marginals_sorted[0],pfi[1]],'k--',linewidth=0.75)
+    ax1.plot([xmax,(pfi[0]+pfi[2])*n],[marginals_sorted[xmax],pfi[1]],'k--',linewidth=0.75)
+
+    ymin = min([min(marginals_sorted[xmin:xmax]),min(marginals_ILP_rounded_sorted[xmin:xmax]),min(marginals_RAND_rounded_sorted[xmin:xmax]), min(marginals_BF_rounded_sorted[xmin:xmax])])
+    ymax = max([max(marginals_sorted[xmin:xmax]),max(marginals_ILP_rounded_sorted[xmin:xmax]),max(marginals_RAND_rounded_sorted[xmin:xmax]), max(marginals_BF_rounded_sorted[xmin:xmax])])
+    ax2.set_xlim(xmin,xmax)
+    ax2.set_ylim(ymin*(0.99),ymax*(1.01))
+    ax2.set_xticks([])
+
+    # showing span of deviation
+    ax2.set_yticks([])
+
+    textx = (pfi[0]-0.045)*n
+    texty = pfi[3]/2 + pfi[1]
+    spanlabel = str(int((ymax*1.01 - ymin*0.99)*1000))+'/m'
+    ax1.text(textx,texty,spanlabel,ha = 'center',va='center',fontsize=8)
+    ax1.plot([(pfi[0]-0.02)*n,(pfi[0]-0.01)*n],[pfi[1],pfi[1]],'k',linewidth=0.75)
+    ax1.plot([(pfi[0]-0.02)*n,(pfi[0]-0.01)*n],[pfi[1]+pfi[3],pfi[1]+pfi[3]],'k',linewidth=0.75)
+    ax1.arrow((pfi[0]-0.015)*n,(pfi[3]/2 + pfi[1]),0,pfi[3]/2-0.03,width=0.001/pfi[4],head_width=0.15/pfi[4],head_length=0.007)
+    ax1.arrow((pfi[0]-0.015)*n,(pfi[3]/2 + pfi[1]),0,-(pfi[3]/2-0.03),width=0.001/pfi[4],head_width=0.15/pfi[4],head_length=0.007)
+
+    plt.savefig(figure_path,bbox_inches='tight')
+
+
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # MAIN # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+
+if __name__ == '__main__':
+
+    ######### Build Data ###########
+    figures = []  # (render function, figure path, plot tables, extra arguments)
+    if MAXIMIN == 1 or NASH == 1:
+        objective, metric = ('maximin', 'maximin') if MAXIMIN == 1 else ('nash', 'nash_welfare')
+        tables = [prepare_plot_data(instance, objective, metric) for instance in instances]
+        if RANDOMIZED==1:
+            print("maximum standard deviation (over randomized rounding replicates) in objective across instances: "
+                  + str(max(float(_load_table(path)['rand_std']) for path in tables)))
+        figures.append((render_comparison, '../m'+str(M)+objective+'_algos_comparison.pdf', tables, instances,
+                        objective))
+
+    if LEXIMIN == 1:
+        for instance in instances:
+            table = prepare_plot_data(instance, 'leximin')
+            # reports maximum standard deviation, since it's so small that it's not being plotted
+            print("in instance "+instance+", maximum standard deviation (over replicates of randomized rounding runs) of any marginal is:" + str(float(_load_table(table)['rand_std'])))
+            figures.append((render_leximin, '../m'+str(M)+'_'+instance+'_leximin_marginals_comparison.pdf', [table],
+                            pf[instance]))
+
+    ###### Build plots ##########
+    with multiprocessing.Pool(PLOT_WORKERS) as pool:
+        rendered = pool.starmap(render_if_changed, figures)
+    print(f"Rendered {sum(rendered)} of {len(figures)} figures ({len(figures) - sum(rendered)} were up to date).")